@@ -0,0 +1,108 @@
+"""
+Benchmark: OCR image preparation before and after the preprocessing stage.
+
+Renders a synthetic 12 MP "phone photo" of a lab submission (slightly rotated,
+unevenly lit, noisy, saved as JPEG) and compares:
+  - legacy:    full decode + convert("RGB") + full LANCZOS resample to 1600px
+  - gemini:    reduced JPEG decode (draft) + EXIF orientation + reducing resize
+  - tesseract: reduced grayscale decode + binarize + deskew at tesseract's resolution
+
+Accuracy is measured against the rendered text when the tesseract binary is installed.
+
+Run from the repository root:
+    python benchmarks/bench_image_preprocessing.py
+"""
+import difflib
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import code_checker
+from PIL import Image, ImageDraw, ImageFont
+
+PHOTO_SIZE = (4032, 3024)
+SKEW_DEGREES = 2.5
+SUBMISSION_LINES = [
+    "Aim: Write a program to find the sum of a list of numbers.",
+    "Algorithm:",
+    "1. Start  2. Read the list  3. Add each value  4. Print the total  5. Stop",
+    "Program:",
+    "def sum_values(values):",
+    "    total = 0",
+    "    for value in values:",
+    "        total = total + value",
+    "    return total",
+    "print(sum_values([1, 2, 3, 4, 5]))",
+    "Output: 15",
+    "Result: The program was executed successfully.",
+]
+
+def make_photo(path):
+    """Dark text on paper, rotated a little, with a lighting gradient and sensor noise."""
+    page = Image.new("L", PHOTO_SIZE, 235)
+    draw = ImageDraw.Draw(page)
+    font = ImageFont.load_default(size=90)
+    for i, line in enumerate(SUBMISSION_LINES):
+        draw.text((250, 200 + i * 210), line, fill=30, font=font)
+    page = page.rotate(SKEW_DEGREES, resample=Image.BICUBIC, fillcolor=235)
+
+    lighting = Image.linear_gradient("L").resize(PHOTO_SIZE).point(lambda value: value // 3)
+    page = Image.blend(page, lighting, 0.25)
+    noise = Image.effect_noise(PHOTO_SIZE, 12)
+    page = Image.blend(page, noise, 0.08)
+    page.convert("RGB").save(path, "JPEG", quality=90)
+
+def legacy_prepare(path):
+    pil_img = Image.open(path).convert("RGB")
+    w, h = pil_img.size
+    scale = code_checker.OCR_MAX_SIDE / max(w, h)
+    return pil_img.resize((int(w * scale), int(h * scale)), Image.LANCZOS)
+
+def tesseract_available():
+    if not code_checker.OCR_AVAILABLE:
+        return False
+    try:
+        code_checker.pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+def accuracy(pil_img):
+    text = code_checker.pytesseract.image_to_string(pil_img)
+    expected = "\n".join(SUBMISSION_LINES)
+    return difflib.SequenceMatcher(None, " ".join(expected.split()), " ".join(text.split())).ratio()
+
+def main():
+    with tempfile.TemporaryDirectory() as workdir:
+        path = Path(workdir) / "photo.jpg"
+        make_photo(path)
+        print(f"Synthetic photo: {PHOTO_SIZE[0]}x{PHOTO_SIZE[1]} JPEG, {path.stat().st_size / 1e6:.1f} MB, "
+              f"skewed {SKEW_DEGREES} degrees")
+        print()
+
+        candidates = {
+            "legacy": lambda: legacy_prepare(path),
+            "gemini": lambda: code_checker.load_image_for_backend(path, "gemini"),
+            "tesseract": lambda: code_checker.load_image_for_backend(path, "tesseract"),
+        }
+        measure_accuracy = tesseract_available()
+        print(f"{'path':>10} {'output size':>12} {'mode':>5} {'ms':>9} {'ocr accuracy':>13}")
+        for name, prepare in candidates.items():
+            runs = 5
+            seconds = timeit.timeit(prepare, number=runs) / runs
+            pil_img = prepare()
+            score = f"{accuracy(pil_img) * 100:.1f}%" if measure_accuracy else "n/a"
+            size = f"{pil_img.size[0]}x{pil_img.size[1]}"
+            print(f"{name:>10} {size:>12} {pil_img.mode:>5} {seconds * 1000:>9.1f} {score:>13}")
+
+        gray = code_checker.binarize_image(Image.open(path).convert("L"))
+        print()
+        print(f"Estimated skew correction: {code_checker.estimate_skew_angle(gray):+.1f} degrees "
+              f"(expected {-SKEW_DEGREES:+.1f})")
+        if not measure_accuracy:
+            print("tesseract is not installed; OCR accuracy was not measured.")
+
+if __name__ == "__main__":
+    main()
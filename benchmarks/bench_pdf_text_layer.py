@@ -0,0 +1,103 @@
+"""
+Benchmark: reading a typed PDF from its text layer vs. rasterizing and OCR'ing it.
+
+Builds a multi-page PDF of Courier program listings (like an export from an IDE
+or word processor) and times:
+  - text layer: pypdf layout extraction of every page
+  - ocr:        pdf2image rendering + tesseract (only when poppler and tesseract are installed)
+
+Accuracy is the similarity of each path's text to the listing that was written.
+
+Run from the repository root:
+    python benchmarks/bench_pdf_text_layer.py
+"""
+import difflib
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import code_checker
+
+PAGES = 10
+LISTING = [
+    "def sum_values(values):",
+    "    total = 0",
+    "    for value in values:",
+    "        if value % 2 == 0:",
+    "            total = total + value",
+    "    return total",
+    "",
+    "print(sum_values([1, 2, 3, 4, 5]))",
+]
+
+def pdf_string(text):
+    return "(" + text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+
+def make_pdf(path, pages):
+    """A minimal PDF with one Courier listing per page, written by hand."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Courier >>"]
+    kids = []
+    for _ in range(pages):
+        lines = " ".join(f"{pdf_string(line)} Tj T*" for line in LISTING)
+        content = f"BT /F1 12 Tf 14 TL 72 720 Td {lines} ET"
+        objects.append(f"<< /Length {len(content)} >>\nstream\n{content}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Contents {len(objects)} 0 R /Resources << /Font << /F1 3 0 R >> >> >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>"
+
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += f"{number} 0 obj\n{body}\nendobj\n".encode()
+    xref = len(data)
+    data += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    data += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    data += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    Path(path).write_bytes(data)
+
+def ocr_available():
+    if not code_checker.OCR_AVAILABLE:
+        return False
+    try:
+        code_checker.pytesseract.get_tesseract_version()
+    except Exception:
+        return False
+    return shutil.which("pdftoppm") is not None
+
+def accuracy(text):
+    expected = "\n\n".join(["\n".join(LISTING)] * PAGES)
+    return difflib.SequenceMatcher(None, expected, text).ratio()
+
+def main():
+    if not code_checker.PDF_TEXT_AVAILABLE:
+        print("pypdf is not installed; nothing to compare.")
+        return
+    code_checker.OCR_CACHE_ENABLED = False
+    with tempfile.TemporaryDirectory() as workdir:
+        path = Path(workdir) / "listing.pdf"
+        make_pdf(path, PAGES)
+        print(f"Typed PDF: {PAGES} pages, {path.stat().st_size / 1e3:.1f} kB")
+        print()
+        print(f"{'path':>11} {'seconds':>9} {'per page ms':>12} {'accuracy':>9}")
+
+        start = time.perf_counter()
+        text, _ = code_checker.pdf_text_backend(path)
+        seconds = time.perf_counter() - start
+        print(f"{'text layer':>11} {seconds:>9.3f} {seconds / PAGES * 1000:>12.1f} {accuracy(text) * 100:>8.1f}%")
+
+        if ocr_available():
+            start = time.perf_counter()
+            text, _ = code_checker.tesseract_backend(path)
+            seconds = time.perf_counter() - start
+            print(f"{'ocr':>11} {seconds:>9.3f} {seconds / PAGES * 1000:>12.1f} {accuracy(text) * 100:>8.1f}%")
+        else:
+            print("poppler or tesseract is not installed; the OCR path was not measured.")
+
+if __name__ == "__main__":
+    main()
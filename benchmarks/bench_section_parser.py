@@ -0,0 +1,71 @@
+"""
+Micro-benchmark: single-pass section parser vs. the previous per-section regex scans.
+
+Run from the repository root:
+    python benchmarks/bench_section_parser.py
+"""
+import re
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import code_checker
+
+# Patterns previously built inside parse_submission_sections on every call, verbatim
+LEGACY_PATTERNS = {
+    "aim": r"(?:^|\n)(?:AIM|Aim|aim|OBJECTIVE|Objective)(?::|\.|\s*\n)(.?)(?=(?:\n\s(?:ALGORITHM|Algorithm|algorithm|PROCEDURE|Procedure|PROGRAM|Program|program|OUTPUT|Output|output|RESULT|Result|result)(?::|\.|\s*\n))|$)",
+    "algorithm": r"(?:^|\n)(?:ALGORITHM|Algorithm|algorithm|PROCEDURE|Procedure)(?::|\.|\s*\n)(.?)(?=(?:\n\s(?:PROGRAM|Program|program|OUTPUT|Output|output|RESULT|Result|result)(?::|\.|\s*\n))|$)",
+    "program": r"(?:^|\n)(?:PROGRAM|Program|program|CODE|Code|code|SOURCE CODE|Source Code)(?::|\.|\s*\n)(.?)(?=(?:\n\s(?:OUTPUT|Output|output|RESULT|Result|result)(?::|\.|\s*\n))|$)",
+    "output": r"(?:^|\n)(?:OUTPUT|Output|output|EXECUTION|Execution|execution)(?::|\.|\s*\n)(.?)(?=(?:\n\s(?:RESULT|Result|result|CONCLUSION|Conclusion|conclusion)(?::|\.|\s*\n))|$)",
+    "result": r"(?:^|\n)(?:RESULT|Result|result|CONCLUSION|Conclusion|conclusion)(?::|\.|\s*\n)(.*?)(?=$)"
+}
+
+# The same patterns with the lazy '.*?' bodies and '\s*' gaps they were written to have
+INTENDED_PATTERNS = {
+    section: pattern.replace("(.?)", "(.*?)").replace(r"\n\s(", r"\n\s*(")
+    for section, pattern in LEGACY_PATTERNS.items()
+}
+
+def legacy_parse(text_content, patterns):
+    sections = {section: "" for section in code_checker.SECTION_ORDER}
+    for section, pattern in patterns.items():
+        matches = re.search(pattern, text_content, re.DOTALL | re.IGNORECASE)
+        if matches:
+            sections[section] = matches.group(1).strip()
+    return sections
+
+def single_pass_parse(text_content):
+    sections = {section: "" for section in code_checker.SECTION_ORDER}
+    for section, (body_start, body_end) in code_checker.locate_sections(text_content).items():
+        sections[section] = text_content[body_start:body_end].strip()
+    return sections
+
+def make_submission(program_lines):
+    program = "\n".join(f"    total = total + values[{i}]  # running sum" for i in range(program_lines))
+    return (
+        "Aim:\nWrite a program to sum a list of numbers.\n\n"
+        "Algorithm:\n1. Start\n2. Read the list\n3. Add each value\n4. Print the total\n5. Stop\n\n"
+        f"Program:\ndef sum_values(values):\n    total = 0\n{program}\n    return total\n\n"
+        "Output:\n15\n\n"
+        "Result:\nThe program was executed successfully.\n"
+    )
+
+def main():
+    sample = make_submission(5)
+    intended = legacy_parse(sample, INTENDED_PATTERNS)
+    single_pass = single_pass_parse(sample)
+    print("Matches intended legacy regex on well-formed input:", intended == single_pass)
+    print()
+    print(f"{'program lines':>14} {'chars':>9} {'legacy ms':>10} {'intended ms':>12} {'single-pass ms':>15}")
+
+    for program_lines in (10, 100, 1000, 5000):
+        text = make_submission(program_lines)
+        runs = max(1, 2000 // program_lines)
+        legacy = timeit.timeit(lambda: legacy_parse(text, LEGACY_PATTERNS), number=runs) / runs
+        lazy = timeit.timeit(lambda: legacy_parse(text, INTENDED_PATTERNS), number=runs) / runs
+        fast = timeit.timeit(lambda: single_pass_parse(text), number=runs) / runs
+        print(f"{program_lines:>14} {len(text):>9} {legacy * 1000:>10.3f} {lazy * 1000:>12.3f} {fast * 1000:>15.3f}")
+
+if __name__ == "__main__":
+    main()
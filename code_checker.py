@@ -1,6 +1,34 @@
 import os
 import re
 import sys
+import csv
+import json
+import asyncio
+import argparse
+import threading
+import hashlib
+import subprocess
+import signal
+import multiprocessing
+import tempfile
+import time
+import math
+import sqlite3
+import ast
+import difflib
+import io
+import tokenize
+import keyword
+import builtins
+import random
+import heapq
+import contextlib
+import textwrap
+import contextvars
+import functools
+import http.server
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait
+from collections import Counter
 from pathlib import Path
 import tkinter as tk
 from tkinter import filedialog
@@ -8,13 +36,14 @@ from tkinter import filedialog
 # Try to import required packages
 try:
     from google import genai
+    from google.genai import types as genai_types
     GENAI_AVAILABLE = True
 except ImportError:
     GENAI_AVAILABLE = False
     print("Warning: Google Generative AI package not installed. Some features will be limited.")
 
 try:
-    from PIL import Image
+    from PIL import Image, ImageOps
     PIL_AVAILABLE = True
 except ImportError:
     PIL_AVAILABLE = False
@@ -45,1010 +74,4727 @@ except ImportError:
         print("- Mac: brew install tesseract")
         print("- Linux: apt-get install tesseract-ocr")
 
+try:
+    import pypdf
+    PDF_TEXT_AVAILABLE = True
+except ImportError:
+    PDF_TEXT_AVAILABLE = False
+    print("Warning: pypdf not installed. Typed PDFs will be OCR'd instead of read directly.")
+    print("Install with: pip install pypdf")
+
 # =========================
 # CONFIG: PASTE YOUR API KEY HERE
 # =========================
 API_KEY = "my_api_key"  # <-- Replace with your Gemini API key
+GEMINI_MODEL = "gemini-2.0-flash-exp"  # <-- Model used for OCR and evaluation
+CACHE_DIR = Path(".code_checker_cache")  # <-- Local folder for OCR and model response caches
 
 # =========================
-# IMAGE OCR FUNCTIONS
+# PIPELINE METRICS
 # =========================
-def maybe_resize_image(pil_img, max_side=1600):
-    """Resize image if too large."""
-    w, h = pil_img.size
-    if max(w, h) <= max_side:
-        return pil_img
-    scale = max_side / max(w, h)
-    new_size = (int(w * scale), int(h * scale))
-    return pil_img.resize(new_size, Image.LANCZOS)
+# Each pipeline stage records wall time plus whatever it processed (bytes, pages,
+# tokens). Totals are kept in memory for the end-of-run table and the optional
+# Prometheus endpoint; with METRICS_FILE set, every stage run is also appended as a JSON line.
+METRICS_FILE = None
+METRICS_PREFIX = "code_checker"
+STAGE_METRICS = {}
+CURRENT_SUBMISSION = contextvars.ContextVar("current_submission", default=None)
+_metrics_lock = threading.Lock()
+_metrics_file_handle = None
 
-def extract_text_from_image(image_path):
-    """Extract text from image using Gemini OCR or pytesseract."""
-    if not Path(image_path).exists():
-        print(f"Error: File not found: {image_path}")
-        return None
-    
-    file_ext = Path(image_path).suffix.lower()
-    
-    try:
-        # Handle PDF files
-        if file_ext == '.pdf':
-            if not OCR_AVAILABLE:
-                print("Error: pdf2image and pytesseract are required for PDF processing.")
-                return None
-            
-            print("Converting PDF to images...")
-            pages = pdf2image.convert_from_path(image_path)
-            text_content = ""
-            
-            for i, page in enumerate(pages):
-                print(f"Processing page {i+1}/{len(pages)}...")
-                text_content += pytesseract.image_to_string(page) + "\n\n"
-            
-            return text_content.strip()
-        
-        # Handle image files
-        pil_img = Image.open(image_path).convert("RGB")
-        pil_img = maybe_resize_image(pil_img)
-        
-        # Try Gemini first (better quality)
-        if PIL_AVAILABLE and GENAI_AVAILABLE:
-            try:
-                client = genai.Client(api_key=API_KEY)
-                response = client.models.generate_content(
-                    model="gemini-2.0-flash-exp",
-                    contents=[
-                        "Extract all text from this image. Preserve the structure, sections, and formatting. If there are sections like 'Aim', 'Algorithm', 'Program', 'Output', and 'Result', make sure to clearly identify them.",
-                        pil_img,
-                    ],
-                )
-                
-                return response.text.strip() if hasattr(response, "text") else str(response)
-            except Exception as e:
-                print(f"Gemini OCR failed: {e}. Falling back to pytesseract...")
+def record_stage(stage, seconds, fields, error=None):
+    """Add one stage run to the totals and the JSON lines file."""
+    global _metrics_file_handle
+    with _metrics_lock:
+        totals = STAGE_METRICS.setdefault(stage, {"calls": 0, "errors": 0, "seconds": 0.0, "max_seconds": 0.0})
+        totals["calls"] += 1
+        totals["seconds"] += seconds
+        totals["max_seconds"] = max(totals["max_seconds"], seconds)
+        if error is not None:
+            totals["errors"] += 1
+        for name, value in fields.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                totals[name] = totals.get(name, 0) + value
         
-        # Fallback to pytesseract
-        if OCR_AVAILABLE:
-            return pytesseract.image_to_string(pil_img)
-        else:
-            print("Error: No OCR method available. Install pytesseract or enable Gemini API.")
-            return None
-            
-    except Exception as e:
-        print(f"Error extracting text from file: {e}")
-        return None
+        if METRICS_FILE:
+            if _metrics_file_handle is None:
+                _metrics_file_handle = open(METRICS_FILE, 'a', encoding='utf-8')
+            event = {"time": round(time.time(), 3), "stage": stage, "seconds": round(seconds, 6),
+                     "submission": CURRENT_SUBMISSION.get()}
+            event.update(fields)
+            if error is not None:
+                event["error"] = error
+            _metrics_file_handle.write(json.dumps(event, default=str) + "\n")
+            _metrics_file_handle.flush()
 
-# =========================
-# FILE UPLOAD FUNCTION
-# =========================
-def select_image_file():
-    """Open file dialog to select an image file or PDF."""
-    root = tk.Tk()
-    root.withdraw()  # Hide the main window
-    root.attributes('-topmost', True)  # Bring dialog to front
+@contextlib.contextmanager
+def measure_stage(stage, **fields):
+    """
+    Time the enclosed block as one run of stage. The yielded dict can be filled
+    with counts (bytes, pages, tokens, ...) while the block runs.
+    """
+    started = time.perf_counter()
+    try:
+        yield fields
+    except BaseException as e:
+        record_stage(stage, time.perf_counter() - started, fields, error=type(e).__name__)
+        raise
+    record_stage(stage, time.perf_counter() - started, fields)
+
+def timed_stage(stage, fields_from_result=None):
+    """Decorator form of measure_stage; fields_from_result maps the return value to counts."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with measure_stage(stage) as fields:
+                result = function(*args, **kwargs)
+                if fields_from_result is not None and result is not None:
+                    fields.update(fields_from_result(result))
+                return result
+        return wrapper
+    return decorator
+
+@contextlib.contextmanager
+def submission_metrics(student_id):
+    """Attribute every stage run inside the block to one submission and time the whole of it."""
+    token = CURRENT_SUBMISSION.set(student_id)
+    try:
+        with measure_stage("submission"):
+            yield
+    finally:
+        CURRENT_SUBMISSION.reset(token)
+
+def close_metrics_file():
+    global _metrics_file_handle
+    with _metrics_lock:
+        if _metrics_file_handle is not None:
+            _metrics_file_handle.close()
+            _metrics_file_handle = None
+
+def print_stage_metrics():
+    """Print per-stage totals, slowest first, to show where a run spent its time."""
+    if not STAGE_METRICS:
+        return
+    print("Stage timing:")
+    with _metrics_lock:
+        stages = sorted(STAGE_METRICS.items(), key=lambda item: -item[1]["seconds"])
+    for stage, totals in stages:
+        extras = "  ".join(
+            f"{name}={value:g}" for name, value in sorted(totals.items())
+            if name not in ("calls", "errors", "seconds", "max_seconds")
+        )
+        print(f"  {stage:<14} {totals['seconds']:9.3f} s total  {totals['seconds'] / totals['calls'] * 1000:9.1f} ms avg  "
+              f"{totals['calls']:6d} runs  {totals['errors']:4d} errors  {extras}")
+
+def prometheus_metrics_text():
+    """Render stage totals, cache hit counts and scheduler counters in the Prometheus text format."""
+    lines = []
+    def counter(name, help_text, samples):
+        lines.append(f"# HELP {METRICS_PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {METRICS_PREFIX}_{name} counter")
+        for labels, value in samples:
+            label_text = ",".join(f'{key}="{label}"' for key, label in labels.items())
+            label_text = f"{{{label_text}}}" if label_text else ""
+            lines.append(f"{METRICS_PREFIX}_{name}{label_text} {value}")
     
-    file_path = filedialog.askopenfilename(
-        title="Select Image File or PDF with Student Submission",
-        filetypes=[
-            ("All supported files", "*.jpg *.jpeg *.png *.pdf"),
-            ("Image files", "*.jpg *.jpeg *.png"),
-            ("PDF files", "*.pdf"),
-            ("All files", ".")
-        ]
-    )
+    with _metrics_lock:
+        stages = {stage: dict(totals) for stage, totals in STAGE_METRICS.items()}
+    counter("stage_runs_total", "Completed runs of each pipeline stage.",
+            [({"stage": stage}, totals["calls"]) for stage, totals in stages.items()])
+    counter("stage_errors_total", "Runs of each pipeline stage that raised.",
+            [({"stage": stage}, totals["errors"]) for stage, totals in stages.items()])
+    counter("stage_seconds_total", "Wall time spent in each pipeline stage.",
+            [({"stage": stage}, round(totals["seconds"], 6)) for stage, totals in stages.items()])
+    fields = sorted({name for totals in stages.values() for name in totals} - {"calls", "errors", "seconds", "max_seconds"})
+    for name in fields:
+        counter(f"stage_{name}_total", f"Total {name} processed by each pipeline stage.",
+                [({"stage": stage}, totals[name]) for stage, totals in stages.items() if name in totals])
+    counter("cache_requests_total", "Cache lookups by cache and outcome.", [
+        ({"cache": "ocr", "outcome": "hit"}, OCR_CACHE_STATS["hits"]),
+        ({"cache": "ocr", "outcome": "miss"}, OCR_CACHE_STATS["misses"]),
+        ({"cache": "llm", "outcome": "hit"}, LLM_CACHE_STATS["hits"]),
+        ({"cache": "llm", "outcome": "miss"}, LLM_CACHE_STATS["misses"]),
+    ])
+    counter("scheduler_events_total", "Gemini scheduler events.",
+            [({"event": event}, value) for event, value in SCHEDULER_STATS.items() if event != "waited_seconds"])
+    counter("scheduler_wait_seconds_total", "Time Gemini calls spent waiting for quota.",
+            [({}, round(SCHEDULER_STATS["waited_seconds"], 6))])
+    return "\n".join(lines) + "\n"
+
+class MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = prometheus_metrics_text().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
     
-    root.destroy()
-    return file_path
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """Serve /metrics from a daemon thread for the rest of the run."""
+    server = http.server.ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Serving metrics at http://{host}:{server.server_address[1]}/metrics")
+    return server
 
 # =========================
-# SUBMISSION PARSING FUNCTIONS
+# SHARED GEMINI CLIENT
 # =========================
-def parse_submission_sections(text_content):
+_genai_client = None
+_genai_client_lock = threading.Lock()
+GENAI_CLIENT_STATS = {"opened": 0, "reused": 0}
+
+def get_genai_client():
     """
-    Parse the extracted text into Aim, Algorithm, Program, Output and Result sections.
+    Return the process-wide Gemini client, creating it on first use.
+    The client keeps its HTTP connection pool, so reusing it across calls and
+    submissions avoids repeating client setup and TLS handshakes.
     """
-    sections = {
-        "aim": "",
-        "algorithm": "",
-        "program": "",
-        "output": "",
-        "result": ""
-    }
-    
-    # Try to find sections using regex patterns
-    patterns = {
-        "aim": r"(?:^|\n)(?:AIM|Aim|aim|OBJECTIVE|Objective)(?::|\.|\s*\n)(.?)(?=(?:\n\s(?:ALGORITHM|Algorithm|algorithm|PROCEDURE|Procedure|PROGRAM|Program|program|OUTPUT|Output|output|RESULT|Result|result)(?::|\.|\s*\n))|$)",
-        "algorithm": r"(?:^|\n)(?:ALGORITHM|Algorithm|algorithm|PROCEDURE|Procedure)(?::|\.|\s*\n)(.?)(?=(?:\n\s(?:PROGRAM|Program|program|OUTPUT|Output|output|RESULT|Result|result)(?::|\.|\s*\n))|$)",
-        "program": r"(?:^|\n)(?:PROGRAM|Program|program|CODE|Code|code|SOURCE CODE|Source Code)(?::|\.|\s*\n)(.?)(?=(?:\n\s(?:OUTPUT|Output|output|RESULT|Result|result)(?::|\.|\s*\n))|$)",
-        "output": r"(?:^|\n)(?:OUTPUT|Output|output|EXECUTION|Execution|execution)(?::|\.|\s*\n)(.?)(?=(?:\n\s(?:RESULT|Result|result|CONCLUSION|Conclusion|conclusion)(?::|\.|\s*\n))|$)",
-        "result": r"(?:^|\n)(?:RESULT|Result|result|CONCLUSION|Conclusion|conclusion)(?::|\.|\s*\n)(.*?)(?=$)"
-    }
-    
-    for section, pattern in patterns.items():
-        matches = re.search(pattern, text_content, re.DOTALL | re.IGNORECASE)
-        if matches:
-            sections[section] = matches.group(1).strip()
-    
-    # If sections weren't found with regex, try to use Gemini to extract them
-    if GENAI_AVAILABLE and (not sections["aim"] or not sections["algorithm"] or not sections["program"]):
-        try:
-            client = genai.Client(api_key=API_KEY)
-            prompt = f"""
-            Extract the following sections from this student submission:
-            - Aim/Objective
-            - Algorithm/Procedure
-            - Program/Code
-            - Output/Execution
-            - Result/Conclusion
-            
-            Format your response as:
-            
-            AIM:
-            [extracted aim]
-            
-            ALGORITHM:
-            [extracted algorithm]
-            
-            PROGRAM:
-            [extracted program]
-            
-            OUTPUT:
-            [extracted output]
-            
-            RESULT:
-            [extracted result]
-            
-            Here is the submission text:
-            {text_content}
-            """
-            
-            response = client.models.generate_content(
-                model="gemini-2.0-flash-exp", contents=prompt
-            )
-            
-            if hasattr(response, 'text'):
-                # Parse the response to extract sections
-                ai_sections = response.text
-                for section in sections.keys():
-                    section_pattern = rf"{section.upper()}:\s*\n(.*?)(?=\n\w+:|$)"
-                    section_match = re.search(section_pattern, ai_sections, re.DOTALL | re.IGNORECASE)
-                    if section_match and not sections[section]:
-                        sections[section] = section_match.group(1).strip()
-        except Exception as e:
-            print(f"Error using Gemini to parse sections: {e}")
-    
-    return sections
+    global _genai_client
+    with _genai_client_lock:
+        if _genai_client is None:
+            _genai_client = genai.Client(api_key=API_KEY)
+            GENAI_CLIENT_STATS["opened"] += 1
+        else:
+            GENAI_CLIENT_STATS["reused"] += 1
+        return _genai_client
+
+def close_genai_client():
+    """Close the shared client's connection pool; the next call opens a new one."""
+    global _genai_client
+    with _genai_client_lock:
+        if _genai_client is not None:
+            try:
+                _genai_client.close()
+            except Exception:
+                pass
+            _genai_client = None
+
+def print_genai_client_stats():
+    opened = GENAI_CLIENT_STATS["opened"]
+    reused = GENAI_CLIENT_STATS["reused"]
+    if opened or reused:
+        print(f"Gemini client: {opened} opened, {reused} reused")
 
 # =========================
-# STEP 1: CODE INPUT (TEXT OR IMAGE)
+# GEMINI REQUEST SCHEDULER
 # =========================
-def get_code_from_user():
+# Every Gemini call goes through one scheduler: token buckets keep requests and
+# tokens per minute under quota, rate-limit and transient errors are retried with
+# jittered exponential backoff, and a circuit breaker stops hammering an API that
+# is down. Waiting callers are served by priority, then arrival order.
+GEMINI_REQUESTS_PER_MINUTE = 10
+GEMINI_TOKENS_PER_MINUTE = 1000000
+GEMINI_MAX_RETRIES = 6
+GEMINI_BACKOFF_BASE_SECONDS = 1.0
+GEMINI_BACKOFF_MAX_SECONDS = 60.0
+# Expected response size, added to the prompt estimate before a call is allowed
+GEMINI_RESPONSE_TOKEN_ESTIMATE = 1000
+GEMINI_IMAGE_TOKEN_ESTIMATE = 1300
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_COOLDOWN_SECONDS = 60.0
+# Lower runs first: finish submissions already being evaluated before starting new OCR
+PRIORITY_PROBLEM = 0
+PRIORITY_EVALUATION = 1
+PRIORITY_OCR = 2
+# With fallback off, an unreachable API fails the submission instead of
+# substituting offline default scores
+OFFLINE_FALLBACK_ENABLED = True
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+RETRY_DELAY_RE = re.compile(r"retry[_ ]?delay\W+(\d+(?:\.\d+)?)s", re.IGNORECASE)
+
+class GeminiUnavailableError(Exception):
+    """Raised when a Gemini call cannot be completed after retries or while the circuit is open."""
+
+_scheduler_condition = threading.Condition()
+SCHEDULER_STATE = {
+    "requests": float(GEMINI_REQUESTS_PER_MINUTE),
+    "tokens": float(GEMINI_TOKENS_PER_MINUTE),
+    "updated": time.monotonic(),
+    "queue": [],
+    "sequence": 0,
+    "failures": 0,
+    "open_until": 0.0,
+}
+SCHEDULER_STATS = {"calls": 0, "retries": 0, "rate_limited": 0, "waited_seconds": 0.0, "circuit_opened": 0}
+
+def estimate_tokens(contents):
+    """Rough token count for a prompt: about four characters per token, fixed cost per image."""
+    if isinstance(contents, str):
+        contents = [contents]
+    tokens = GEMINI_RESPONSE_TOKEN_ESTIMATE
+    for part in contents:
+        tokens += len(part) // 4 if isinstance(part, str) else GEMINI_IMAGE_TOKEN_ESTIMATE
+    return tokens
+
+def refill_buckets(now):
+    elapsed = now - SCHEDULER_STATE["updated"]
+    SCHEDULER_STATE["updated"] = now
+    SCHEDULER_STATE["requests"] = min(
+        GEMINI_REQUESTS_PER_MINUTE, SCHEDULER_STATE["requests"] + elapsed * GEMINI_REQUESTS_PER_MINUTE / 60
+    )
+    SCHEDULER_STATE["tokens"] = min(
+        GEMINI_TOKENS_PER_MINUTE, SCHEDULER_STATE["tokens"] + elapsed * GEMINI_TOKENS_PER_MINUTE / 60
+    )
+
+def enqueue_gemini_call(priority):
+    with _scheduler_condition:
+        SCHEDULER_STATE["sequence"] += 1
+        ticket = (priority, SCHEDULER_STATE["sequence"])
+        heapq.heappush(SCHEDULER_STATE["queue"], ticket)
+        return ticket
+
+def try_acquire_gemini_slot(ticket, tokens):
     """
-    Get code input from user - either typed/pasted or from an uploaded image file.
+    Take a request slot for ticket if it is first in line and the buckets allow it.
+    Returns 0 when granted, otherwise how long to wait before trying again.
+    Raises GeminiUnavailableError while the circuit breaker is open.
     """
-    print("\n" + "="*50)
-    print("CODE INPUT OPTIONS:")
-    print("1. Type/paste code directly")
-    print("2. Upload image file (JPG/PNG) - File dialog will open")
-    print("="*50)
-    
-    choice = input("Enter your choice (1 or 2): ").strip()
-    
-    if choice == "2":
-        # Image input with file dialog
-        if not PIL_AVAILABLE or not GENAI_AVAILABLE:
-            print("Error: Image input requires PIL and google-generativeai packages.")
-            print("Falling back to text input...")
-            choice = "1"
-        else:
-            print("\nOpening file dialog...")
-            print("(If dialog doesn't appear, check behind other windows)")
-            image_path = select_image_file()
-            
-            if image_path:
-                print(f"Selected file: {os.path.basename(image_path)}")
-                print("Extracting code from image...")
-                code = extract_text_from_image(image_path)
-                if code:
-                    print("\n=== Extracted Code ===")
-                    print(code)
-                    print("="*50)
-                    confirm = input("\nUse this extracted code? (y/n): ").strip().lower()
-                    if confirm == 'y':
-                        return code
-                    else:
-                        print("Falling back to text input...")
-                        choice = "1"
-                else:
-                    print("Failed to extract code from image. Falling back to text input...")
-                    choice = "1"
-            else:
-                print("No file selected. Falling back to text input...")
-                choice = "1"
-    
-    # Text input (default)
-    if choice == "1" or choice != "2":
-        print("\nEnter/paste your code below. Type 'END' in a new line when finished:")
-        lines = []
+    with _scheduler_condition:
+        now = time.monotonic()
+        if SCHEDULER_STATE["open_until"] > now:
+            remove_gemini_ticket(ticket)
+            raise GeminiUnavailableError(
+                f"Gemini API circuit open after {SCHEDULER_STATE['failures']} consecutive failures"
+            )
+        if SCHEDULER_STATE["queue"][0] != ticket:
+            return 0.05
+        refill_buckets(now)
+        # A single call larger than the whole budget only has to wait for a full bucket
+        tokens = min(tokens, GEMINI_TOKENS_PER_MINUTE)
+        if SCHEDULER_STATE["requests"] >= 1 and SCHEDULER_STATE["tokens"] >= tokens:
+            SCHEDULER_STATE["requests"] -= 1
+            SCHEDULER_STATE["tokens"] -= tokens
+            heapq.heappop(SCHEDULER_STATE["queue"])
+            SCHEDULER_STATS["calls"] += 1
+            _scheduler_condition.notify_all()
+            return 0
+        request_wait = (1 - SCHEDULER_STATE["requests"]) * 60 / GEMINI_REQUESTS_PER_MINUTE
+        token_wait = (tokens - SCHEDULER_STATE["tokens"]) * 60 / GEMINI_TOKENS_PER_MINUTE
+        return max(request_wait, token_wait, 0.01)
+
+def remove_gemini_ticket(ticket):
+    with _scheduler_condition:
+        if ticket in SCHEDULER_STATE["queue"]:
+            SCHEDULER_STATE["queue"].remove(ticket)
+            heapq.heapify(SCHEDULER_STATE["queue"])
+            _scheduler_condition.notify_all()
+
+def acquire_gemini_slot(tokens, priority):
+    """Block until this call may be sent."""
+    ticket = enqueue_gemini_call(priority)
+    started = time.monotonic()
+    try:
         while True:
-            line = input()
-            if line.strip().upper() == "END":
+            wait = try_acquire_gemini_slot(ticket, tokens)
+            if not wait:
                 break
-            lines.append(line)
-        return "\n".join(lines)
+            with _scheduler_condition:
+                _scheduler_condition.wait(wait)
+    except BaseException:
+        remove_gemini_ticket(ticket)
+        raise
+    SCHEDULER_STATS["waited_seconds"] += time.monotonic() - started
+
+async def acquire_gemini_slot_async(tokens, priority):
+    """Async version of acquire_gemini_slot; waits without blocking the event loop."""
+    ticket = enqueue_gemini_call(priority)
+    started = time.monotonic()
+    try:
+        while True:
+            wait = try_acquire_gemini_slot(ticket, tokens)
+            if not wait:
+                break
+            await asyncio.sleep(min(wait, 0.5))
+    except BaseException:
+        remove_gemini_ticket(ticket)
+        raise
+    SCHEDULER_STATS["waited_seconds"] += time.monotonic() - started
+
+def settle_token_usage(response, estimated):
+    """Charge the token bucket for the difference between estimated and reported usage."""
+    usage = getattr(response, "usage_metadata", None)
+    total = getattr(usage, "total_token_count", None)
+    if isinstance(total, int):
+        with _scheduler_condition:
+            SCHEDULER_STATE["tokens"] -= total - estimated
+
+def response_token_counts(response):
+    """Prompt and response token counts reported by Gemini, for the metrics."""
+    usage = getattr(response, "usage_metadata", None)
+    counts = {}
+    for field, name in (("prompt_token_count", "prompt_tokens"), ("candidates_token_count", "response_tokens")):
+        value = getattr(usage, field, None)
+        if isinstance(value, int):
+            counts[name] = value
+    return counts
+
+def error_status_code(error):
+    code = getattr(error, "code", None)
+    return code if isinstance(code, int) else None
+
+def is_retryable_error(error):
+    """Rate limits, server errors, timeouts and dropped connections are worth retrying."""
+    code = error_status_code(error)
+    if code is not None:
+        return code in RETRYABLE_STATUS_CODES
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    # httpx transport errors (timeouts, refused or reset connections) without importing httpx
+    return any(cls.__name__ in ("TransportError", "TimeoutException") for cls in type(error).__mro__)
+
+def record_gemini_success():
+    with _scheduler_condition:
+        SCHEDULER_STATE["failures"] = 0
+        SCHEDULER_STATE["open_until"] = 0.0
+
+def record_gemini_failure(error):
+    """
+    Update the breaker and buckets after a failed call. A 429 is not an outage:
+    it empties the request bucket so every caller slows down, but does not trip the breaker.
+    """
+    with _scheduler_condition:
+        if error_status_code(error) == 429:
+            SCHEDULER_STATS["rate_limited"] += 1
+            SCHEDULER_STATE["requests"] = min(SCHEDULER_STATE["requests"], 0.0)
+            return
+        SCHEDULER_STATE["failures"] += 1
+        if SCHEDULER_STATE["failures"] >= CIRCUIT_FAILURE_THRESHOLD:
+            if SCHEDULER_STATE["open_until"] <= time.monotonic():
+                SCHEDULER_STATS["circuit_opened"] += 1
+                print(f"Gemini API failing repeatedly; pausing calls for {CIRCUIT_COOLDOWN_SECONDS:.0f}s")
+            SCHEDULER_STATE["open_until"] = time.monotonic() + CIRCUIT_COOLDOWN_SECONDS
+
+def retry_delay(error, attempt):
+    """Server-suggested retry delay if the error carries one, else capped full-jitter backoff."""
+    match = RETRY_DELAY_RE.search(str(error))
+    if match:
+        return float(match.group(1)) + random.uniform(0, 1)
+    cap = min(GEMINI_BACKOFF_MAX_SECONDS, GEMINI_BACKOFF_BASE_SECONDS * 2 ** attempt)
+    return random.uniform(cap / 2, cap)
+
+def gemini_attempt_failed(e, attempt):
+    """
+    Account for a failed model call and return how long to wait before retrying.
+    Non-retryable errors are raised as-is; exhausted retries raise GeminiUnavailableError.
+    """
+    if not is_retryable_error(e):
+        raise e
+    record_gemini_failure(e)
+    if attempt == GEMINI_MAX_RETRIES:
+        raise GeminiUnavailableError(f"Gemini API call failed after {attempt + 1} attempts: {e}") from e
+    SCHEDULER_STATS["retries"] += 1
+    return retry_delay(e, attempt)
+
+def gemini_attempt_succeeded(response, tokens):
+    record_gemini_success()
+    settle_token_usage(response, tokens)
+    return response
+
+def call_gemini(request, contents, priority=PRIORITY_EVALUATION):
+    """
+    Run request() (one generate_content call for contents) under the scheduler.
+    Non-retryable errors are raised as-is; exhausted retries raise GeminiUnavailableError.
+    """
+    tokens = estimate_tokens(contents)
+    for attempt in range(GEMINI_MAX_RETRIES + 1):
+        acquire_gemini_slot(tokens, priority)
+        try:
+            with measure_stage("model_call", priority=str(priority), attempt=str(attempt + 1)) as fields:
+                response = request()
+                fields.update(response_token_counts(response))
+        except Exception as e:
+            time.sleep(gemini_attempt_failed(e, attempt))
+            continue
+        return gemini_attempt_succeeded(response, tokens)
+
+async def call_gemini_async(request, contents, priority=PRIORITY_EVALUATION):
+    """Async version of call_gemini; request() returns an awaitable."""
+    tokens = estimate_tokens(contents)
+    for attempt in range(GEMINI_MAX_RETRIES + 1):
+        await acquire_gemini_slot_async(tokens, priority)
+        try:
+            with measure_stage("model_call", priority=str(priority), attempt=str(attempt + 1)) as fields:
+                response = await request()
+                fields.update(response_token_counts(response))
+        except Exception as e:
+            await asyncio.sleep(gemini_attempt_failed(e, attempt))
+            continue
+        return gemini_attempt_succeeded(response, tokens)
+
+def print_scheduler_stats():
+    if SCHEDULER_STATS["calls"]:
+        print(
+            f"Gemini scheduler: {SCHEDULER_STATS['calls']} calls, {SCHEDULER_STATS['retries']} retries, "
+            f"{SCHEDULER_STATS['rate_limited']} rate-limited, {SCHEDULER_STATS['waited_seconds']:.1f}s waiting for quota, "
+            f"circuit opened {SCHEDULER_STATS['circuit_opened']} time(s)"
+        )
 
 # =========================
-# STEP 1b: MAX MARKS INPUT WITH VALIDATION
+# OCR RESULT CACHE
 # =========================
-def get_max_marks():
-    while True:
+OCR_CACHE_ENABLED = True
+OCR_CACHE_MAX_BYTES = 200 * 1024 * 1024
+# Eviction trims the cache to this fraction of the limit, so the folder is only
+# scanned again after that much new text has been written
+OCR_CACHE_LOW_WATER_MARK = 0.9
+_ocr_cache_lock = threading.Lock()
+_ocr_cache_bytes = None  # running size of the cache folder; None until it is first measured
+OCR_CACHE_STATS = {"hits": 0, "misses": 0}
+
+def ocr_cache_dir():
+    return CACHE_DIR / "ocr"
+
+def file_sha256(path):
+    """Hash a file's contents in chunks so large PDFs are never read into memory at once."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def ocr_cache_key(file_hash, backend, settings=""):
+    """Cache key for one file as read by one OCR backend with the given preprocessing settings."""
+    return hashlib.sha256(f"{file_hash}|{backend}|{settings}".encode('utf-8')).hexdigest()
+
+def ocr_cache_get(key):
+    """Return cached OCR text for key, or None. A hit refreshes the entry's LRU position."""
+    if not OCR_CACHE_ENABLED:
+        return None
+    path = ocr_cache_dir() / f"{key}.txt"
+    try:
+        text = path.read_text(encoding='utf-8')
+        os.utime(path)
+    except OSError:
+        OCR_CACHE_STATS["misses"] += 1
+        return None
+    OCR_CACHE_STATS["hits"] += 1
+    return text
+
+def ocr_cache_put(key, text):
+    """Store OCR text under key, then evict least recently used entries if the cache is over its size limit."""
+    if not OCR_CACHE_ENABLED or not text:
+        return
+    cache_dir = ocr_cache_dir()
+    path = cache_dir / f"{key}.txt"
+    data = text.encode('utf-8')
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
         try:
-            marks = float(input("\nEnter the maximum marks for this question: "))
-            if marks <= 0:
-                print("Marks must be positive!")
+            replaced = path.stat().st_size
+        except OSError:
+            replaced = 0
+        tmp_path = cache_dir / f"{key}.{threading.get_ident()}.tmp"
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+        note_ocr_cache_growth(len(data) - replaced)
+    except OSError as e:
+        print(f"Warning: could not write OCR cache entry: {e}")
+
+def note_ocr_cache_growth(delta):
+    """
+    Add delta to the running cache size and scan the folder only when it may be
+    over the limit (or has not been measured yet), instead of on every write.
+    """
+    global _ocr_cache_bytes
+    with _ocr_cache_lock:
+        if _ocr_cache_bytes is not None:
+            _ocr_cache_bytes += delta
+            if _ocr_cache_bytes <= OCR_CACHE_MAX_BYTES:
+                return
+    evict_ocr_cache(int(OCR_CACHE_MAX_BYTES * OCR_CACHE_LOW_WATER_MARK))
+
+def evict_ocr_cache(max_bytes=None):
+    """Delete least recently used cache entries until the cache fits in max_bytes."""
+    global _ocr_cache_bytes
+    max_bytes = OCR_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    with _ocr_cache_lock:
+        entries = []
+        total = 0
+        for path in ocr_cache_dir().glob("*.txt"):
+            try:
+                stat = path.stat()
+            except OSError:
                 continue
-            return marks
-        except ValueError:
-            print("Invalid input! Please enter a numeric value for marks.")
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        
+        entries.sort()
+        for _, size, path in entries:
+            if total <= max_bytes:
+                break
+            try:
+                path.unlink()
+                total -= size
+            except OSError:
+                pass
+        # Other processes may share the folder; the next scan corrects any drift
+        _ocr_cache_bytes = total
+
+def print_ocr_cache_stats():
+    hits = OCR_CACHE_STATS["hits"]
+    misses = OCR_CACHE_STATS["misses"]
+    if hits or misses:
+        print(f"OCR cache: {hits} hits, {misses} misses")
 
 # =========================
-# STEP 2: PROBLEM PARSING
+# MODEL RESPONSE CACHE
 # =========================
-def parse_problem_with_gemini(problem_text):
+LLM_CACHE_ENABLED = True
+LLM_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+LLM_CACHE_MAX_BYTES = 50 * 1024 * 1024
+_llm_cache_lock = threading.Lock()
+LLM_CACHE_STATS = {"hits": 0, "misses": 0}
+
+def llm_cache_path():
+    return CACHE_DIR / "llm_responses.sqlite3"
+
+def llm_cache_connect():
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(llm_cache_path(), timeout=30)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS responses ("
+        "key TEXT PRIMARY KEY, model TEXT, response TEXT, "
+        "size INTEGER, created REAL, accessed REAL)"
+    )
+    return conn
+
+def llm_cache_key(model, prompt):
+    return hashlib.sha256(f"{model}\0{prompt}".encode('utf-8')).hexdigest()
+
+def llm_cache_get(model, prompt):
+    """Return the cached response for this exact model and prompt, or None if missing or expired."""
+    if not LLM_CACHE_ENABLED:
+        return None
+    key = llm_cache_key(model, prompt)
+    now = time.time()
+    try:
+        with _llm_cache_lock:
+            conn = llm_cache_connect()
+            try:
+                row = conn.execute(
+                    "SELECT response, created FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row and now - row[1] <= LLM_CACHE_TTL_SECONDS:
+                    conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                    conn.commit()
+                    LLM_CACHE_STATS["hits"] += 1
+                    return row[0]
+                if row:
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    conn.commit()
+            finally:
+                conn.close()
+    except sqlite3.Error as e:
+        print(f"Warning: could not read model response cache: {e}")
+    LLM_CACHE_STATS["misses"] += 1
+    return None
+
+def llm_cache_put(model, prompt, response_text):
+    """Store a model response, then evict least recently used rows over the size limit."""
+    if not LLM_CACHE_ENABLED or not response_text:
+        return
+    key = llm_cache_key(model, prompt)
+    now = time.time()
+    size = len(response_text.encode('utf-8'))
+    try:
+        with _llm_cache_lock:
+            conn = llm_cache_connect()
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, model, response_text, size, now, now)
+                )
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+                if total > LLM_CACHE_MAX_BYTES:
+                    for old_key, old_size in conn.execute(
+                        "SELECT key, size FROM responses ORDER BY accessed"
+                    ).fetchall():
+                        if total <= LLM_CACHE_MAX_BYTES:
+                            break
+                        conn.execute("DELETE FROM responses WHERE key = ?", (old_key,))
+                        total -= old_size
+                conn.commit()
+            finally:
+                conn.close()
+    except sqlite3.Error as e:
+        print(f"Warning: could not write model response cache: {e}")
+
+def print_llm_cache_stats():
+    hits = LLM_CACHE_STATS["hits"]
+    misses = LLM_CACHE_STATS["misses"]
+    if hits or misses:
+        print(f"Model response cache: {hits} hits, {misses} misses")
+
+def generate_text(prompt, priority=PRIORITY_EVALUATION):
     """
-    Use Gemini to parse problem requirements and identify expected solution patterns.
+    Send one text prompt to Gemini and return the response text.
+    Repeated prompts are answered from the response cache.
     """
-    if not GENAI_AVAILABLE:
-        print("Google Generative AI package not installed. Using offline mode.")
-        return offline_parse_problem(problem_text), []
+    cached = llm_cache_get(GEMINI_MODEL, prompt)
+    if cached is not None:
+        return cached
     
-    try:
-        client = genai.Client(api_key=API_KEY)
-        prompt = f"""
-        Analyze the problem statement and extract:
-        1. Required function name
-        2. Input parameters and their types
-        3. Expected output type and format
-        4. Edge cases to consider
-        5. Key algorithmic concepts needed (loops, conditions, recursion, etc.)
-        6. Common mistakes students might make
-        
-        Problem: {problem_text}
-        
-        Format the response clearly with sections.
-        """
-        response = client.models.generate_content(
-            model="gemini-2.0-flash-exp", contents=prompt
-        )
-        
-        # Extract common mistakes
-        mistakes_prompt = f"""
-        Based on this problem, list the 5-7 most common mistakes students make when solving it.
-        Be specific about coding errors, logic errors, and edge case handling.
-        
-        Problem: {problem_text}
-        
-        Format as a numbered list.
-        """
-        mistakes_response = client.models.generate_content(
-            model="gemini-2.0-flash-exp", contents=mistakes_prompt
-        )
-        
-        common_mistakes = mistakes_response.text if hasattr(mistakes_response, 'text') else ""
-        
-        return response.text, common_mistakes
-    except Exception as e:
-        print(f"API Error: {str(e)}")
-        print("Falling back to offline mode...")
-        return offline_parse_problem(problem_text), []
+    client = get_genai_client()
+    response = call_gemini(
+        lambda: client.models.generate_content(model=GEMINI_MODEL, contents=prompt), prompt, priority
+    )
+    text = response.text if hasattr(response, 'text') else ""
+    llm_cache_put(GEMINI_MODEL, prompt, text)
+    return text
 
-def offline_parse_problem(problem_text):
+def structured_output_config(schema):
+    return genai_types.GenerateContentConfig(
+        response_mime_type="application/json", response_schema=schema
+    )
+
+def structured_cache_prompt(prompt, schema):
+    """The schema is part of the request, so it is part of the cache key too."""
+    return prompt + "\n" + json.dumps(schema, sort_keys=True)
+
+def generate_json(prompt, schema):
     """
-    Basic offline parsing of problem requirements.
+    Send a prompt whose answer must be JSON matching schema and return the parsed object.
+    Only responses that parse are cached.
     """
-    function_match = re.search(r'function\s+(\w+)|def\s+(\w+)', problem_text, re.IGNORECASE)
-    function_name = "Unknown"
-    if function_match:
-        function_name = function_match.group(1) or function_match.group(2)
+    cache_prompt = structured_cache_prompt(prompt, schema)
+    cached = llm_cache_get(GEMINI_MODEL, cache_prompt)
+    if cached is not None:
+        return json.loads(cached)
     
-    return f"""
-    Problem Analysis:
+    client = get_genai_client()
+    response = call_gemini(
+        lambda: client.models.generate_content(
+            model=GEMINI_MODEL, contents=prompt, config=structured_output_config(schema)
+        ),
+        prompt
+    )
+    text = response.text if hasattr(response, 'text') else ""
+    data = json.loads(text)
+    llm_cache_put(GEMINI_MODEL, cache_prompt, text)
+    return data
+
+# =========================
+# PARALLEL PDF OCR
+# =========================
+PDF_OCR_WORKERS = os.cpu_count() or 1
+PDF_DPI = 200
+PDF_MAX_PAGES_IN_MEMORY = 4
+# Workers must not be forked from a threaded parent: a child can inherit a lock
+# (metrics, logging, ...) that another thread held at fork time and hang on it
+PDF_OCR_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+_pdf_ocr_pool = None
+_pdf_ocr_pool_lock = threading.Lock()
+# Pages rendered or queued for rendering across every PDF in flight, in this
+# process and its pool; kept at or below PDF_MAX_PAGES_IN_MEMORY
+_pdf_pages_reserved = 0
+_pdf_pages_condition = threading.Condition()
+
+def reserve_pdf_pages(count):
+    """Block until count more rendered pages fit in PDF_MAX_PAGES_IN_MEMORY, then claim them."""
+    global _pdf_pages_reserved
+    count = min(count, PDF_MAX_PAGES_IN_MEMORY)
+    with _pdf_pages_condition:
+        _pdf_pages_condition.wait_for(lambda: _pdf_pages_reserved + count <= PDF_MAX_PAGES_IN_MEMORY)
+        _pdf_pages_reserved += count
+    return count
+
+def release_pdf_pages(count):
+    global _pdf_pages_reserved
+    with _pdf_pages_condition:
+        _pdf_pages_reserved -= count
+        _pdf_pages_condition.notify_all()
+
+@contextlib.contextmanager
+def pdf_pages_in_memory(count):
+    count = reserve_pdf_pages(count)
+    try:
+        yield
+    finally:
+        release_pdf_pages(count)
+
+def pdf_ocr_pool_size():
+    return max(1, min(PDF_OCR_WORKERS, PDF_MAX_PAGES_IN_MEMORY))
+
+def get_pdf_ocr_pool():
+    """
+    Return the process pool shared by every PDF being OCR'd, so parallel
+    batch workers do not each start their own set of processes. Batch runs
+    create it up front, before their worker threads start.
+    """
+    global _pdf_ocr_pool
+    with _pdf_ocr_pool_lock:
+        if _pdf_ocr_pool is None:
+            _pdf_ocr_pool = ProcessPoolExecutor(
+                max_workers=pdf_ocr_pool_size(),
+                mp_context=multiprocessing.get_context(PDF_OCR_START_METHOD)
+            )
+        return _pdf_ocr_pool
+
+def prepare_pdf_ocr_pool(submissions):
+    """Start the PDF OCR pool before a batch starts its threads, if any submission will need it."""
+    if OCR_AVAILABLE and pdf_ocr_pool_size() > 1 and any(
+            Path(path).suffix.lower() == '.pdf' for _, path in submissions):
+        get_pdf_ocr_pool()
+
+def ocr_pdf_page_range(pdf_path, first_page, last_page, dpi):
+    """
+    Render and OCR pages first_page..last_page (1-based, inclusive) into
+    (text, confidence, preprocess seconds) triples. Runs inside a pool worker;
+    only this window's images are ever in memory. Nothing is recorded in the
+    worker's own metrics; the caller records the returned timings.
+    """
+    pages = pdf2image.convert_from_path(pdf_path, dpi=dpi, first_page=first_page, last_page=last_page)
+    results = []
+    while pages:
+        seconds = []
+        def preprocess(pil_img):
+            started = time.perf_counter()
+            pil_img = preprocess_for_tesseract.__wrapped__(pil_img)
+            seconds.append(time.perf_counter() - started)
+            return pil_img
+        gray_img = pages.pop(0).convert("L")
+        results.append(tesseract_read_page(gray_img, preprocess) + (sum(seconds),))
+    return results
+
+def pdf_page_windows(page_numbers, window_size):
+    """Split sorted 1-based page numbers into (first_page, last_page) windows of consecutive pages."""
+    windows = []
+    for page in page_numbers:
+        if windows and page == windows[-1][1] + 1 and page - windows[-1][0] < window_size:
+            windows[-1] = (windows[-1][0], page)
+        else:
+            windows.append((page, page))
+    return windows
+
+def iter_pdf_page_texts(pdf_path, dpi=None, confidences=None, pages=None):
+    """
+    Yield the OCR text of each PDF page in page order as soon as it is ready.
+    Pages are rendered in small windows spread across the process pool. Every
+    window claims its pages from one budget shared by all PDFs in flight (see
+    reserve_pdf_pages), so peak memory stays at PDF_MAX_PAGES_IN_MEMORY pages
+    however long the PDFs are and however many batch workers are reading them.
+    Each page's OCR confidence is appended to confidences, if given. pages
+    limits OCR to those 1-based page numbers (default: every page).
+    """
+    dpi = dpi or PDF_DPI
+    if pages is None:
+        pages = range(1, pdf2image.pdfinfo_from_path(pdf_path)["Pages"] + 1)
+    pages = sorted(pages)
+    print(f"Processing {len(pages)} PDF pages at {dpi} DPI...")
     
-    1. Required function name: {function_name}
-    2. Input parameters: Based on problem description
-    3. Expected output: Based on problem requirements
-    4. Edge cases: Empty input, invalid input, boundary conditions
-    5. Key concepts: Based on problem complexity
+    pool_size = pdf_ocr_pool_size()
+    window_size = max(1, PDF_MAX_PAGES_IN_MEMORY // pool_size)
+    windows = pdf_page_windows(pages, window_size)
+    workers = min(pool_size, len(windows))
+    
+    done_windows = 0
+    if workers > 1:
+        pending = []
+        try:
+            pool = get_pdf_ocr_pool()
+            next_window = 0
+            while next_window < len(windows) or pending:
+                # Keep at most `workers` windows rendering at once
+                while next_window < len(windows) and len(pending) < workers:
+                    first, last = windows[next_window]
+                    reserved = reserve_pdf_pages(last - first + 1)
+                    try:
+                        future = pool.submit(ocr_pdf_page_range, pdf_path, first, last, dpi)
+                    except Exception:
+                        release_pdf_pages(reserved)
+                        raise
+                    # Released when the worker is done with the pages, not when this
+                    # generator gets round to the result, so a waiting PDF cannot stall the rest
+                    future.add_done_callback(lambda _, reserved=reserved: release_pdf_pages(reserved))
+                    pending.append(future)
+                    next_window += 1
+                results = pending.pop(0).result()
+                done_windows += 1
+                for text, confidence, seconds in results:
+                    record_stage("preprocess", seconds, {})
+                    if confidences is not None:
+                        confidences.append(confidence)
+                    yield text
+        except Exception as e:
+            for future in pending:
+                future.cancel()
+            # Windows already rendering must finish first, or they and the
+            # fallback together would exceed PDF_MAX_PAGES_IN_MEMORY
+            wait(pending)
+            print(f"Parallel PDF OCR failed: {e}. Processing remaining pages one window at a time...")
+    
+    # Sequential path: one window rendered at a time, within the shared page budget
+    for first, last in windows[done_windows:]:
+        with pdf_pages_in_memory(last - first + 1):
+            results = ocr_pdf_page_range(pdf_path, first, last, dpi)
+        for text, confidence, seconds in results:
+            record_stage("preprocess", seconds, {})
+            if confidences is not None:
+                confidences.append(confidence)
+            yield text
+
+# =========================
+# IMAGE OCR FUNCTIONS
+# =========================
+OCR_MAX_SIDE = 1600
+GEMINI_OCR_PROMPT = "Extract all text from this image. Preserve the structure, sections, and formatting. If there are sections like 'Aim', 'Algorithm', 'Program', 'Output', and 'Result', make sure to clearly identify them."
+# Each backend gets the resolution it reads best at: Gemini downsamples large
+# images itself, while tesseract wants roughly 300 DPI text on a full page
+OCR_BACKEND_MAX_SIDE = {"gemini": OCR_MAX_SIDE, "tesseract": 2500}
+OCR_BINARIZE = True
+OCR_DESKEW = True
+DESKEW_MAX_ANGLE = 5.0
+DESKEW_STEP = 0.5
+DESKEW_SAMPLE_SIDE = 600
+# Tesseract's orientation detection costs an extra pass and needs the osd language
+# data, so it only runs on pages tesseract reads with low confidence
+OCR_DETECT_ORIENTATION = True
+ORIENTATION_SAMPLE_SIDE = 1000
+# Bump when preprocessing changes so cached OCR text made the old way is not reused
+OCR_PREPROCESS_VERSION = 3
+
+@timed_stage("resize", lambda img: {"pixels": img.size[0] * img.size[1]})
+def maybe_resize_image(pil_img, max_side=1600):
+    """
+    Shrink an image to fit max_side: an integer box reduction first, then
+    Lanczos over the last step only. An image that already fits is returned
+    as is (not copied); a larger one is returned as a new image, leaving the
+    caller's untouched.
+    """
+    w, h = pil_img.size
+    if max(w, h) <= max_side:
+        return pil_img
+    scale = max_side / max(w, h)
+    size = (max(1, round(w * scale)), max(1, round(h * scale)))
+    return pil_img.resize(size, Image.LANCZOS, reducing_gap=3.0)
+
+def ocr_preprocess_settings(backend):
+    """Cache-key description of how images are prepared for a backend."""
+    settings = f"v{OCR_PREPROCESS_VERSION},max_side={OCR_BACKEND_MAX_SIDE[backend]}"
+    if backend == "tesseract":
+        settings += f",binarize={OCR_BINARIZE},deskew={OCR_DESKEW},osd={OCR_DETECT_ORIENTATION}"
+    return settings
+
+def open_image_for_ocr(image_path, max_side, mode):
+    """
+    Open an image at roughly the size it will be used at. JPEG decoding is
+    reduced by 1/2, 1/4 or 1/8 while the result still covers max_side, so a
+    12 MP phone photo is never fully decoded just to be shrunk. EXIF orientation
+    is applied so sideways photos are upright.
+    """
+    with measure_stage("decode") as fields:
+        pil_img = Image.open(image_path)
+        fields["source_pixels"] = pil_img.size[0] * pil_img.size[1]
+        if pil_img.format == "JPEG":
+            # draft() keeps both sides at or above the requested size, so ask for the scaled shape
+            scale = min(1.0, max_side / max(pil_img.size))
+            pil_img.draft(mode, (math.ceil(pil_img.size[0] * scale), math.ceil(pil_img.size[1] * scale)))
+        pil_img = ImageOps.exif_transpose(pil_img)
+        pil_img = pil_img.convert(mode)
+        fields["pixels"] = pil_img.size[0] * pil_img.size[1]
+    return maybe_resize_image(pil_img, max_side)
+
+def otsu_threshold(gray_img):
+    """Gray level that best separates ink from paper, from the image histogram."""
+    histogram = gray_img.histogram()[:256]
+    total = sum(histogram)
+    weighted_total = sum(level * count for level, count in enumerate(histogram))
+    background = weighted_background = 0
+    best_level, best_variance = 127, -1.0
+    for level, count in enumerate(histogram):
+        background += count
+        if background == 0:
+            continue
+        foreground = total - background
+        if foreground == 0:
+            break
+        weighted_background += level * count
+        mean_background = weighted_background / background
+        mean_foreground = (weighted_total - weighted_background) / foreground
+        variance = background * foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_level, best_variance = level, variance
+    return best_level
+
+def binarize_image(gray_img):
+    gray_img = ImageOps.autocontrast(gray_img, cutoff=1)
+    threshold = otsu_threshold(gray_img)
+    return gray_img.point(lambda value: 255 if value > threshold else 0, mode="L")
+
+def estimate_skew_angle(binary_img):
+    """
+    Angle (degrees) that straightens the text lines: the rotation whose row
+    ink profile has the sharpest peaks, searched on a small copy of the page.
+    """
+    sample = binary_img.copy()
+    sample.thumbnail((DESKEW_SAMPLE_SIDE, DESKEW_SAMPLE_SIDE), Image.NEAREST)
+    # Ink as 255 on black so rotation padding adds no ink
+    sample = ImageOps.invert(sample)
+    width = sample.size[0]
+    best_angle, best_score = 0.0, -1.0
+    steps = int(DESKEW_MAX_ANGLE / DESKEW_STEP)
+    for step in range(-steps, steps + 1):
+        angle = step * DESKEW_STEP
+        data = sample.rotate(angle, resample=Image.NEAREST, fillcolor=0).tobytes()
+        rows = [sum(data[start:start + width]) for start in range(0, len(data), width)]
+        score = sum((rows[i + 1] - rows[i]) ** 2 for i in range(len(rows) - 1))
+        if score > best_score:
+            best_angle, best_score = angle, score
+    return best_angle
+
+def detect_orientation(pil_img):
+    """Rotation (0, 90, 180 or 270) tesseract's OSD suggests; 0 when it is unavailable or unsure."""
+    sample = pil_img.copy()
+    # Orientation is obvious at low resolution, and the image is written to disk for tesseract
+    sample.thumbnail((ORIENTATION_SAMPLE_SIDE, ORIENTATION_SAMPLE_SIDE), Image.BILINEAR)
+    try:
+        osd = pytesseract.image_to_osd(sample, output_type=pytesseract.Output.DICT)
+        return int(osd.get("rotate", 0))
+    except Exception:
+        return 0
+
+@timed_stage("preprocess")
+def preprocess_for_tesseract(gray_img):
+    """Grayscale page to deskewed black-on-white text for tesseract."""
+    if gray_img.mode != "L":
+        gray_img = gray_img.convert("L")
+    pil_img = binarize_image(gray_img) if OCR_BINARIZE else gray_img
+    if OCR_DESKEW:
+        angle = estimate_skew_angle(pil_img if OCR_BINARIZE else binarize_image(gray_img))
+        if angle:
+            pil_img = pil_img.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+            # The expanded canvas is larger than the page; keep it within the size it was read at
+            pil_img = maybe_resize_image(pil_img, max(OCR_BACKEND_MAX_SIDE["tesseract"], *gray_img.size))
+            if OCR_BINARIZE:
+                pil_img = pil_img.point(lambda value: 255 if value > 127 else 0)
+    return pil_img
+
+def tesseract_read_page(gray_img, preprocess=preprocess_for_tesseract):
     """
+    Preprocess and OCR a grayscale page, returning (text, confidence). Pages
+    read with low confidence may be sideways or upside down, so only those get
+    tesseract's orientation check; the turned page's reading is kept if it is better.
+    """
+    text, confidence = tesseract_read(preprocess(gray_img))
+    if confidence < OCR_CONFIDENCE_THRESHOLD and OCR_DETECT_ORIENTATION and OCR_AVAILABLE:
+        rotation = detect_orientation(gray_img)
+        if rotation:
+            turned = tesseract_read(preprocess(gray_img.rotate(-rotation, expand=True)))
+            if turned[1] > confidence:
+                return turned
+    return text, confidence
+
+def load_image_for_backend(image_path, backend):
+    """Decode, orient and size an image the way the given OCR backend reads it best."""
+    if backend == "tesseract":
+        pil_img = open_image_for_ocr(image_path, OCR_BACKEND_MAX_SIDE["tesseract"], "L")
+        return preprocess_for_tesseract(pil_img)
+    return open_image_for_ocr(image_path, OCR_BACKEND_MAX_SIDE[backend], "RGB")
 
 # =========================
-# STEP 3: CODE VALIDATION
+# OCR BACKENDS AND ROUTING
 # =========================
-def validate_code(code):
+# Each backend reads one kind of file ("image" or "pdf") and returns its text
+# with a 0-1 confidence, or None when it does not apply (e.g. a PDF without a
+# text layer). The router tries backends cheapest first and stops at the first
+# confident answer, so typed PDFs skip OCR (only their scanned pages are
+# rasterized), clean scans stop at tesseract, and only hard pages reach Gemini.
+# Every backend's answer is cached separately.
+OCR_BACKENDS = {}
+OCR_CONFIDENCE_THRESHOLD = 0.75
+PDF_TEXT_MIN_CHARS_PER_PAGE = 20
+ENABLED_OCR_BACKENDS = None  # None means every available backend
+
+def register_ocr_backend(name, cost, kinds, available, settings=lambda: ""):
+    """Decorator adding an OCR backend to the router; lower cost is tried first."""
+    def decorator(function):
+        OCR_BACKENDS[name] = {
+            "name": name, "cost": cost, "kinds": set(kinds),
+            "available": available, "settings": settings, "run": function,
+        }
+        return function
+    return decorator
+
+def ocr_kind(path):
+    return "pdf" if Path(path).suffix.lower() == '.pdf' else "image"
+
+def ocr_backend_usable(name):
+    """True if the backend is installed and allowed by ENABLED_OCR_BACKENDS."""
+    backend = OCR_BACKENDS.get(name)
+    return (backend is not None and backend["available"]()
+            and (ENABLED_OCR_BACKENDS is None or name in ENABLED_OCR_BACKENDS))
+
+def ocr_backends_for(kind):
+    """Available backends for a kind of file, cheapest first."""
+    backends = [
+        backend for backend in OCR_BACKENDS.values()
+        if kind in backend["kinds"] and ocr_backend_usable(backend["name"])
+    ]
+    return sorted(backends, key=lambda backend: backend["cost"])
+
+def ocr_backend_cache_key(file_hash, backend_name, kind):
+    backend = OCR_BACKENDS[backend_name]
+    return ocr_cache_key(file_hash, f"{backend_name}-{kind}", backend["settings"]())
+
+def ocr_cache_get_result(key):
+    """Cached (text, confidence) for key, or None."""
+    cached = ocr_cache_get(key)
+    if cached is None:
+        return None
+    try:
+        entry = json.loads(cached)
+        return entry["text"], entry["confidence"]
+    except (ValueError, KeyError, TypeError):
+        return None
+
+def ocr_cache_put_result(key, text, confidence):
+    if text:
+        ocr_cache_put(key, json.dumps({"text": text, "confidence": confidence}))
+
+def tesseract_read(pil_img):
     """
-    Check for syntax errors and basic code issues.
-    Returns (error_message, mistake_points)
+    OCR with tesseract's word boxes: returns (text, confidence). Lines are rebuilt
+    from the boxes with their indentation estimated from word positions, which
+    matters for Python code.
     """
-    mistake_points = []
+    data = pytesseract.image_to_data(pil_img, output_type=pytesseract.Output.DICT)
+    lines = {}
+    char_widths = []
+    weighted_confidence = characters = 0
+    for i, word in enumerate(data["text"]):
+        word = word.strip()
+        confidence = float(data["conf"][i])
+        if not word or confidence < 0:
+            continue
+        line_key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        lines.setdefault(line_key, []).append((data["left"][i], word))
+        char_widths.append(data["width"][i] / len(word))
+        weighted_confidence += confidence * len(word)
+        characters += len(word)
+    if not lines:
+        return "", 0.0
     
-    # Check for syntax errors
+    char_width = sorted(char_widths)[len(char_widths) // 2] or 1
+    margin = min(words[0][0] for words in lines.values())
+    text_lines = []
+    previous_paragraph = None
+    for (block, paragraph, _), words in sorted(lines.items()):
+        if previous_paragraph is not None and (block, paragraph) != previous_paragraph:
+            text_lines.append("")
+        previous_paragraph = (block, paragraph)
+        indent = int(round((words[0][0] - margin) / char_width))
+        text_lines.append(" " * indent + " ".join(word for _, word in words))
+    return "\n".join(text_lines), round(weighted_confidence / characters / 100, 3)
+
+def gemini_available():
+    return GENAI_AVAILABLE and PIL_AVAILABLE
+
+def tesseract_available():
+    return OCR_AVAILABLE and PIL_AVAILABLE
+
+def pdf_text_available():
+    return PDF_TEXT_AVAILABLE
+
+def read_pdf_text_layer(pdf_path):
+    """Embedded text of each page (layout preserved, common indentation removed)."""
+    reader = pypdf.PdfReader(str(pdf_path))
+    pages = []
+    for page in reader.pages:
+        try:
+            text = page.extract_text(extraction_mode="layout")
+        except Exception:
+            text = page.extract_text() or ""
+        lines = [line.rstrip() for line in (text or "").splitlines()]
+        pages.append(textwrap.dedent("\n".join(lines)).strip("\n"))
+    return pages
+
+def page_has_text(page_text):
+    return len("".join(page_text.split())) >= PDF_TEXT_MIN_CHARS_PER_PAGE
+
+def pdf_page_ocr_settings():
+    """Settings behind OCR'd PDF pages: tesseract, and Gemini for the pages it reads poorly."""
+    escalation = f"{GEMINI_MODEL},{ocr_preprocess_settings('gemini')}" if ocr_backend_usable("gemini") else "none"
+    return (f"{ocr_preprocess_settings('tesseract')},dpi={PDF_DPI},"
+            f"threshold={OCR_CONFIDENCE_THRESHOLD},escalation={escalation}")
+
+def pdf_text_settings():
+    return f"{PDF_TEXT_MIN_CHARS_PER_PAGE},{pdf_page_ocr_settings()}"
+
+def pdf_has_text_layer(pdf_path):
+    """Cheap probe: True as soon as one page has embedded text (plain extraction, no layout)."""
+    if not ocr_backend_usable("pdf-text"):
+        return False
     try:
-        compile(code, "<string>", "exec")
-    except SyntaxError as e:
-        mistake_points.append(f"• Syntax Error at line {e.lineno}: {e.msg}")
-        return f"Syntax Error: {str(e)}", mistake_points
-    except IndentationError as e:
-        mistake_points.append(f"• Indentation Error: {e.msg}")
-        return f"Indentation Error: {str(e)}", mistake_points
-    except Exception as e:
-        mistake_points.append(f"• Compilation Error: {str(e)}")
-        return f"Compilation Error: {str(e)}", mistake_points
+        for page in pypdf.PdfReader(str(pdf_path)).pages:
+            if page_has_text(page.extract_text() or ""):
+                return True
+    except Exception:
+        return False
+    return False
+
+def escalate_weak_pages(pdf_path, page_numbers, pages, confidences):
+    """
+    Re-read each listed page (1-based) whose confidence is below
+    OCR_CONFIDENCE_THRESHOLD with Gemini, one page per request, updating
+    pages and confidences in place.
+    """
+    weak = [number for number in page_numbers if confidences[number - 1] < OCR_CONFIDENCE_THRESHOLD]
+    if not (weak and OCR_AVAILABLE and ocr_backend_usable("gemini")):
+        return
+    for number in weak:
+        try:
+            pages[number - 1], confidences[number - 1] = gemini_read_page(pdf_path, number)
+        except Exception as e:
+            print(f"Gemini OCR failed for page {number} of {Path(pdf_path).name}: {e}")
+
+def gemini_read_page(pdf_path, page_number):
+    """Render one PDF page and read it with Gemini."""
+    with pdf_pages_in_memory(1):
+        page = pdf2image.convert_from_path(str(pdf_path), dpi=PDF_DPI, first_page=page_number, last_page=page_number)[0]
+        if page.mode != "RGB":
+            page = page.convert("RGB")
+        image = maybe_resize_image(page, OCR_BACKEND_MAX_SIDE["gemini"])
+        del page
+    return gemini_read(image)
+
+@register_ocr_backend("pdf-text", 0, ["pdf"], pdf_text_available, pdf_text_settings)
+def pdf_text_backend(pdf_path):
+    """
+    The PDF's own text layer, exact and instant. Only pages without one (scans
+    inside an otherwise typed PDF) are rasterized and OCR'd, and pages tesseract
+    cannot read confidently go to Gemini one by one. Confidence is that of the
+    weakest page, so a lost page is never hidden by good ones; a PDF with no
+    text at all is left to the OCR backends.
+    """
+    with measure_stage("pdf_text") as fields:
+        pages = read_pdf_text_layer(pdf_path)
+        fields["pages"] = len(pages)
+    missing = [number for number, text in enumerate(pages, 1) if not page_has_text(text)]
+    if len(missing) == len(pages):
+        return None
     
-    # Basic code quality checks
-    lines = code.split('\n')
+    confidences = [1.0] * len(pages)
+    if missing and ocr_backend_usable("tesseract"):
+        ocr_confidences = []
+        with measure_stage("pdf_ocr", pages=len(missing)):
+            ocr_texts = list(iter_pdf_page_texts(str(pdf_path), confidences=ocr_confidences, pages=missing))
+        for number, text, confidence in zip(missing, ocr_texts, ocr_confidences):
+            pages[number - 1] = text
+            confidences[number - 1] = confidence
+    else:
+        for number in missing:
+            confidences[number - 1] = 0.0
     
-    # Check for common issues
-    if not any('def ' in line for line in lines):
-        mistake_points.append("• No function definition found")
+    escalate_weak_pages(pdf_path, missing, pages, confidences)
+    text = "\n\n".join(page.strip() for page in pages if page.strip())
+    return text, round(min(confidences), 3)
+
+@register_ocr_backend("tesseract", 1, ["image", "pdf"], tesseract_available, pdf_page_ocr_settings)
+def tesseract_backend(path):
+    """
+    Tesseract with word confidences. For PDFs, pages it reads poorly are sent
+    to Gemini one by one, and the weakest page's confidence is reported.
+    """
+    if ocr_kind(path) == "pdf":
+        confidences = []
+        with measure_stage("pdf_ocr") as fields:
+            page_texts = list(iter_pdf_page_texts(str(path), confidences=confidences))
+            fields["pages"] = len(page_texts)
+        escalate_weak_pages(path, range(1, len(page_texts) + 1), page_texts, confidences)
+        # The weakest page decides, so one unreadable page still escalates
+        confidence = min(confidences) if confidences else 0.0
+        return "\n\n".join(page_texts).strip(), round(confidence, 3)
+    gray_img = open_image_for_ocr(path, OCR_BACKEND_MAX_SIDE["tesseract"], "L")
+    with measure_stage("tesseract_ocr", pages=1):
+        return tesseract_read_page(gray_img)
+
+@register_ocr_backend("gemini", 2, ["image", "pdf"], gemini_available,
+                      lambda: f"{GEMINI_MODEL},{ocr_preprocess_settings('gemini')}")
+def gemini_backend(path):
+    """Gemini reads what the local backends could not; its answer is taken as final."""
+    if ocr_kind(path) == "pdf":
+        data = Path(path).read_bytes()
+        if len(data) > GEMINI_OCR_MAX_REQUEST_BYTES:
+            return None
+        return gemini_read(genai_types.Part.from_bytes(data=data, mime_type="application/pdf"))
+    return gemini_read(load_image_for_backend(path, "gemini"))
+
+def gemini_read(content):
+    """OCR one image or document part with Gemini; returns (text, 1.0)."""
+    client = get_genai_client()
+    contents = [GEMINI_OCR_PROMPT, content]
+    response = call_gemini(
+        lambda: client.models.generate_content(model=GEMINI_MODEL, contents=contents),
+        contents, PRIORITY_OCR
+    )
+    text = response.text.strip() if hasattr(response, "text") else str(response)
+    return text, 1.0
+
+def route_ocr(path, max_cost=None, file_hash=None):
+    """
+    Run backends cheapest first until one is confident. Returns (text, confidence,
+    backend name) for the best answer, or None if no backend produced any text.
+    max_cost stops before pricier backends (used to decide what needs Gemini).
+    """
+    kind = ocr_kind(path)
+    file_hash = file_hash or file_sha256(path)
+    best = None
+    for backend in ocr_backends_for(kind):
+        if max_cost is not None and backend["cost"] > max_cost:
+            break
+        key = ocr_backend_cache_key(file_hash, backend["name"], kind)
+        result = ocr_cache_get_result(key)
+        if result is None:
+            try:
+                result = backend["run"](path)
+            except Exception as e:
+                print(f"{backend['name']} OCR failed for {Path(path).name}: {e}")
+                continue
+            if result is None:
+                continue
+            ocr_cache_put_result(key, *result)
+        text, confidence = result
+        if text and (best is None or confidence > best[1]):
+            best = (text, confidence, backend["name"])
+        if text and confidence >= OCR_CONFIDENCE_THRESHOLD:
+            break
+    return best
+
+def extract_text_with_confidence(image_path):
+    """
+    Extract text from an image or PDF with the cheapest OCR backend that is
+    confident enough. Returns (text, confidence); text is None on failure.
+    Every backend's result is cached by file content and settings, so
+    re-grading the same files skips OCR entirely.
+    """
+    if not Path(image_path).exists():
+        print(f"Error: File not found: {image_path}")
+        return None, 0.0
     
-    if 'return' not in code and 'print' not in code:
-        mistake_points.append("• No return statement or print output found")
+    if not ocr_backends_for(ocr_kind(image_path)):
+        print("Error: No OCR method available. Install pytesseract or enable Gemini API.")
+        return None, 0.0
     
-    # Check for empty except blocks
-    if 'except:' in code and 'pass' in code:
-        mistake_points.append("• Empty except block found (poor error handling)")
+    try:
+        result = route_ocr(image_path)
+    except Exception as e:
+        print(f"Error extracting text from file: {e}")
+        return None, 0.0
+    if result is None:
+        return None, 0.0
+    text, confidence, backend = result
+    if confidence < OCR_CONFIDENCE_THRESHOLD:
+        print(f"Warning: low OCR confidence ({confidence:.0%}, {backend}) for {Path(image_path).name}")
+    return text, confidence
+
+def extract_text_from_image(image_path):
+    """Extract text from an image or PDF; see extract_text_with_confidence."""
+    return extract_text_with_confidence(image_path)[0]
+
+# =========================
+# BATCHED GEMINI OCR
+# =========================
+# Several images go into one multimodal request, each introduced by a numbered
+# delimiter the model repeats in its answer, so the response can be split back
+# per image. Packing stops at GEMINI_OCR_BATCH_SIZE images or the request size
+# limit, whichever comes first. Only images the cheaper backends cannot read
+# confidently are sent, and results land in the Gemini backend's cache entries,
+# so the OCR router picks them up.
+GEMINI_OCR_BATCH_SIZE = 6
+# Gemini rejects inline requests over 20 MB; leave room for the prompt and encoding overhead
+GEMINI_OCR_MAX_REQUEST_BYTES = 15 * 1024 * 1024
+GEMINI_OCR_JPEG_QUALITY = 90
+IMAGE_SUBMISSION_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
+PAGE_DELIMITER_RE = re.compile(r"^=== PAGE (\d+) ===[ \t]*$", re.MULTILINE)
+
+def build_batched_ocr_prompt(count):
+    return (
+        f"{GEMINI_OCR_PROMPT}\n\n"
+        f"You are given {count} separate images, each preceded by a marker '=== PAGE n ==='. "
+        f"Transcribe every image separately and in order. Start each transcription with the "
+        f"same marker on its own line ('=== PAGE 1 ===' through '=== PAGE {count} ===') and "
+        f"never merge text from different images."
+    )
+
+def split_batched_ocr_response(text, count):
+    """Map page number (1-based) to its transcription; pages the model skipped are absent."""
+    pages = {}
+    matches = list(PAGE_DELIMITER_RE.finditer(text or ""))
+    for i, match in enumerate(matches):
+        number = int(match.group(1))
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        if 1 <= number <= count and number not in pages:
+            pages[number] = text[match.end():end].strip()
+    return pages
+
+def encode_image_for_request(image_path):
+    """Preprocess for Gemini and encode as JPEG, so the request size is known before sending."""
+    pil_img = load_image_for_backend(image_path, "gemini")
+    buffer = io.BytesIO()
+    pil_img.save(buffer, format="JPEG", quality=GEMINI_OCR_JPEG_QUALITY)
+    return buffer.getvalue()
+
+def pack_ocr_requests(encoded):
+    """Split [(key, jpeg_bytes)] into request-sized lists."""
+    batches, current, current_bytes = [], [], 0
+    for key, data in encoded:
+        if current and (len(current) >= GEMINI_OCR_BATCH_SIZE or current_bytes + len(data) > GEMINI_OCR_MAX_REQUEST_BYTES):
+            batches.append(current)
+            current, current_bytes = [], 0
+        current.append((key, data))
+        current_bytes += len(data)
+    if current:
+        batches.append(current)
+    return batches
+
+def gemini_ocr_request(batch):
+    """Send one packed request and return {cache_key: text} for the images it transcribed."""
+    contents = [build_batched_ocr_prompt(len(batch))]
+    for number, (_, data) in enumerate(batch, 1):
+        contents.append(f"=== PAGE {number} ===")
+        contents.append(genai_types.Part.from_bytes(data=data, mime_type="image/jpeg"))
+    client = get_genai_client()
+    response = call_gemini(
+        lambda: client.models.generate_content(model=GEMINI_MODEL, contents=contents),
+        contents, PRIORITY_OCR
+    )
+    text = response.text if hasattr(response, "text") else ""
+    if len(batch) == 1:
+        # A lone image may come back without its marker
+        pages = split_batched_ocr_response(text, 1) or {1: text.strip()}
+    else:
+        pages = split_batched_ocr_response(text, len(batch))
+    return {batch[number - 1][0]: page_text for number, page_text in pages.items()}
+
+def needs_gemini_ocr(image_path):
+    """
+    Run the cheaper OCR backends on an image (results are cached) and return
+    its Gemini cache key if they were not confident, else None.
+    """
+    try:
+        file_hash = file_sha256(image_path)
+    except OSError:
+        return None
+    key = ocr_backend_cache_key(file_hash, "gemini", "image")
+    if ocr_cache_get(key) is not None:
+        return None
+    local = route_ocr(image_path, max_cost=OCR_BACKENDS["gemini"]["cost"] - 1, file_hash=file_hash)
+    if local is None or local[1] < OCR_CONFIDENCE_THRESHOLD:
+        return key
+    return None
+
+def prefetch_gemini_ocr(image_paths, workers=1, executor=None):
+    """
+    OCR every uncached image in packed Gemini requests and store the results in
+    the OCR cache. The cheaper backends read every image first, in parallel on
+    executor (or a pool of `workers` threads), and only what they could not
+    read confidently is sent. Images a response failed to account for are left
+    for the normal single-image path. Returns the number of requests sent.
+    """
+    if not (GENAI_AVAILABLE and PIL_AVAILABLE and OCR_CACHE_ENABLED) or GEMINI_OCR_BATCH_SIZE < 2:
+        return 0
+    if ENABLED_OCR_BACKENDS is not None and "gemini" not in ENABLED_OCR_BACKENDS:
+        return 0
+    image_paths = list(dict.fromkeys(image_paths))
+    if len(image_paths) < 2:
+        return 0
+    if executor is None:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(image_paths)))) as pool:
+            return prefetch_gemini_ocr(image_paths, workers, pool)
     
-    # Check for hardcoded values when input is expected
-    if 'input(' not in code and not any('def ' in line for line in lines):
-        if any(char.isdigit() for char in code):
-            mistake_points.append("• Possible hardcoded values instead of parameters")
+    pending = {}
+    for image_path, key in zip(image_paths, executor.map(needs_gemini_ocr, image_paths)):
+        if key is not None and key not in pending:
+            pending[key] = image_path
+    if len(pending) < 2:
+        return 0
     
-    # Check for infinite loops
-    if 'while True:' in code and 'break' not in code:
-        mistake_points.append("• Potential infinite loop detected")
+    encoded = []
+    for key, image_path in pending.items():
+        try:
+            encoded.append((key, encode_image_for_request(image_path)))
+        except Exception as e:
+            print(f"Could not prepare {image_path} for batched OCR: {e}")
+    batches = pack_ocr_requests(encoded)
+    print(f"OCR: {len(encoded)} images in {len(batches)} batched Gemini requests...")
     
-    # Check for unused variables (simple check)
-    import_lines = [l for l in lines if l.strip().startswith('import')]
-    if import_lines:
-        for imp in import_lines:
-            module = imp.split()[1].split('.')[0]
-            if module not in code.replace(imp, ''):
-                mistake_points.append(f"• Unused import: {module}")
+    missing = 0
+    futures = {executor.submit(gemini_ocr_request, batch): batch for batch in batches}
+    for future in as_completed(futures):
+        batch = futures[future]
+        try:
+            texts = future.result()
+        except Exception as e:
+            print(f"Batched Gemini OCR failed: {e}. Those images will be read one at a time...")
+            continue
+        for key, text in texts.items():
+            ocr_cache_put_result(key, text, 1.0)
+        missing += len(batch) - len(texts)
+    if missing:
+        print(f"OCR: {missing} image(s) were missing from batched responses and will be read one at a time")
+    return len(batches)
+
+# =========================
+# FILE UPLOAD FUNCTION
+# =========================
+def select_image_file():
+    """Open file dialog to select an image file or PDF."""
+    root = tk.Tk()
+    root.withdraw()  # Hide the main window
+    root.attributes('-topmost', True)  # Bring dialog to front
     
-    if mistake_points:
-        return "Code has issues (see mistake points)", mistake_points
+    file_path = filedialog.askopenfilename(
+        title="Select Image File or PDF with Student Submission",
+        filetypes=[
+            ("All supported files", "*.jpg *.jpeg *.png *.pdf"),
+            ("Image files", "*.jpg *.jpeg *.png"),
+            ("PDF files", "*.pdf"),
+            ("All files", ".")
+        ]
+    )
     
-    return "No syntax errors found", []
+    root.destroy()
+    return file_path
 
 # =========================
-# STEP 4: SUBMISSION EVALUATION WITH MARKING SCHEME
+# SUBMISSION PARSING FUNCTIONS
 # =========================
-def evaluate_submission_with_marking_scheme(sections, problem_text):
+SECTION_ORDER = ["aim", "algorithm", "program", "output", "result"]
+SECTION_HEADER_ALIASES = {
+    "aim": ["aim", "objective"],
+    "algorithm": ["algorithm", "procedure"],
+    "program": ["source code", "program", "code"],
+    "output": ["output", "execution"],
+    "result": ["result", "conclusion"],
+}
+HEADER_TO_SECTION = {alias: section for section, aliases in SECTION_HEADER_ALIASES.items() for alias in aliases}
+SECTION_RANK = {section: rank for rank, section in enumerate(SECTION_ORDER)}
+# A header is an alias at the start of a line followed by ':', '. ' or the end of the line
+SECTION_HEADER_RE = re.compile(
+    r"^[ \t]*(" + "|".join(sorted(HEADER_TO_SECTION, key=len, reverse=True)) + r")[ \t]*(?::|\.(?=\s)|(?=\n|$))",
+    re.IGNORECASE | re.MULTILINE
+)
+
+def locate_sections(text_content):
     """
-    Evaluate student submission with the specified marking scheme:
-    Aim=10, Algorithm=15, Program=50, Output=15, Result=10
+    Find every section in one linear scan over the header tokens.
+    A section's body runs from its first header to the next header of any
+    later section (or the end of the text), so repeated or earlier headers
+    inside a body - e.g. 'Code:' inside the Program - stay part of it.
+    Returns {section: (body_start, body_end)}; body_end is None when the
+    section runs to the end of the text.
     """
-    if not GENAI_AVAILABLE:
-        print("Google Generative AI package not installed. Using offline mode.")
-        return offline_evaluate_submission(sections, problem_text)
+    spans = {}
+    # Earliest header start seen so far (scanning backwards) for each section rank
+    next_start = [None] * len(SECTION_ORDER)
+    headers = [
+        (SECTION_RANK[HEADER_TO_SECTION[match.group(1).lower()]], match.start(), match.end())
+        for match in SECTION_HEADER_RE.finditer(text_content)
+    ]
+    for rank, start, end in reversed(headers):
+        later = [pos for pos in next_start[rank + 1:] if pos is not None]
+        spans[SECTION_ORDER[rank]] = (end, min(later) if later else None)
+        next_start[rank] = start
+    return spans
+
+def find_completed_sections(text_content):
+    """
+    Return the sections of partial text whose extent is already known, i.e.
+    each section header that is followed by a later section's header.
+    Used to start evaluating early sections while later pages are still being read.
+    """
+    return {
+        section: text_content[body_start:body_end].strip()
+        for section, (body_start, body_end) in locate_sections(text_content).items()
+        if body_end is not None
+    }
+
+def parse_submission_sections_with_confidence(text_content):
+    """
+    Parse the extracted text into Aim, Algorithm, Program, Output and Result sections.
+    Returns (sections, confidence); Gemini is only asked to re-split the text
+    when the offline recognizers are less confident than SECTION_CONFIDENCE_THRESHOLD.
+    """
+    sections = {section: "" for section in SECTION_ORDER}
     
-    try:
-        client = genai.Client(api_key=API_KEY)
-        
-        # First evaluate if Aim, Algorithm and Result are related to the question
-        relevance_prompt = f"""
-        Evaluate if the following sections are relevant to the given question.
-        
-        Question: {problem_text}
-        
-        AIM:
-        {sections['aim']}
-        
-        ALGORITHM:
-        {sections['algorithm']}
-        
-        RESULT:
-        {sections['result']}
-        
-        For each section, provide:
-        1. A score out of 10 for relevance to the question
-        2. Brief explanation for the score
-        3. Whether the section is directly related to the question (yes/no)
-        
-        Format your response as:
-        
-        AIM EVALUATION:
-        Score: [0-10]
-        Explanation: [brief explanation]
-        Related: [yes/no]
-        
-        ALGORITHM EVALUATION:
-        Score: [0-10]
-        Explanation: [brief explanation]
-        Related: [yes/no]
-        
-        RESULT EVALUATION:
-        Score: [0-10]
-        Explanation: [brief explanation]
-        Related: [yes/no]
-        """
-        
-        relevance_response = client.models.generate_content(
-            model="gemini-2.0-flash-exp", contents=relevance_prompt
-        )
-        
-        relevance_text = relevance_response.text if hasattr(relevance_response, 'text') else ""
-        
-        # Now evaluate the Program and Output sections in detail
-        program_prompt = f"""
-        Evaluate the following program code against the given question.
-        
-        Question: {problem_text}
-        
-        Program Code:
-        {sections['program']}
-        
-        Output:
-        {sections['output']}
-        
-        Provide a detailed evaluation with these specific scores:
-        
-        1. CORRECTNESS (0-10): Does the code solve the problem correctly?
-           - Does it produce the expected output?
-           - Are all requirements met?
-           - Does it handle inputs correctly?
-        
-        2. EFFICIENCY (0-10): How efficient is the solution?
-           - Is the algorithm efficient?
-           - Is the approach logical and well-reasoned?
-           - Are edge cases handled properly?
-        
-        3. CODE QUALITY (0-10): How well is the code written?
-           - Is the code well-organized?
-           - Are variable names meaningful?
-           - Is there proper indentation and formatting?
-           - Are there comments where needed?
+    for section, (body_start, body_end) in locate_sections(text_content).items():
+        sections[section] = text_content[body_start:body_end].strip()
+    header_sections = {section for section in SECTION_ORDER if sections[section]}
+    
+    # Headers were missing or garbled: try the offline recognizer before the model.
+    # It also honours exact headers, so its split replaces the partial one.
+    confidence = 1.0
+    if not sections["aim"] or not sections["algorithm"] or not sections["program"]:
+        recovered, evidence = recognize_sections_offline(text_content)
+        for section in SECTION_ORDER:
+            if recovered[section]:
+                sections[section] = recovered[section]
+            elif sections[section]:
+                evidence[section] = 1.0
+        header_sections = {section for section in SECTION_ORDER if evidence.get(section) == 1.0}
+        confidence = section_confidence(evidence)
+    
+    # If the sections are still uncertain, try to use Gemini to extract them
+    if GENAI_AVAILABLE and confidence < SECTION_CONFIDENCE_THRESHOLD:
+        try:
+            prompt = f"""
+            Extract the following sections from this student submission:
+            - Aim/Objective
+            - Algorithm/Procedure
+            - Program/Code
+            - Output/Execution
+            - Result/Conclusion
+            
+            Format your response as:
+            
+            AIM:
+            [extracted aim]
+            
+            ALGORITHM:
+            [extracted algorithm]
+            
+            PROGRAM:
+            [extracted program]
+            
+            OUTPUT:
+            [extracted output]
+            
+            RESULT:
+            [extracted result]
+            
+            Here is the submission text:
+            {text_content}
+            """
+            
+            ai_sections = generate_text(prompt)
+            
+            if ai_sections:
+                # Parse the response to extract sections
+                for section in sections.keys():
+                    section_pattern = rf"{section.upper()}:\s*\n(.*?)(?=\n\w+:|$)"
+                    section_match = re.search(section_pattern, ai_sections, re.DOTALL | re.IGNORECASE)
+                    # Model output replaces guesses but never sections found by their headers
+                    if section_match and section not in header_sections:
+                        sections[section] = section_match.group(1).strip()
+        except Exception as e:
+            print(f"Error using Gemini to parse sections: {e}")
+    
+    return sections, confidence
+
+@timed_stage("parse")
+def parse_submission_sections(text_content):
+    """
+    Parse the extracted text into Aim, Algorithm, Program, Output and Result sections.
+    """
+    return parse_submission_sections_with_confidence(text_content)[0]
+
+# =========================
+# OFFLINE SECTION RECOGNITION
+# =========================
+SECTION_CONFIDENCE_THRESHOLD = 0.7
+SECTION_WEIGHTS = {"aim": 0.2, "algorithm": 0.2, "program": 0.4, "output": 0.1, "result": 0.1}
+FUZZY_HEADER_CUTOFF = 0.8
+OCR_CONFUSIONS = str.maketrans({"0": "o", "1": "l", "|": "l", "5": "s", "$": "s", "@": "a"})
+# Letters OCR misreads as one another; the only substitutions accepted in short headers
+OCR_LETTER_CONFUSIONS = {frozenset(pair) for pair in ("il", "lt", "ij", "ce", "co", "ao", "ae", "mn", "hb", "uv")}
+CODE_LINE_RE = re.compile(
+    r"^\s*(?:def |class |import |from \S+ import |for |while |if |elif |else\s*:|try\s*:|except|finally\s*:|"
+    r"return\b|print\s*\(|with |@|#)"
+    r"|^\s*[A-Za-z_][\w.\[\]]*\s*(?:[-+*/%]|//)?=[^=]"
+    r"|^(?: {2,}|\t)\S"
+)
+ALGORITHM_STEP_RE = re.compile(r"^\s*(?:step\s*\d+|\d+\s*[.)])", re.IGNORECASE)
+RESULT_HINT_RE = re.compile(r"\b(?:successfully|verified|executed|thus the|hence the)\b", re.IGNORECASE)
+
+def match_fuzzy_header(line):
+    """
+    Return (section, similarity, inline_text) if the line looks like a section
+    header, tolerating OCR typos such as 'Algorlthm' or 'Pr0gram'; otherwise None.
+    """
+    stripped = line.strip()
+    if not stripped:
+        return None
+    match = re.match(r"([^:.]+)(?::|\.(?=\s|$))\s*(.*)$", stripped)
+    if match:
+        head, rest = match.groups()
+    else:
+        # A header without ':' or '.' must be a short line on its own
+        head, rest = stripped, ""
+    if len(head.split()) > 2 or re.search(r"[()=\[\]{}\"']", head):
+        return None
+    
+    normalized = re.sub(r"[^a-z ]", "", head.lower().translate(OCR_CONFUSIONS)).strip()
+    if not normalized:
+        return None
+    if normalized in HEADER_TO_SECTION:
+        return HEADER_TO_SECTION[normalized], 1.0, rest.strip()
+    close = difflib.get_close_matches(normalized, HEADER_TO_SECTION, n=1, cutoff=FUZZY_HEADER_CUTOFF)
+    if not close and match:
+        # One misread letter costs a short header too much similarity ('Alm:' for 'Aim:'),
+        # so with an explicit ':' or '.' a single substituted letter is accepted
+        close = [name for name in HEADER_TO_SECTION if is_header_misread(normalized, name)][:1]
+    if not close:
+        return None
+    similarity = difflib.SequenceMatcher(None, normalized, close[0]).ratio()
+    return HEADER_TO_SECTION[close[0]], similarity, rest.strip()
+
+def is_header_misread(word, alias):
+    """
+    True if word is alias with one letter substituted. Short aliases collide with
+    ordinary words ('Mode' for 'code', 'Him' for 'aim'), so below five letters the
+    substitution must be a pair OCR actually confuses ('Alm' for 'aim').
+    """
+    if len(word) != len(alias) or len(alias) < 3:
+        return False
+    differences = [(a, b) for a, b in zip(alias, word) if a != b]
+    if len(differences) != 1:
+        return False
+    return len(alias) >= 5 or frozenset(differences[0]) in OCR_LETTER_CONFUSIONS
+
+def parses_as_python(code):
+    try:
+        ast.parse(code)
+        return True
+    except (SyntaxError, ValueError):
+        return False
+
+def find_code_block(lines):
+    """
+    Find the largest run of code-like lines (blank lines allowed inside).
+    Returns (start, end, parses) with end exclusive, or None.
+    """
+    best = None
+    start = None
+    last_code = None
+    for i, line in enumerate(lines + [""]):
+        if i < len(lines) and CODE_LINE_RE.match(line):
+            if start is None:
+                start = i
+            last_code = i
+        elif i < len(lines) and not line.strip() and start is not None:
+            continue
+        elif start is not None:
+            if best is None or last_code + 1 - start > best[1] - best[0]:
+                best = (start, last_code + 1)
+            start = None
+    if best is None or best[1] - best[0] < 2:
+        return None
+    return best[0], best[1], parses_as_python("\n".join(lines[best[0]:best[1]]))
+
+def recognize_sections_offline(text_content):
+    """
+    Recover sections without a model call, using fuzzy header matching,
+    Python code detection for the Program block and line heuristics for the rest.
+    Returns (sections, evidence) where evidence maps each found section to 0-1.
+    """
+    lines = text_content.splitlines()
+    owner = [None] * len(lines)
+    found = {}
+    evidence = {}
+    current = None
+    
+    for i, line in enumerate(lines):
+        header = match_fuzzy_header(line)
+        if header and header[0] not in found and (current is None or SECTION_RANK[header[0]] > SECTION_RANK[current]):
+            current, similarity, inline_text = header
+            found[current] = [inline_text] if inline_text else []
+            evidence[current] = similarity
+            owner[i] = current
+        elif current is not None:
+            found[current].append(line)
+            owner[i] = current
+    
+    sections = {section: "\n".join(body).strip() for section, body in found.items()}
+    
+    # Locate the program by its code when no usable Program header was found
+    unowned = [i for i, section in enumerate(owner) if section is None]
+    if not sections.get("program") and unowned:
+        block = find_code_block([lines[i] if owner[i] is None else "" for i in range(len(lines))])
+        if block:
+            start, end, parses = block
+            sections["program"] = "\n".join(lines[start:end]).strip()
+            evidence["program"] = 0.9 if parses else 0.5
+            for i in range(start, end):
+                owner[i] = "program"
+    
+    # Unlabelled text around the program: numbered steps before it are the
+    # algorithm, other prose before it is the aim; after it comes output, then result
+    program_lines = [i for i, section in enumerate(owner) if section == "program"]
+    if program_lines:
+        before = [i for i in range(program_lines[0]) if owner[i] is None and lines[i].strip()]
+        after = [i for i in range(program_lines[-1] + 1, len(lines)) if owner[i] is None and lines[i].strip()]
         
-        4. OUTPUT CORRECTNESS (0-10): Is the output correct?
-           - Does it match expected results?
-           - Is it formatted properly?
-           - Is it complete?
+        if not sections.get("algorithm"):
+            steps = [i for i in before if ALGORITHM_STEP_RE.match(lines[i])]
+            if steps:
+                sections["algorithm"] = "\n".join(lines[steps[0]:steps[-1] + 1]).strip()
+                evidence["algorithm"] = 0.7
+                before = [i for i in before if i < steps[0]]
+        if not sections.get("aim") and before:
+            sections["aim"] = "\n".join(lines[i] for i in before).strip()
+            evidence["aim"] = 0.6
         
-        5. OUTPUT PRESENTATION (0-10): How well is the output presented?
-           - Is it clear and readable?
-           - Does it provide necessary information?
-           - Is it well-formatted?
+        result_start = next((i for i in after if RESULT_HINT_RE.search(lines[i])), None)
+        if not sections.get("result") and result_start is not None:
+            sections["result"] = "\n".join(lines[i] for i in after if i >= result_start).strip()
+            evidence["result"] = 0.5
+            after = [i for i in after if i < result_start]
+        if not sections.get("output") and after:
+            sections["output"] = "\n".join(lines[i] for i in after).strip()
+            evidence["output"] = 0.5
+    
+    sections = {section: sections.get(section, "") for section in SECTION_ORDER}
+    evidence = {section: score for section, score in evidence.items() if sections[section]}
+    return sections, evidence
+
+def section_confidence(evidence):
+    """Weighted 0-1 confidence that the recovered sections are complete and correct."""
+    return round(sum(SECTION_WEIGHTS[section] * score for section, score in evidence.items()), 3)
+
+# =========================
+# STEP 1: CODE INPUT (TEXT OR IMAGE)
+# =========================
+def get_code_from_user():
+    """
+    Get code input from user - either typed/pasted or from an uploaded image file.
+    """
+    print("\n" + "="*50)
+    print("CODE INPUT OPTIONS:")
+    print("1. Type/paste code directly")
+    print("2. Upload image file (JPG/PNG) - File dialog will open")
+    print("="*50)
+    
+    choice = input("Enter your choice (1 or 2): ").strip()
+    
+    if choice == "2":
+        # Image input with file dialog
+        if not PIL_AVAILABLE or not GENAI_AVAILABLE:
+            print("Error: Image input requires PIL and google-generativeai packages.")
+            print("Falling back to text input...")
+            choice = "1"
+        else:
+            print("\nOpening file dialog...")
+            print("(If dialog doesn't appear, check behind other windows)")
+            image_path = select_image_file()
+            
+            if image_path:
+                print(f"Selected file: {os.path.basename(image_path)}")
+                print("Extracting code from image...")
+                code = extract_text_from_image(image_path)
+                if code:
+                    print("\n=== Extracted Code ===")
+                    print(code)
+                    print("="*50)
+                    confirm = input("\nUse this extracted code? (y/n): ").strip().lower()
+                    if confirm == 'y':
+                        return code
+                    else:
+                        print("Falling back to text input...")
+                        choice = "1"
+                else:
+                    print("Failed to extract code from image. Falling back to text input...")
+                    choice = "1"
+            else:
+                print("No file selected. Falling back to text input...")
+                choice = "1"
+    
+    # Text input (default)
+    if choice == "1" or choice != "2":
+        print("\nEnter/paste your code below. Type 'END' in a new line when finished:")
+        lines = []
+        while True:
+            line = input()
+            if line.strip().upper() == "END":
+                break
+            lines.append(line)
+        return "\n".join(lines)
+
+# =========================
+# STEP 1b: MAX MARKS INPUT WITH VALIDATION
+# =========================
+def get_max_marks():
+    while True:
+        try:
+            marks = float(input("\nEnter the maximum marks for this question: "))
+            if marks <= 0:
+                print("Marks must be positive!")
+                continue
+            return marks
+        except ValueError:
+            print("Invalid input! Please enter a numeric value for marks.")
+
+# =========================
+# STEP 2: PROBLEM PARSING
+# =========================
+def build_problem_analysis_prompt(problem_text):
+    return f"""
+        Analyze the problem statement and extract:
+        1. Required function name
+        2. Input parameters and their types
+        3. Expected output type and format
+        4. Edge cases to consider
+        5. Key algorithmic concepts needed (loops, conditions, recursion, etc.)
+        6. Common mistakes students might make
         
-        Also provide:
-        - List of specific mistakes or issues found
-        - Brief summary of strengths and weaknesses
+        Problem: {problem_text}
         
-        Format your response with clear sections and numeric scores.
+        Format the response clearly with sections.
         """
+
+def build_common_mistakes_prompt(problem_text):
+    return f"""
+        Based on this problem, list the 5-7 most common mistakes students make when solving it.
+        Be specific about coding errors, logic errors, and edge case handling.
         
-        program_response = client.models.generate_content(
-            model="gemini-2.0-flash-exp", contents=program_prompt
-        )
-        
-        program_text = program_response.text if hasattr(program_response, 'text') else ""
-        
-        # Calculate scores based on the marking scheme
-        scores = parse_submission_scores(relevance_text, program_text)
-        
-        # Combine evaluation texts
-        evaluation_text = f"""
-        SUBMISSION EVALUATION
-        
-        {relevance_text}
+        Problem: {problem_text}
         
-        {program_text}
+        Format as a numbered list.
         """
+
+def parse_problem_with_gemini(problem_text):
+    """
+    Use Gemini to parse problem requirements and identify expected solution patterns.
+    """
+    if not GENAI_AVAILABLE:
+        print("Google Generative AI package not installed. Using offline mode.")
+        return offline_parse_problem(problem_text), []
+    
+    try:
+        analysis = generate_text(build_problem_analysis_prompt(problem_text), PRIORITY_PROBLEM)
+        
+        # Extract common mistakes
+        common_mistakes = generate_text(build_common_mistakes_prompt(problem_text), PRIORITY_PROBLEM)
         
-        return evaluation_text, scores
+        return analysis, common_mistakes
     except Exception as e:
         print(f"API Error: {str(e)}")
         print("Falling back to offline mode...")
-        return offline_evaluate_submission(sections, problem_text)
+        return offline_parse_problem(problem_text), []
+
+def offline_parse_problem(problem_text):
+    """
+    Basic offline parsing of problem requirements.
+    """
+    function_match = re.search(r'function\s+(\w+)|def\s+(\w+)', problem_text, re.IGNORECASE)
+    function_name = "Unknown"
+    if function_match:
+        function_name = function_match.group(1) or function_match.group(2)
+    
+    return f"""
+    Problem Analysis:
+    
+    1. Required function name: {function_name}
+    2. Input parameters: Based on problem description
+    3. Expected output: Based on problem requirements
+    4. Edge cases: Empty input, invalid input, boundary conditions
+    5. Key concepts: Based on problem complexity
+    """
+
+# =========================
+# STEP 3: CODE VALIDATION
+# =========================
+# Registered offline code checks, keyed by rule id
+CODE_RULES = {}
+# Rule ids to run for the current assignment; None runs every registered rule
+ENABLED_RULES = None
+# Cumulative time spent per rule (plus the shared parse) across a batch
+RULE_STATS = {}
+_rule_stats_lock = threading.Lock()
+DEFAULT_MISTAKE_PENALTY = 0.03
+# Rule penalties are fractions of the Program marks; their sum is capped here
+RULE_PENALTY_CAP = 0.2
+
+def register_rule(rule_id, severity, penalty, description):
+    """
+    Register an offline code check. The decorated function receives the
+    shared code context (see build_code_context) and returns a list of
+    (line, message) pairs; line is None for whole-program findings.
+    """
+    def decorator(check):
+        CODE_RULES[rule_id] = {
+            "id": rule_id,
+            "severity": severity,
+            "penalty": penalty,
+            "description": description,
+            "check": check,
+        }
+        return check
+    return decorator
+
+def record_rule_time(rule_id, seconds, findings=0):
+    with _rule_stats_lock:
+        stats = RULE_STATS.setdefault(rule_id, {"calls": 0, "seconds": 0.0, "findings": 0})
+        stats["calls"] += 1
+        stats["seconds"] += seconds
+        stats["findings"] += findings
+
+def print_rule_stats():
+    """Print per-rule timing, slowest first, so slow rules can be found and dropped."""
+    if not RULE_STATS:
+        return
+    print("Code rule timing:")
+    for rule_id, stats in sorted(RULE_STATS.items(), key=lambda item: -item[1]["seconds"]):
+        average_ms = stats["seconds"] / stats["calls"] * 1000
+        print(f"  {rule_id:<20} {stats['seconds'] * 1000:9.2f} ms total  {average_ms:7.3f} ms/call  "
+              f"{stats['calls']:6d} calls  {stats['findings']:6d} findings")
+
+def build_code_context(code):
+    """
+    Parse code once into the representation every rule shares: the tree,
+    the source lines and an index of nodes by type, built in one traversal.
+    Raises SyntaxError (including IndentationError) like compile().
+    """
+    started = time.perf_counter()
+    tree = ast.parse(code, "<string>")
+    compile(tree, "<string>", "exec")
+    nodes = {}
+    for node in ast.walk(tree):
+        nodes.setdefault(type(node), []).append(node)
+    context = {"code": code, "lines": code.split('\n'), "tree": tree, "nodes": nodes}
+    record_rule_time("(parse)", time.perf_counter() - started)
+    return context
+
+def nodes_of(context, *node_types):
+    return [node for node_type in node_types for node in context["nodes"].get(node_type, [])]
+
+def called_names(context):
+    return {node.func.id for node in nodes_of(context, ast.Call) if isinstance(node.func, ast.Name)}
+
+def run_code_rules(context, rule_ids=None):
+    """Run the enabled rules over a shared code context; returns finding dicts sorted by line."""
+    if rule_ids is None:
+        rule_ids = ENABLED_RULES if ENABLED_RULES is not None else list(CODE_RULES)
+    findings = []
+    for rule_id in rule_ids:
+        rule = CODE_RULES.get(rule_id)
+        if rule is None:
+            continue
+        started = time.perf_counter()
+        results = rule["check"](context) or []
+        record_rule_time(rule_id, time.perf_counter() - started, len(results))
+        for line, message in results:
+            findings.append({
+                "rule": rule_id,
+                "severity": rule["severity"],
+                "penalty": rule["penalty"],
+                "line": line,
+                "message": message,
+            })
+    findings.sort(key=lambda finding: (finding["line"] is not None, finding["line"] or 0))
+    return findings
+
+def format_finding(finding):
+    if finding["line"] is None:
+        return f"• {finding['message']}"
+    return f"• {finding['message']} (line {finding['line']})"
+
+# --- Built-in rules ---
+
+@register_rule("no-function", "warning", DEFAULT_MISTAKE_PENALTY, "Program defines no function")
+def rule_no_function(context):
+    if not nodes_of(context, ast.FunctionDef, ast.AsyncFunctionDef):
+        return [(None, "No function definition found")]
+    return []
+
+@register_rule("no-output", "warning", DEFAULT_MISTAKE_PENALTY, "Program neither returns nor prints anything")
+def rule_no_output(context):
+    if not nodes_of(context, ast.Return) and "print" not in called_names(context):
+        return [(None, "No return statement or print output found")]
+    return []
+
+@register_rule("empty-except", "warning", DEFAULT_MISTAKE_PENALTY, "Except block that only passes")
+def rule_empty_except(context):
+    findings = []
+    for handler in nodes_of(context, ast.ExceptHandler):
+        if all(isinstance(stmt, ast.Pass) or
+               (isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Constant) and stmt.value.value is Ellipsis)
+               for stmt in handler.body):
+            findings.append((handler.lineno, "Empty except block found (poor error handling)"))
+    return findings
+
+@register_rule("hardcoded-values", "info", DEFAULT_MISTAKE_PENALTY, "Numbers hardcoded where input is expected")
+def rule_hardcoded_values(context):
+    if "input" in called_names(context) or nodes_of(context, ast.FunctionDef, ast.AsyncFunctionDef):
+        return []
+    if any(isinstance(node.value, (int, float, complex)) and not isinstance(node.value, bool)
+           for node in nodes_of(context, ast.Constant)):
+        return [(None, "Possible hardcoded values instead of parameters")]
+    return []
+
+def loop_can_exit(loop):
+    """True if a while loop's body has a break at its own level, or any return/raise."""
+    stack = list(loop.body)
+    while stack:
+        node = stack.pop()
+        if isinstance(node, (ast.Return, ast.Raise)):
+            return True
+        if isinstance(node, ast.Break):
+            return True
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda, ast.ClassDef)):
+            continue
+        if isinstance(node, (ast.For, ast.AsyncFor, ast.While)):
+            # A nested loop's break only leaves that loop, but return/raise still exit
+            stack.extend(child for child in ast.walk(node)
+                         if isinstance(child, (ast.Return, ast.Raise)))
+            continue
+        stack.extend(ast.iter_child_nodes(node))
+    return False
+
+@register_rule("infinite-loop", "error", 0.05, "while True loop with no way out")
+def rule_infinite_loop(context):
+    return [
+        (loop.lineno, "Potential infinite loop detected")
+        for loop in nodes_of(context, ast.While)
+        if isinstance(loop.test, ast.Constant) and bool(loop.test.value) and not loop_can_exit(loop)
+    ]
+
+@register_rule("unused-import", "info", DEFAULT_MISTAKE_PENALTY, "Imported name never used")
+def rule_unused_import(context):
+    imported = {}
+    for node in nodes_of(context, ast.Import):
+        for alias in node.names:
+            imported.setdefault(alias.asname or alias.name.split('.')[0], node.lineno)
+    for node in nodes_of(context, ast.ImportFrom):
+        if node.module == "__future__":
+            continue
+        for alias in node.names:
+            if alias.name != "*":
+                imported.setdefault(alias.asname or alias.name, node.lineno)
+    used = {node.id for node in nodes_of(context, ast.Name)}
+    return [(line, f"Unused import: {name}") for name, line in imported.items() if name not in used]
+
+@register_rule("missing-return", "warning", DEFAULT_MISTAKE_PENALTY, "Function returns a value on only some paths")
+def rule_missing_return(context):
+    return [
+        (function.lineno, f"Function '{function.name}' does not return a value on every path")
+        for function in nodes_of(context, ast.FunctionDef, ast.AsyncFunctionDef)
+        if returns_value(function.body) and can_fall_through(function.body)
+    ]
+
+def returns_value(body):
+    """True if any return statement in this function body (not nested functions) returns a value."""
+    stack = list(body)
+    while stack:
+        node = stack.pop()
+        if isinstance(node, ast.Return) and node.value is not None:
+            return True
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda, ast.ClassDef)):
+            stack.extend(ast.iter_child_nodes(node))
+    return False
+
+def can_fall_through(body):
+    """True if control can reach the end of this statement list without returning or raising."""
+    if not body:
+        return True
+    last = body[-1]
+    if isinstance(last, (ast.Return, ast.Raise)):
+        return False
+    if isinstance(last, ast.If):
+        return can_fall_through(last.body) or can_fall_through(last.orelse)
+    if isinstance(last, (ast.With, ast.AsyncWith)):
+        return can_fall_through(last.body)
+    if isinstance(last, ast.Try):
+        if last.finalbody and not can_fall_through(last.finalbody):
+            return False
+        return (can_fall_through(last.orelse or last.body) or
+                any(can_fall_through(handler.body) for handler in last.handlers))
+    if isinstance(last, ast.While) and isinstance(last.test, ast.Constant) and bool(last.test.value):
+        return any(isinstance(node, ast.Break) for node in ast.walk(last))
+    if hasattr(ast, "Match") and isinstance(last, ast.Match):
+        # Without an unguarded catch-all case (case _: or a bare name), no arm may run
+        exhaustive = any(
+            isinstance(case.pattern, ast.MatchAs) and case.pattern.pattern is None and case.guard is None
+            for case in last.cases
+        )
+        return not exhaustive or any(can_fall_through(case.body) for case in last.cases)
+    if isinstance(last, ast.Expr) and isinstance(last.value, ast.Call):
+        func = last.value.func
+        # sys.exit() / exit() never return
+        if isinstance(func, ast.Attribute) and func.attr == "exit":
+            return False
+        if isinstance(func, ast.Name) and func.id in ("exit", "quit"):
+            return False
+    return True
+
+@timed_stage("code_checks", lambda result: {"findings": len(result[1])})
+def check_code(code, rule_ids=None):
+    """
+    Parse code once and run the enabled rules over it.
+    Returns (error_message, findings); a syntax error yields a single error finding.
+    """
+    try:
+        context = build_code_context(code)
+    except IndentationError as e:
+        return f"Indentation Error: {str(e)}", [{
+            "rule": "syntax", "severity": "error", "penalty": DEFAULT_MISTAKE_PENALTY,
+            "line": e.lineno, "message": f"Indentation Error: {e.msg}"}]
+    except SyntaxError as e:
+        return f"Syntax Error: {str(e)}", [{
+            "rule": "syntax", "severity": "error", "penalty": DEFAULT_MISTAKE_PENALTY,
+            "line": e.lineno, "message": f"Syntax Error: {e.msg}"}]
+    except Exception as e:
+        return f"Compilation Error: {str(e)}", [{
+            "rule": "syntax", "severity": "error", "penalty": DEFAULT_MISTAKE_PENALTY,
+            "line": None, "message": f"Compilation Error: {str(e)}"}]
+    
+    findings = run_code_rules(context, rule_ids)
+    if findings:
+        return "Code has issues (see mistake points)", findings
+    return "No syntax errors found", []
+
+def rule_penalty(findings):
+    """
+    Fraction of the marks lost to code check findings, at most RULE_PENALTY_CAP.
+    Findings carry their rule's penalty; plain mistake strings cost DEFAULT_MISTAKE_PENALTY.
+    """
+    return min(RULE_PENALTY_CAP, sum(
+        finding["penalty"] if isinstance(finding, dict) else DEFAULT_MISTAKE_PENALTY
+        for finding in findings
+    ))
+
+def apply_rule_penalties(scores, findings):
+    """
+    Take each finding's rule penalty off the Program marks, at most
+    RULE_PENALTY_CAP in total, and recompute the total.
+    """
+    if not findings:
+        return scores
+    penalty = rule_penalty(findings)
+    scores = dict(scores)
+    program = scores["program"]
+    scores["program"] = dict(program, score=round(program["score"] * (1 - penalty), 2))
+    scores["rule_penalty"] = round(penalty, 4)
+    scores["total"] = dict(scores["total"], score=submission_total(scores))
+    return scores
+
+def validate_code(code):
+    """
+    Check for syntax errors and basic code issues.
+    Returns (error_message, mistake_points)
+    """
+    error_message, findings = check_code(code)
+    return error_message, [format_finding(finding) for finding in findings]
+
+def check_program_section(sections):
+    """Run the offline code rules over the extracted program, if there is one."""
+    if not sections.get("program"):
+        return None
+    return check_code(sections["program"])[1]
+
+# =========================
+# STEP 4: SUBMISSION EVALUATION WITH MARKING SCHEME
+# =========================
+RELEVANCE_SECTIONS = ("aim", "algorithm", "result")
+
+def build_relevance_prompt(sections, problem_text, section_names=RELEVANCE_SECTIONS):
+    """Prompt that scores Aim, Algorithm and Result (or a subset) for relevance to the question."""
+    section_blocks = "".join(
+        f"""{name.upper()}:
+        {sections[name]}
+        
+        """
+        for name in section_names
+    )
+    format_blocks = "\n        \n        ".join(
+        f"""{name.upper()} EVALUATION:
+        Score: [0-10]
+        Explanation: [brief explanation]
+        Related: [yes/no]"""
+        for name in section_names
+    )
+    return f"""
+        Evaluate if the following sections are relevant to the given question.
+        
+        Question: {problem_text}
+        
+        {section_blocks}For each section, provide:
+        1. A score out of 10 for relevance to the question
+        2. Brief explanation for the score
+        3. Whether the section is directly related to the question (yes/no)
+        
+        Format your response as:
+        
+        {format_blocks}
+        """
+
+def build_program_prompt(sections, problem_text, include_output=True):
+    """
+    Prompt that scores the Program and Output sections in detail.
+    With include_output=False the Output section and its two scores are left
+    out, for when the output has already been verified by running the program.
+    """
+    output_block = f"""        Output:
+        {sections['output']}
+        
+""" if include_output else ""
+    output_scores = """        4. OUTPUT CORRECTNESS (0-10): Is the output correct?
+           - Does it match expected results?
+           - Is it formatted properly?
+           - Is it complete?
+        
+        5. OUTPUT PRESENTATION (0-10): How well is the output presented?
+           - Is it clear and readable?
+           - Does it provide necessary information?
+           - Is it well-formatted?
+        
+""" if include_output else ""
+    return f"""
+        Evaluate the following program code against the given question.
+        
+        Question: {problem_text}
+        
+        Program Code:
+        {sections['program']}
+        
+{output_block}        Provide a detailed evaluation with these specific scores:
+        
+        1. CORRECTNESS (0-10): Does the code solve the problem correctly?
+           - Does it produce the expected output?
+           - Are all requirements met?
+           - Does it handle inputs correctly?
+        
+        2. EFFICIENCY (0-10): How efficient is the solution?
+           - Is the algorithm efficient?
+           - Is the approach logical and well-reasoned?
+           - Are edge cases handled properly?
+        
+        3. CODE QUALITY (0-10): How well is the code written?
+           - Is the code well-organized?
+           - Are variable names meaningful?
+           - Is there proper indentation and formatting?
+           - Are there comments where needed?
+        
+{output_scores}        Also provide:
+        - List of specific mistakes or issues found
+        - Brief summary of strengths and weaknesses
+        
+        Format your response with clear sections and numeric scores.
+        """
+
+def combine_evaluation_text(relevance_text, program_text):
+    return f"""
+        SUBMISSION EVALUATION
+        
+        {relevance_text}
+        
+        {program_text}
+        """
+
+def evaluate_submission_with_marking_scheme(sections, problem_text, include_output=True):
+    """
+    Evaluate student submission with the specified marking scheme:
+    Aim=10, Algorithm=15, Program=50, Output=15, Result=10
+    """
+    if not GENAI_AVAILABLE:
+        print("Google Generative AI package not installed. Using offline mode.")
+        return offline_evaluate_submission(sections, problem_text)
+    
+    try:
+        if STRUCTURED_EVALUATION_ENABLED:
+            return evaluate_submission_structured(sections, problem_text, include_output)
+        return evaluate_submission_chained(sections, problem_text, include_output)
+    except Exception as e:
+        if not OFFLINE_FALLBACK_ENABLED:
+            raise
+        print(f"API Error: {str(e)}")
+        print("Falling back to offline mode...")
+        return offline_evaluate_submission(sections, problem_text)
+
+def evaluate_submission_chained(sections, problem_text, include_output=True):
+    """Evaluate with the separate relevance and program prompts; API errors propagate."""
+    # First evaluate if Aim, Algorithm and Result are related to the question
+    relevance_text = generate_text(build_relevance_prompt(sections, problem_text))
+    
+    # Now evaluate the Program and Output sections in detail
+    program_text = generate_text(build_program_prompt(sections, problem_text, include_output))
+    
+    # Calculate scores based on the marking scheme
+    scores = parse_submission_scores(relevance_text, program_text)
+    
+    return combine_evaluation_text(relevance_text, program_text), scores
+
+def parse_submission_scores(relevance_text, program_text):
+    """
+    Parse scores from evaluation texts and calculate final scores based on marking scheme:
+    Aim=10, Algorithm=15, Program=50, Output=15, Result=10
+    """
+    ratings = {}
+    explanations = {}
+    
+    # Parse Aim, Algorithm and Result relevance scores (out of 10)
+    for section in ["aim", "algorithm", "result"]:
+        label = section.upper()
+        score_match = re.search(rf"{label} EVALUATION:.?Score:\s(\d+(?:\.\d+)?)", relevance_text, re.DOTALL)
+        if score_match:
+            ratings[section] = float(score_match.group(1))
+            
+            # Extract explanation
+            exp_match = re.search(rf"{label} EVALUATION:.?Explanation:\s(.*?)(?=Related:|$)", relevance_text, re.DOTALL)
+            if exp_match:
+                explanations[section] = exp_match.group(1).strip()
+    
+    # Parse Program and Output component scores (out of 10)
+    components = {
+        "correctness": r"CORRECTNESS.*?(\d+(?:\.\d+)?)/10",
+        "efficiency": r"EFFICIENCY.*?(\d+(?:\.\d+)?)/10",
+        "code_quality": r"CODE QUALITY.*?(\d+(?:\.\d+)?)/10",
+        "output_correctness": r"OUTPUT CORRECTNESS.*?(\d+(?:\.\d+)?)/10",
+        "output_presentation": r"OUTPUT PRESENTATION.*?(\d+(?:\.\d+)?)/10",
+    }
+    for key, pattern in components.items():
+        match = re.search(pattern, program_text, re.DOTALL)
+        if match:
+            ratings[key] = float(match.group(1))
+    
+    # Extract program explanation
+    strengths_match = re.search(r"strengths.?:(.?)(?=weaknesses|$)", program_text, re.DOTALL | re.IGNORECASE)
+    if strengths_match:
+        explanations["program"] = strengths_match.group(1).strip()
+    
+    return build_submission_scores(ratings, explanations)
+
+@timed_stage("scoring")
+def build_submission_scores(ratings, explanations):
+    """
+    Turn 0-10 ratings into marks for the scheme Aim=10, Algorithm=15, Program=50, Output=15, Result=10.
+    Missing relevance ratings score 0; missing program/output components default to 5.
+    """
+    scores = {
+        "aim": {"max": 10, "score": 0, "explanation": ""},
+        "algorithm": {"max": 15, "score": 0, "explanation": ""},
+        "program": {"max": 50, "score": 0, "explanation": ""},
+        "output": {"max": 15, "score": 0, "explanation": ""},
+        "result": {"max": 10, "score": 0, "explanation": ""},
+        "total": {"max": 100, "score": 0}
+    }
+    
+    for section, explanation in explanations.items():
+        scores[section]["explanation"] = explanation
+    
+    # Aim and Result are out of 10; Algorithm is out of 10, scaled to 15
+    scores["aim"]["score"] = ratings.get("aim", 0)
+    scores["algorithm"]["score"] = (ratings.get("algorithm", 0) / 10) * 15
+    scores["result"]["score"] = ratings.get("result", 0)
+    
+    correctness = ratings.get("correctness", 5)
+    efficiency = ratings.get("efficiency", 5)
+    quality = ratings.get("code_quality", 5)
+    
+    # Program score is weighted average of correctness (50%), efficiency (30%), quality (20%)
+    program_score = (correctness * 0.5 + efficiency * 0.3 + quality * 0.2) * 5  # Scale to 50
+    scores["program"]["score"] = program_score
+    
+    output_corr = ratings.get("output_correctness", 5)
+    output_pres = ratings.get("output_presentation", 5)
+    
+    # Output score is weighted average of correctness (70%) and presentation (30%)
+    output_score = (output_corr * 0.7 + output_pres * 0.3) * 1.5  # Scale to 15
+    scores["output"]["score"] = output_score
+    
+    scores["total"]["score"] = submission_total(scores)
+    # Keep the 0-10 ratings so deterministic checks can re-score single components
+    scores["ratings"] = dict(ratings)
+    
+    return scores
+
+def submission_total(scores):
+    """Sum of the section marks, never below 60."""
+    total_score = (
+        scores["aim"]["score"] +
+        scores["algorithm"]["score"] +
+        scores["program"]["score"] +
+        scores["output"]["score"] +
+        scores["result"]["score"]
+    )
+    
+    # Ensure minimum 60% if submission is completely unrelated
+    if total_score < 60:
+        total_score = 60
+    
+    return round(total_score, 2)
+
+def ratings_from_scores(scores):
+    """Recover 0-10 ratings from marks, for scores built without them (e.g. offline defaults)."""
+    if scores.get("ratings"):
+        return dict(scores["ratings"])
+    program = scores["program"]["score"] / 5
+    output = scores["output"]["score"] / 1.5
+    return {
+        "aim": scores["aim"]["score"],
+        "algorithm": scores["algorithm"]["score"] / 1.5,
+        "result": scores["result"]["score"],
+        "correctness": program,
+        "efficiency": program,
+        "code_quality": program,
+        "output_correctness": output,
+        "output_presentation": output,
+    }
+
+def rescore_submission(scores, rating_overrides):
+    """Rebuild the marks with some 0-10 ratings replaced, keeping every explanation."""
+    ratings = ratings_from_scores(scores)
+    ratings.update(rating_overrides)
+    explanations = {
+        section: scores[section]["explanation"]
+        for section in SECTION_ORDER if scores[section].get("explanation")
+    }
+    return build_submission_scores(ratings, explanations)
+
+def offline_evaluate_submission(sections, problem_text):
+    """
+    Offline evaluation of submission with default scores.
+    """
+    scores = {
+        "aim": {"max": 10, "score": 7, "explanation": "Basic aim provided but could be more specific."},
+        "algorithm": {"max": 15, "score": 10, "explanation": "Algorithm covers main steps but lacks detail."},
+        "program": {"max": 50, "score": 35, "explanation": "Program implements basic functionality."},
+        "output": {"max": 15, "score": 10, "explanation": "Output shows expected results."},
+        "result": {"max": 10, "score": 7, "explanation": "Result summarizes findings but lacks analysis."},
+        "total": {"max": 100, "score": 69}
+    }
+    
+    evaluation_text = f"""
+    SUBMISSION EVALUATION (OFFLINE MODE)
+    
+    AIM EVALUATION:
+    Score: 7/10
+    Explanation: Basic aim provided but could be more specific.
+    Related: Yes
+    
+    ALGORITHM EVALUATION:
+    Score: 6.7/10
+    Explanation: Algorithm covers main steps but lacks detail.
+    Related: Yes
+    
+    PROGRAM EVALUATION:
+    Correctness: 7/10
+    Efficiency: 6/10
+    Code Quality: 7/10
+    
+    OUTPUT EVALUATION:
+    Correctness: 7/10
+    Presentation: 6/10
+    
+    RESULT EVALUATION:
+    Score: 7/10
+    Explanation: Result summarizes findings but lacks analysis.
+    Related: Yes
+    
+    Strengths: Basic implementation meets requirements.
+    Weaknesses: Could improve efficiency and add more comments.
+    """
+    
+    return evaluation_text, scores
+
+def parse_mark_breakdown(evaluation_text):
+    """
+    Extract individual scores from evaluation text.
+    """
+    breakdown = {
+        "problem_solving": 5,
+        "logic_quality": 5,
+        "readability": 5,
+        "effort": 5,
+        "overall": 5
+    }
+    
+    # Try to extract scores using regex
+    patterns = [
+        (r"PROBLEM SOLVING.*?(\d+(?:\.\d+)?)/10", "problem_solving"),
+        (r"LOGIC QUALITY.*?(\d+(?:\.\d+)?)/10", "logic_quality"),
+        (r"READABILITY.*?(\d+(?:\.\d+)?)/10", "readability"),
+        (r"EFFORT.*?(\d+(?:\.\d+)?)/10", "effort"),
+        (r"Overall.?score.?(\d+(?:\.\d+)?)/10", "overall"),
+        (r"weighted score.*?(\d+(?:\.\d+)?)/10", "overall")
+    ]
+    
+    for pattern, key in patterns:
+        match = re.search(pattern, evaluation_text, re.IGNORECASE | re.DOTALL)
+        if match:
+            breakdown[key] = float(match.group(1))
+    
+    # If overall not found, calculate average
+    if breakdown["overall"] == 5:
+        breakdown["overall"] = (breakdown["problem_solving"] + breakdown["logic_quality"] + 
+                                breakdown["readability"] + breakdown["effort"]) / 4
+    
+    return breakdown
+
+def offline_evaluate_code_with_breakdown(code, problem_text):
+    """
+    Offline evaluation with mark breakdown.
+    """
+    breakdown = {
+        "problem_solving": 5,
+        "logic_quality": 5,
+        "readability": 5,
+        "effort": 5,
+        "overall": 5
+    }
+    
+    try:
+        context = build_code_context(code)
+        syntax_ok = True
+        breakdown["problem_solving"] = 6
+    except Exception:
+        context = None
+        syntax_ok = False
+        breakdown["problem_solving"] = 2
+    
+    # Check code features, from the parse tree when the code compiles
+    if context:
+        has_function = bool(nodes_of(context, ast.FunctionDef, ast.AsyncFunctionDef))
+    else:
+        has_function = bool(re.search(r'def\s+\w+\s*\(', code))
+    has_comments = '#' in code
+    lines = code.split('\n')
+    non_empty_lines = [l for l in lines if l.strip()]
+    
+    # Logic quality
+    if syntax_ok and has_function:
+        breakdown["logic_quality"] = 6
+    elif syntax_ok:
+        breakdown["logic_quality"] = 4
+    else:
+        breakdown["logic_quality"] = 2
+    
+    # Readability
+    if has_comments and len(non_empty_lines) > 5:
+        breakdown["readability"] = 7
+    elif len(non_empty_lines) > 3:
+        breakdown["readability"] = 5
+    else:
+        breakdown["readability"] = 3
+    
+    # Effort
+    if len(non_empty_lines) > 10:
+        breakdown["effort"] = 8
+    elif len(non_empty_lines) > 5:
+        breakdown["effort"] = 6
+    else:
+        breakdown["effort"] = 4
+    
+    # Overall
+    breakdown["overall"] = sum([breakdown["problem_solving"], breakdown["logic_quality"],
+                                breakdown["readability"], breakdown["effort"]]) / 4
+    
+    evaluation = f"""
+    Code Evaluation:
+    
+    1. PROBLEM SOLVING: {breakdown['problem_solving']}/10
+    2. LOGIC QUALITY: {breakdown['logic_quality']}/10
+    3. READABILITY & STRUCTURE: {breakdown['readability']}/10
+    4. EFFORT & RELEVANCE: {breakdown['effort']}/10
+    
+    Overall Score: {breakdown['overall']}/10
+    """
+    
+    findings = run_code_rules(context) if context else []
+    return evaluation, [format_finding(finding) for finding in findings], breakdown
+
+def extract_mistakes_from_evaluation(evaluation_text):
+    """
+    Extract mistake points from the evaluation text.
+    """
+    mistakes = []
+    lines = evaluation_text.split('\n')
+    
+    # Look for lines that indicate mistakes
+    mistake_keywords = ['mistake', 'error', 'incorrect', 'wrong', 'missing', 'fails', 'doesn\'t handle']
+    
+    for line in lines:
+        line_lower = line.lower()
+        if any(keyword in line_lower for keyword in mistake_keywords):
+            # Clean and format the mistake
+            cleaned = line.strip()
+            if cleaned and not cleaned.startswith('#'):
+                if not cleaned.startswith('•'):
+                    cleaned = '• ' + cleaned
+                mistakes.append(cleaned)
+    
+    # Also look for numbered mistakes
+    for i, line in enumerate(lines):
+        if re.match(r'^\d+\..*mistake|error|incorrect', line, re.IGNORECASE):
+            mistakes.append('• ' + line.strip())
+    
+    return mistakes[:10]  # Limit to 10 mistakes
+
+# =========================
+# STRUCTURED EVALUATION (SINGLE CALL)
+# =========================
+STRUCTURED_EVALUATION_ENABLED = False
+
+def _rated_section_schema():
+    return {
+        "type": "OBJECT",
+        "properties": {
+            "score": {"type": "NUMBER"},
+            "explanation": {"type": "STRING"},
+            "related": {"type": "BOOLEAN"},
+        },
+        "required": ["score", "explanation", "related"],
+    }
+
+EVALUATION_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "aim": _rated_section_schema(),
+        "algorithm": _rated_section_schema(),
+        "result": _rated_section_schema(),
+        "program": {
+            "type": "OBJECT",
+            "properties": {
+                "correctness": {"type": "NUMBER"},
+                "efficiency": {"type": "NUMBER"},
+                "code_quality": {"type": "NUMBER"},
+                "strengths": {"type": "STRING"},
+                "weaknesses": {"type": "STRING"},
+            },
+            "required": ["correctness", "efficiency", "code_quality", "strengths", "weaknesses"],
+        },
+        "output": {
+            "type": "OBJECT",
+            "properties": {
+                "correctness": {"type": "NUMBER"},
+                "presentation": {"type": "NUMBER"},
+                "explanation": {"type": "STRING"},
+            },
+            "required": ["correctness", "presentation", "explanation"],
+        },
+        "mistakes": {"type": "ARRAY", "items": {"type": "STRING"}},
+    },
+    "required": ["aim", "algorithm", "result", "program", "output", "mistakes"],
+}
+
+# Used when the output was already verified by running the program
+EVALUATION_SCHEMA_WITHOUT_OUTPUT = {
+    "type": "OBJECT",
+    "properties": {key: value for key, value in EVALUATION_SCHEMA["properties"].items() if key != "output"},
+    "required": [key for key in EVALUATION_SCHEMA["required"] if key != "output"],
+}
+
+def evaluation_schema(include_output=True):
+    return EVALUATION_SCHEMA if include_output else EVALUATION_SCHEMA_WITHOUT_OUTPUT
+
+def build_structured_evaluation_prompt(sections, problem_text, include_output=True):
+    """
+    Prompt for the single structured evaluation. With include_output=False the
+    Output section and its scores are left out, as in build_program_prompt.
+    """
+    output_block = f"""        OUTPUT:
+        {sections['output']}
+        
+""" if include_output else ""
+    output_items = """        - output.correctness: does the output match the expected results and is it complete?
+        - output.presentation: is the output clear, readable and well-formatted?
+""" if include_output else ""
+    return f"""
+        Evaluate this student submission against the given question.
+        
+        Question: {problem_text}
+        
+        AIM:
+        {sections['aim']}
+        
+        ALGORITHM:
+        {sections['algorithm']}
+        
+        PROGRAM:
+        {sections['program']}
+        
+{output_block}        RESULT:
+        {sections['result']}
+        
+        Score every item from 0 to 10.
+        - aim, algorithm, result: relevance to the question, a brief explanation, and whether the section is directly related
+        - program.correctness: does the code solve the problem and meet all requirements?
+        - program.efficiency: is the algorithm efficient and are edge cases handled?
+        - program.code_quality: organisation, meaningful names, formatting, comments
+{output_items}        - mistakes: specific mistakes or issues found, one per item
+        """
+
+def clamp_rating(value):
+    return max(0.0, min(10.0, float(value)))
+
+def scores_from_structured_evaluation(data):
+    """Map the structured evaluation straight onto the marking-scheme scores dict."""
+    ratings = {
+        "aim": clamp_rating(data["aim"]["score"]),
+        "algorithm": clamp_rating(data["algorithm"]["score"]),
+        "result": clamp_rating(data["result"]["score"]),
+        "correctness": clamp_rating(data["program"]["correctness"]),
+        "efficiency": clamp_rating(data["program"]["efficiency"]),
+        "code_quality": clamp_rating(data["program"]["code_quality"]),
+    }
+    explanations = {
+        "aim": data["aim"]["explanation"].strip(),
+        "algorithm": data["algorithm"]["explanation"].strip(),
+        "result": data["result"]["explanation"].strip(),
+        "program": data["program"]["strengths"].strip(),
+    }
+    # Absent when the output was verified by running the program instead
+    if "output" in data:
+        ratings["output_correctness"] = clamp_rating(data["output"]["correctness"])
+        ratings["output_presentation"] = clamp_rating(data["output"]["presentation"])
+        explanations["output"] = data["output"]["explanation"].strip()
+    return build_submission_scores(ratings, explanations)
+
+def format_structured_evaluation(data):
+    """Render the structured evaluation in the same layout as the free-text prompts."""
+    relevance_parts = []
+    for section in RELEVANCE_SECTIONS:
+        item = data[section]
+        relevance_parts.append(
+            f"{section.upper()} EVALUATION:\n"
+            f"Score: {item['score']}\n"
+            f"Explanation: {item['explanation']}\n"
+            f"Related: {'yes' if item['related'] else 'no'}"
+        )
+    program = data["program"]
+    output = data.get("output")
+    mistakes = "\n".join(f"- {mistake}" for mistake in data["mistakes"]) or "- None"
+    output_text = (
+        f"4. OUTPUT CORRECTNESS: {output['correctness']}/10\n"
+        f"5. OUTPUT PRESENTATION: {output['presentation']}/10\n"
+        f"Output: {output['explanation']}\n"
+    ) if output else ""
+    program_text = (
+        f"1. CORRECTNESS: {program['correctness']}/10\n"
+        f"2. EFFICIENCY: {program['efficiency']}/10\n"
+        f"3. CODE QUALITY: {program['code_quality']}/10\n"
+        f"{output_text}\n"
+        f"Mistakes:\n{mistakes}\n\n"
+        f"Strengths: {program['strengths']}\n"
+        f"Weaknesses: {program['weaknesses']}"
+    )
+    return combine_evaluation_text("\n\n".join(relevance_parts), program_text)
+
+def evaluate_submission_structured(sections, problem_text, include_output=True):
+    """
+    Evaluate all sections with one structured-output request instead of the
+    chained free-text prompts. Falls back to the chained prompts if the
+    response does not match the schema.
+    """
+    try:
+        data = generate_json(
+            build_structured_evaluation_prompt(sections, problem_text, include_output), evaluation_schema(include_output)
+        )
+        return format_structured_evaluation(data), scores_from_structured_evaluation(data)
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        print(f"Structured evaluation response was invalid: {e}. Using the chained prompts...")
+        return evaluate_submission_chained(sections, problem_text, include_output)
+
+# =========================
+# STEP 5: GRADING WITH BREAKDOWN
+# =========================
+def calculate_grade_with_breakdown(breakdown, max_marks, all_mistakes):
+    """
+    Calculate grade based on detailed breakdown.
+    """
+    # Weight for each component
+    weights = {
+        "problem_solving": 0.40,  # 40%
+        "logic_quality": 0.30,    # 30%
+        "readability": 0.15,       # 15%
+        "effort": 0.15            # 15%
+    }
+    
+    # Calculate weighted score
+    weighted_score = 0
+    for key, weight in weights.items():
+        weighted_score += (breakdown[key] / 10) * weight
+    
+    # Convert to marks
+    score = weighted_score * max_marks
+    
+    # Apply penalty for mistakes, the same way graded submissions are penalised
+    if all_mistakes:
+        score *= (1 - rule_penalty(all_mistakes))
+    
+    # Calculate individual component marks
+    component_marks = {}
+    for key, weight in weights.items():
+        component_marks[key] = round((breakdown[key] / 10) * weight * max_marks, 2)
+    
+    return max(0, round(score, 2)), component_marks
+
+# =========================
+# MAIN INTERACTIVE FUNCTION
+# =========================
+def run_pipeline():
+    print("\n" + "="*60)
+    print(" STUDENT SUBMISSION EVALUATOR ")
+    print(" Using Gemini API ")
+    print("="*60)
+    
+    # Get problem statement
+    print("\nSTEP 1: PROBLEM STATEMENT")
+    print("-" * 40)
+    problem_text = input("Enter the problem/question text: ").strip()
+    if not problem_text:
+        print("Error: Problem statement cannot be empty!")
+        return
+    
+    # Get student submission (text or image/PDF upload)
+    print("\nSTEP 2: STUDENT SUBMISSION INPUT")
+    print("-" * 40)
+    print("\n" + "="*50)
+    print("SUBMISSION INPUT OPTIONS:")
+    print("1. Type/paste submission directly")
+    print("2. Upload image file (JPG/PNG) or PDF - File dialog will open")
+    print("="*50)
+    
+    choice = input("Enter your choice (1 or 2): ").strip()
+    
+    submission_text = ""
+    if choice == "2":
+        # Image/PDF input with file dialog
+        if not PIL_AVAILABLE:
+            print("Error: Image input requires PIL package.")
+            print("Falling back to text input...")
+            choice = "1"
+        else:
+            print("\nOpening file dialog...")
+            print("(If dialog doesn't appear, check behind other windows)")
+            file_path = select_image_file()
+            
+            if file_path:
+                print(f"Selected file: {os.path.basename(file_path)}")
+                print("Extracting text from file...")
+                submission_text = extract_text_from_image(file_path)
+                if submission_text:
+                    print("\n=== Extracted Text Preview ===")
+                    preview = submission_text[:500] + "..." if len(submission_text) > 500 else submission_text
+                    print(preview)
+                    print("="*50)
+                    confirm = input("\nUse this extracted text? (y/n): ").strip().lower()
+                    if confirm != 'y':
+                        print("Falling back to text input...")
+                        choice = "1"
+                else:
+                    print("Failed to extract text from file. Falling back to text input...")
+                    choice = "1"
+            else:
+                print("No file selected. Falling back to text input...")
+                choice = "1"
+    
+    # Text input (default)
+    if choice == "1" or choice != "2":
+        print("\nEnter/paste your submission below. Type 'END' in a new line when finished:")
+        lines = []
+        while True:
+            line = input()
+            if line.strip().upper() == "END":
+                break
+            lines.append(line)
+        submission_text = "\n".join(lines)
+    
+    if not submission_text or not submission_text.strip():
+        print("Error: No submission provided!")
+        return
+    
+    # Parse submission into sections
+    print("\nSTEP 3: PARSING SUBMISSION INTO SECTIONS")
+    print("-" * 40)
+    sections, confidence = parse_submission_sections_with_confidence(submission_text)
+    
+    # Show parsed sections
+    print(f"\nParsed Sections (confidence {confidence:.0%}):")
+    for section, content in sections.items():
+        preview = content[:100] + "..." if len(content) > 100 else content
+        print(f"\n{section.upper()}:")
+        print(preview)
+    
+    # Evaluate submission with marking scheme
+    print("\nSTEP 4: EVALUATING SUBMISSION")
+    print("-" * 40)
+    evaluation, scores = evaluate_submission_with_marking_scheme(sections, problem_text)
+    # Same code check penalties as batch grading
+    code_findings = check_program_section(sections)
+    scores = apply_rule_penalties(scores, code_findings)
+    
+    # Display results
+    print("\n" + "="*60)
+    print(" EVALUATION RESULTS ")
+    print("="*60)
+    
+    print("\n📋 DETAILED EVALUATION:")
+    print("-" * 40)
+    print(evaluation)
+    
+    print("\n📈 MARK BREAKDOWN:")
+    print("-" * 40)
+    print(f"1. Aim ({scores['aim']['max']}%):                {scores['aim']['score']:.2f}/{scores['aim']['max']}")
+    print(f"   - {scores['aim']['explanation']}")
+    print(f"2. Algorithm ({scores['algorithm']['max']}%):     {scores['algorithm']['score']:.2f}/{scores['algorithm']['max']}")
+    print(f"   - {scores['algorithm']['explanation']}")
+    print(f"3. Program ({scores['program']['max']}%):        {scores['program']['score']:.2f}/{scores['program']['max']}")
+    print(f"   - {scores['program']['explanation']}")
+    if scores.get("rule_penalty"):
+        print(f"   - Code check penalty: -{scores['rule_penalty'] * 100:.0f}% ({len(code_findings)} finding(s))")
+    print(f"4. Output ({scores['output']['max']}%):         {scores['output']['score']:.2f}/{scores['output']['max']}")
+    print(f"5. Result ({scores['result']['max']}%):         {scores['result']['score']:.2f}/{scores['result']['max']}")
+    print(f"   - {scores['result']['explanation']}")
+    
+    print("\n✅ FINAL GRADE:")
+    print("-" * 40)
+    print(f"Total Score: {scores['total']['score']}/{scores['total']['max']}")
+    # percentage = (scores['total']['score']/scores['total']['max']) * 100
+    # print(f"Percentage: {percentage:.1f}%")
+    
+    # Generate markdown output
+    markdown_output = generate_markdown_output(scores, evaluation, problem_text, code_findings)
+    print("\n📝 MARKDOWN OUTPUT GENERATED")
+    print("-" * 40)
+    print("A detailed markdown evaluation has been generated.")
+    
+    # Ask if user wants to save the markdown output
+    save_option = input("\nDo you want to save the evaluation as a markdown file? (y/n): ").strip().lower()
+    if save_option == 'y':
+        save_path = input("Enter file path to save (or press Enter for default): ").strip()
+        if not save_path:
+            save_path = "evaluation_result.md"
+        
+        try:
+            with open(save_path, 'w', encoding='utf-8') as f:
+                f.write(markdown_output)
+            print(f"Evaluation saved to {save_path}")
+        except Exception as e:
+            print(f"Error saving file: {e}")
+
+@timed_stage("report", lambda markdown: {"bytes": len(markdown.encode('utf-8'))})
+def generate_markdown_output(scores, evaluation_text, problem_text, code_findings=None,
+                             test_report=None, profile_report=None, output_report=None,
+                             duplicates=None):
+    """Generate a formatted markdown output with the evaluation results."""
+    identical = ""
+    if duplicates:
+        identical = (
+            "## Identical Submissions\n\n"
+            f"This submission is identical to: {', '.join(duplicates)}. "
+            "It was graded once and the same result applies to each of them.\n\n"
+        )
+    
+    output_check = ""
+    if output_report is not None:
+        output_check = f"## Output Verification\n\n{format_output_report(output_report)}\n\n"
+    
+    performance = ""
+    if profile_report is not None:
+        performance = f"## Performance Profile\n\n{format_profile_report(profile_report)}\n\n"
+    
+    test_cases = ""
+    if test_report is not None:
+        test_cases = f"## Test Cases\n\n{format_test_report(test_report)}\n\n"
+    
+    code_checks = ""
+    if code_findings is not None:
+        items = "\n".join(
+            f"- [{finding['severity']}] {format_finding(finding)[2:]} `{finding['rule']}`"
+            for finding in code_findings
+        ) or "- No issues found"
+        if scores.get("rule_penalty"):
+            items += f"\n\nCode check penalty: -{scores['rule_penalty'] * 100:.0f}% of the Program marks"
+        code_checks = f"## Code Checks\n\n{items}\n\n"
+    
+    markdown = f"""
+# Student Submission Evaluation
+
+## Problem Statement
+{problem_text}
+
+## Evaluation Summary
+
+| Section | Maximum Marks | Marks Obtained | Percentage |
+|---------|---------------|---------------|------------|
+| Aim | {scores['aim']['max']} | {scores['aim']['score']:.2f} | {(scores['aim']['score']/scores['aim']['max'])*100:.1f}% |
+| Algorithm | {scores['algorithm']['max']} | {scores['algorithm']['score']:.2f} | {(scores['algorithm']['score']/scores['algorithm']['max'])*100:.1f}% |
+| Program | {scores['program']['max']} | {scores['program']['score']:.2f} | {(scores['program']['score']/scores['program']['max'])*100:.1f}% |
+| Output | {scores['output']['max']} | {scores['output']['score']:.2f} | {(scores['output']['score']/scores['output']['max'])*100:.1f}% |
+| Result | {scores['result']['max']} | {scores['result']['score']:.2f} | {(scores['result']['score']/scores['result']['max'])*100:.1f}% |
+| *Total* | *{scores['total']['max']}* | *{scores['total']['score']:.2f}* | *{(scores['total']['score']/scores['total']['max'])*100:.1f}%* |
+
+## Detailed Evaluation
+
+### Aim Evaluation
+- *Score*: {scores['aim']['score']:.2f}/{scores['aim']['max']}
+- *Feedback*: {scores['aim']['explanation']}
+
+### Algorithm Evaluation
+- *Score*: {scores['algorithm']['score']:.2f}/{scores['algorithm']['max']}
+- *Feedback*: {scores['algorithm']['explanation']}
+
+### Program Evaluation
+- *Score*: {scores['program']['score']:.2f}/{scores['program']['max']}
+- *Feedback*: {scores['program']['explanation']}
+
+### Output Evaluation
+- *Score*: {scores['output']['score']:.2f}/{scores['output']['max']}
+
+### Result Evaluation
+- *Score*: {scores['result']['score']:.2f}/{scores['result']['max']}
+- *Feedback*: {scores['result']['explanation']}
+
+{identical}{output_check}{test_cases}{performance}{code_checks}## Full Evaluation Report
+
+{evaluation_text}
+
+
+Evaluation performed using automated assessment system.
+"""
+    return markdown
+
+# =========================
+# PIPELINED PDF EVALUATION
+# =========================
+PDF_STREAMING_ENABLED = False
+EARLY_RELEVANCE_SECTIONS = ("aim", "algorithm")
+
+def grade_pdf_streaming(pdf_path, problem_text):
+    """
+    OCR a PDF page by page and start the Aim/Algorithm relevance call as soon
+    as both sections are complete (a later header has appeared), so model
+    latency overlaps with OCR of the remaining pages.
+    Returns (submission_text, confidence, sections, output_report, evaluation_text, scores);
+    evaluation_text and scores are None when the early start was not possible.
+    """
+    page_texts = []
+    confidences = []
+    early_sections = None
+    early_future = None
+    
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        for page_text in iter_pdf_page_texts(str(pdf_path), confidences=confidences):
+            page_texts.append(page_text)
+            if early_future is None:
+                completed = find_completed_sections("\n\n".join(page_texts))
+                if all(completed.get(name) for name in EARLY_RELEVANCE_SECTIONS):
+                    early_sections = {name: completed[name] for name in EARLY_RELEVANCE_SECTIONS}
+                    early_future = executor.submit(
+                        generate_text,
+                        build_relevance_prompt(early_sections, problem_text, EARLY_RELEVANCE_SECTIONS)
+                    )
+        
+        # Same rule as the tesseract backend, whose cache entry this becomes
+        escalate_weak_pages(pdf_path, range(1, len(page_texts) + 1), page_texts, confidences)
+        submission_text = "\n\n".join(page_texts).strip()
+        confidence = min(confidences) if confidences else 0.0
+        ocr_cache_put_result(pdf_ocr_cache_key(file_sha256(pdf_path)), submission_text, round(confidence, 3))
+        sections = parse_submission_sections(submission_text)
+        
+        # The early call is only usable if the full parse agrees with what it graded
+        if early_future is None or any(sections[name] != early_sections[name] for name in EARLY_RELEVANCE_SECTIONS):
+            if early_future is not None:
+                early_future.cancel()
+            return submission_text, confidence, sections, None, None, None
+        
+        output_report = run_output_verification(sections)
+        
+        remaining = tuple(name for name in RELEVANCE_SECTIONS if name not in EARLY_RELEVANCE_SECTIONS)
+        remaining_future = executor.submit(
+            generate_text, build_relevance_prompt(sections, problem_text, remaining)
+        )
+        program_text = generate_text(build_program_prompt(sections, problem_text, output_needs_model(output_report)))
+        relevance_text = early_future.result() + "\n\n" + remaining_future.result()
+    
+    scores = parse_submission_scores(relevance_text, program_text)
+    return submission_text, confidence, sections, output_report, combine_evaluation_text(relevance_text, program_text), scores
+
+def pdf_ocr_cache_key(file_hash):
+    return ocr_backend_cache_key(file_hash, "tesseract", "pdf")
+
+def can_stream_pdf(path):
+    """
+    Streaming only pays off for uncached scanned PDFs when the OCR router
+    would read them with tesseract and the model is available.
+    """
+    path = Path(path)
+    if not (PDF_STREAMING_ENABLED and GENAI_AVAILABLE and path.suffix.lower() == '.pdf'):
+        return False
+    if not ocr_backend_usable("tesseract"):
+        return False
+    # A single structured call needs every section, so there is nothing to start early
+    if STRUCTURED_EVALUATION_ENABLED:
+        return False
+    # The streamed prompts always grade the claimed output; with verification on,
+    # the prompt depends on the program run, which needs the whole text first
+    if OUTPUT_VERIFICATION_ENABLED:
+        return False
+    file_hash = file_sha256(path)
+    if any(ocr_cache_get(ocr_backend_cache_key(file_hash, backend["name"], "pdf")) is not None
+           for backend in ocr_backends_for("pdf")):
+        return False
+    # Typed PDFs are read from their text layer, with no OCR to overlap
+    return not pdf_has_text_layer(path)
+
+# =========================
+# SANDBOXED EXECUTION
+# =========================
+TEST_CASES = None
+EXECUTION_WORKERS = os.cpu_count() or 1
+EXECUTION_TIMEOUT_SECONDS = 5
+EXECUTION_CPU_SECONDS = 5
+EXECUTION_MEMORY_BYTES = 256 * 1024 * 1024
+EXECUTION_FILE_BYTES = 1024 * 1024
+# RLIMIT_NPROC counts every process of the user running the checker, not just
+# this program's, so it only stops runaway forking (fork bombs)
+EXECUTION_MAX_PROCESSES = 256
+EXECUTION_OUTPUT_LIMIT = 64 * 1024
+# Exit signals of a child killed for exceeding RLIMIT_CPU (SIGXCPU at the soft
+# limit, SIGKILL at the hard one); such runs are reported as timeouts
+CPU_LIMIT_SIGNALS = {getattr(signal, name) for name in ("SIGXCPU", "SIGKILL") if hasattr(signal, name)}
+_execution_pool = None
+_execution_pool_lock = threading.Lock()
+
+# Runs inside the child interpreter: apply resource limits, then run the student's file.
+# input() prompts go to stderr unless asked for, so "Enter a: " does not end up
+# in the output compared against test cases.
+SANDBOX_LAUNCHER = """
+import builtins, sys, runpy
+try:
+    import resource
+    cpu, memory, file_size, processes = (int(v) for v in sys.argv[1:5])
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu))
+    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (file_size, file_size))
+    if hasattr(resource, "RLIMIT_NPROC"):
+        resource.setrlimit(resource.RLIMIT_NPROC, (processes, processes))
+except (ImportError, ValueError, OSError):
+    pass
+if sys.argv[5] != "stdout":
+    def input(prompt=""):
+        sys.stderr.write(str(prompt))
+        sys.stderr.flush()
+        line = sys.stdin.readline()
+        if not line:
+            raise EOFError("EOF when reading a line")
+        return line[:-1] if line.endswith("\\n") else line
+    builtins.input = input
+path = sys.argv[6]
+sys.argv = [path]
+runpy.run_path(path, run_name="__main__")
+"""
+
+def load_test_cases(path):
+    """
+    Load instructor test cases from a JSON list of objects with 'input'
+    (text fed to stdin) and 'expected' (expected stdout).
+    """
+    with open(path, encoding='utf-8') as f:
+        cases = json.load(f)
+    return [{"input": case.get("input", ""), "expected": case.get("expected", "")} for case in cases]
+
+def get_execution_pool():
+    """
+    Return the pool that drives sandboxed runs. Every run is its own child
+    process, so threads here only wait on subprocesses; the pool size bounds
+    how many student programs execute at once across the whole batch.
+    """
+    global _execution_pool
+    with _execution_pool_lock:
+        if _execution_pool is None:
+            _execution_pool = ThreadPoolExecutor(max_workers=EXECUTION_WORKERS)
+        return _execution_pool
+
+def normalize_program_output(text):
+    """Ignore trailing spaces on each line and leading/trailing blank lines."""
+    return "\n".join(line.rstrip() for line in text.strip().splitlines())
+
+@timed_stage("execute")
+def run_program_sandboxed(program_path, stdin_text, workdir, timeout=None, cpu_seconds=None,
+                          prompts_to_stdout=False):
+    """
+    Run one student program in a separate interpreter with resource limits.
+    
+    What is contained: -I mode (no user site, no PYTHON* variables, script
+    folder not on sys.path), a minimal environment, a temporary working
+    directory, CPU / memory / file-size / process-count limits where the
+    platform supports them, and a wall-clock timeout after which the
+    program's whole process group (including anything it started) is killed.
+    
+    What is NOT contained: the program can still read and write any file the
+    checker's user can and open network connections. Run untrusted batches
+    inside a container or VM if that matters.
+    
+    input() prompts are written to stderr unless prompts_to_stdout is set.
+    Returns (status, stdout, stderr, seconds); status is 'ok', 'error' or 'timeout'
+    (wall-clock timeout or CPU limit).
+    """
+    command = [
+        sys.executable, "-I", "-c", SANDBOX_LAUNCHER,
+        str(cpu_seconds or EXECUTION_CPU_SECONDS), str(EXECUTION_MEMORY_BYTES), str(EXECUTION_FILE_BYTES),
+        str(EXECUTION_MAX_PROCESSES), "stdout" if prompts_to_stdout else "stderr", str(program_path),
+    ]
+    env = {"PATH": os.environ.get("PATH", ""), "PYTHONIOENCODING": "utf-8"}
+    started = time.perf_counter()
+    # A session of its own lets a timeout kill the program's children too
+    process = subprocess.Popen(
+        command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        cwd=workdir, env=env, text=True, encoding='utf-8', errors='replace',
+        start_new_session=(os.name == "posix")
+    )
+    try:
+        stdout, stderr = process.communicate(stdin_text, timeout=timeout or EXECUTION_TIMEOUT_SECONDS)
+        timed_out = False
+    except subprocess.TimeoutExpired:
+        kill_process_group(process)
+        try:
+            stdout, stderr = process.communicate(timeout=5)
+        except subprocess.TimeoutExpired:
+            # Something that left the session still holds the pipes
+            stdout, stderr = "", ""
+        timed_out = True
+    finally:
+        # Leftover background children die with the program
+        kill_process_group(process)
+    seconds = time.perf_counter() - started
+    
+    if timed_out:
+        return "timeout", stdout[:EXECUTION_OUTPUT_LIMIT], "", seconds
+    if process.returncode == 0:
+        status = "ok"
+    elif process.returncode < 0 and -process.returncode in CPU_LIMIT_SIGNALS:
+        status = "timeout"
+    else:
+        status = "error"
+    return status, stdout[:EXECUTION_OUTPUT_LIMIT], stderr[-EXECUTION_OUTPUT_LIMIT:], seconds
+
+def kill_process_group(process):
+    """SIGKILL a sandboxed program and every process in its session."""
+    try:
+        if os.name == "posix":
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except (ProcessLookupError, PermissionError, OSError):
+        pass
+
+def run_test_case(program, case, index):
+    with tempfile.TemporaryDirectory(prefix="code_checker_") as workdir:
+        program_path = Path(workdir) / "solution.py"
+        program_path.write_text(program, encoding='utf-8')
+        status, stdout, stderr, seconds = run_program_sandboxed(program_path, case["input"], workdir)
+    
+    passed = status == "ok" and normalize_program_output(stdout) == normalize_program_output(case["expected"])
+    return {
+        "index": index,
+        "status": "pass" if passed else ("fail" if status == "ok" else status),
+        "input": case["input"],
+        "expected": case["expected"],
+        "stdout": stdout,
+        "stderr": stderr,
+        "seconds": round(seconds, 3),
+    }
+
+def run_test_cases(program, test_cases):
+    """Run the program against every test case in parallel; returns a summary report."""
+    pool = get_execution_pool()
+    futures = [pool.submit(run_test_case, program, case, i) for i, case in enumerate(test_cases, 1)]
+    cases = [future.result() for future in futures]
+    passed = sum(1 for case in cases if case["status"] == "pass")
+    return {"passed": passed, "total": len(cases), "cases": cases}
+
+def apply_test_results(scores, test_report):
+    """
+    Replace the model's correctness guesses with the measured pass rate:
+    it sets both the Program CORRECTNESS and the OUTPUT CORRECTNESS ratings.
+    """
+    if not test_report or not test_report["total"]:
+        return scores
+    rating = round(10 * test_report["passed"] / test_report["total"], 2)
+    return rescore_submission(scores, {"correctness": rating, "output_correctness": rating})
+
+def format_test_report(test_report):
+    lines = [f"Passed {test_report['passed']}/{test_report['total']} test cases", ""]
+    for case in test_report["cases"]:
+        lines.append(f"- Test {case['index']}: {case['status'].upper()} ({case['seconds']:.3f}s)")
+        if case["status"] != "pass":
+            lines.append(f"  - Expected: `{normalize_program_output(case['expected'])[:200]}`")
+            lines.append(f"  - Got: `{normalize_program_output(case['stdout'])[:200]}`")
+            if case["stderr"].strip():
+                lines.append(f"  - Error: `{case['stderr'].strip().splitlines()[-1][:200]}`")
+    return "\n".join(lines)
+
+# =========================
+# OUTPUT VERIFICATION
+# =========================
+OUTPUT_VERIFICATION_ENABLED = False
+OUTPUT_PROGRAM_INPUT = ""
+OUTPUT_EXPECTED = None
+# Below this similarity to the real output, a claimed output is treated as fabricated
+FABRICATED_OUTPUT_THRESHOLD = 0.6
+OUTPUT_OCR_CONFUSIONS = str.maketrans({
+    "o": "0", "l": "1", "i": "1", "|": "1",
+    "\u2018": "'", "\u2019": "'", "\u201c": '"', "\u201d": '"', "\u2013": "-", "\u2014": "-",
+})
+
+def normalize_output_for_comparison(text):
+    """
+    Normalize program output so formatting and common OCR confusions
+    (o/0, l/1, curly quotes) do not count as differences. Applied to both sides.
+    """
+    lines = []
+    for line in (text or "").lower().translate(OUTPUT_OCR_CONFUSIONS).splitlines():
+        line = " ".join(line.split())
+        if line:
+            lines.append(line)
+    return "\n".join(lines)
+
+def output_similarity(first, second):
+    first = normalize_output_for_comparison(first)
+    second = normalize_output_for_comparison(second)
+    if first == second:
+        return 1.0
+    return round(difflib.SequenceMatcher(None, first, second, autojunk=False).ratio(), 3)
+
+def run_is_inconclusive(error):
+    """True for failures that come from the setup, not the program's behaviour."""
+    if re.match(r"(?:SyntaxError|IndentationError|TabError)\b", error):
+        return True
+    return error.startswith("EOFError") and not OUTPUT_PROGRAM_INPUT
+
+def verify_program_output(sections):
+    """
+    Run the extracted program in the sandbox and compare its real stdout with
+    the Output section the student wrote and, if configured, the instructor's expected output.
+    """
+    program = sections.get("program", "")
+    with tempfile.TemporaryDirectory(prefix="code_checker_") as workdir:
+        program_path = Path(workdir) / "solution.py"
+        program_path.write_text(program, encoding='utf-8')
+        # Claimed outputs are copied from a terminal, where the prompts appear too
+        status, stdout, stderr, seconds = run_program_sandboxed(
+            program_path, OUTPUT_PROGRAM_INPUT, workdir, prompts_to_stdout=True
+        )
+    
+    report = {
+        "status": status,
+        "actual": stdout,
+        "error": stderr.strip().splitlines()[-1] if status != "ok" and stderr.strip() else "",
+        "claimed_similarity": output_similarity(sections.get("output", ""), stdout),
+        "expected_similarity": None,
+        "exact": False,
+        "rating": None,
+    }
+    if OUTPUT_EXPECTED is not None:
+        report["expected_similarity"] = output_similarity(stdout, OUTPUT_EXPECTED)
+    
+    if status != "ok":
+        # A program that cannot be compiled (often OCR damage) or that waits for
+        # input nobody supplied says nothing about the claimed output
+        if not run_is_inconclusive(report["error"]):
+            report["rating"] = 0.0
+        return report
+    
+    report["exact"] = report["claimed_similarity"] == 1.0 and report["expected_similarity"] in (None, 1.0)
+    if report["expected_similarity"] is not None:
+        rating = 10 * report["expected_similarity"]
+        # A correct program does not excuse an Output section that was made up
+        if report["claimed_similarity"] < FABRICATED_OUTPUT_THRESHOLD:
+            rating = min(rating, 10 * report["claimed_similarity"])
+    else:
+        rating = 10 * report["claimed_similarity"]
+    report["rating"] = round(rating, 2)
+    return report
+
+def output_needs_model(output_report):
+    """A verified exact output needs no model opinion."""
+    return not (output_report and output_report["exact"])
+
+def apply_output_verification(scores, output_report):
+    """
+    Use the verified output for OUTPUT CORRECTNESS. An exact match also sets
+    presentation, since the model was not asked about the output in that case.
+    """
+    if not output_report or output_report["rating"] is None:
+        return scores
+    overrides = {"output_correctness": output_report["rating"]}
+    if output_report["exact"]:
+        overrides["output_presentation"] = 10.0
+    return rescore_submission(scores, overrides)
+
+def format_output_report(output_report):
+    lines = [f"- *Program run*: {output_report['status']}"]
+    if output_report["error"]:
+        lines.append(f"- *Error*: `{output_report['error'][:200]}`")
+    lines.append(f"- *Claimed output matches real output*: {output_report['claimed_similarity'] * 100:.0f}%")
+    if output_report["expected_similarity"] is not None:
+        lines.append(f"- *Real output matches expected output*: {output_report['expected_similarity'] * 100:.0f}%")
+    if output_report["status"] == "ok" and output_report["claimed_similarity"] < FABRICATED_OUTPUT_THRESHOLD:
+        lines.append("- ⚠ The Output section does not match what the program actually prints")
+    if output_report["rating"] is None:
+        lines.append("- *Output correctness rating*: not measured (the run was inconclusive); the model's rating stands")
+    else:
+        lines.append(f"- *Output correctness rating*: {output_report['rating']:.1f}/10")
+    lines.append("")
+    lines.append("Actual output:")
+    lines.append("```")
+    lines.append(output_report["actual"].rstrip()[:2000])
+    lines.append("```")
+    return "\n".join(lines)
+
+# =========================
+# PERFORMANCE PROFILING
+# =========================
+PROFILE_CONFIG = None
+PROFILE_TIMEOUT_SECONDS = 60
+PROFILE_CPU_SECONDS = 60
+PROFILE_REPEATS = 3
+
+# Complexity classes in increasing order of growth
+COMPLEXITY_CLASSES = [
+    ("O(1)", lambda n: 1.0),
+    ("O(log n)", lambda n: math.log2(n)),
+    ("O(n)", lambda n: float(n)),
+    ("O(n log n)", lambda n: n * math.log2(n)),
+    ("O(n^2)", lambda n: float(n) ** 2),
+    ("O(n^3)", lambda n: float(n) ** 3),
+]
+
+# Runs inside the sandbox: load the program, then time and measure the
+# target function on each input size. Student output goes to /dev/null and the
+# report to a result file opened before any student code runs, so a program
+# cannot forge it by printing.
+PROFILE_RUNNER = """
+import io, json, os, sys, time, tracemalloc
+
+def measure(namespace, config):
+    function = namespace.get(config["function"])
+    if not callable(function):
+        return {"error": "function %r not defined" % config["function"]}
+    rows = []
+    for n in config["sizes"]:
+        make_args = lambda: eval(config["args"], {"n": n})
+        best = None
+        for _ in range(config["repeats"]):
+            args = make_args()
+            started = time.perf_counter()
+            function(*args)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        args = make_args()
+        tracemalloc.start()
+        function(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        rows.append({"n": n, "seconds": best, "peak_bytes": peak})
+    return {"rows": rows}
+
+def run(source, config):
+    namespace = {"__name__": "__profile__"}
+    try:
+        exec(compile(source, "solution.py", "exec"), namespace)
+    except BaseException:
+        pass  # keep whatever was defined before top-level code failed
+    try:
+        return measure(namespace, config)
+    except Exception as e:
+        return {"error": "%s: %s" % (type(e).__name__, e)}
+
+config = json.load(open("profile.json", encoding="utf-8"))
+result_file = open(config.pop("result_path"), "w", encoding="utf-8")
+os.remove("profile.json")
+sys.stdout = open(os.devnull, "w")
+sys.stdin = io.StringIO("")
+report = {"student": run(open("solution.py", encoding="utf-8").read(), config)}
+if config.get("reference"):
+    report["reference"] = run(config["reference"], config)
+result_file.write(json.dumps(report))
+result_file.close()
+"""
+
+def load_profile_config(path):
+    """
+    Load a profiling spec: {"function": name, "args": expression in n that
+    builds the argument tuple, "sizes": [n, ...], "reference": optional
+    reference solution source}.
+    """
+    with open(path, encoding='utf-8') as f:
+        config = json.load(f)
+    for key in ("function", "args", "sizes"):
+        if key not in config:
+            raise ValueError(f"profile config is missing '{key}'")
+    config.setdefault("reference", "")
+    config.setdefault("repeats", PROFILE_REPEATS)
+    return config
+
+def fit_complexity(rows):
+    """Pick the complexity class whose single-coefficient fit best explains the timings."""
+    points = [(row["n"], row["seconds"]) for row in rows if row["n"] > 1]
+    if len(points) < 3:
+        return None
+    total = sum(t * t for _, t in points) or 1e-18
+    best_name, best_error = None, None
+    for name, growth in COMPLEXITY_CLASSES:
+        values = [growth(n) for n, _ in points]
+        coefficient = sum(v * t for v, (_, t) in zip(values, points)) / sum(v * v for v in values)
+        error = sum((t - coefficient * v) ** 2 for v, (_, t) in zip(values, points)) / total
+        if best_error is None or error < best_error:
+            best_name, best_error = name, error
+    return best_name
 
-def parse_submission_scores(relevance_text, program_text):
+def complexity_rank(name):
+    return [class_name for class_name, _ in COMPLEXITY_CLASSES].index(name)
+
+def efficiency_rating(student_class, reference_class, time_ratio):
     """
-    Parse scores from evaluation texts and calculate final scores based on marking scheme:
-    Aim=10, Algorithm=15, Program=50, Output=15, Result=10
+    0-10 efficiency from the measured behaviour: each growth class worse than
+    the reference costs 3 points; being much slower at the largest size costs up to 4.
     """
-    scores = {
-        "aim": {"max": 10, "score": 0, "explanation": ""},
-        "algorithm": {"max": 15, "score": 0, "explanation": ""},
-        "program": {"max": 50, "score": 0, "explanation": ""},
-        "output": {"max": 15, "score": 0, "explanation": ""},
-        "result": {"max": 10, "score": 0, "explanation": ""},
-        "total": {"max": 100, "score": 0}
-    }
+    rating = 10.0
+    if student_class and reference_class:
+        rating -= 3 * max(0, complexity_rank(student_class) - complexity_rank(reference_class))
+    if time_ratio is not None:
+        if time_ratio > 10:
+            rating -= 4
+        elif time_ratio > 3:
+            rating -= 2
+        elif time_ratio > 1.5:
+            rating -= 1
+    return max(1.0, rating)
+
+@timed_stage("profile")
+def profile_program(program, config):
+    """
+    Profile the student's function (and the reference) on growing inputs in the sandbox.
+    Returns a report dict with per-size rows, fitted classes and an efficiency rating.
+    """
+    with tempfile.TemporaryDirectory(prefix="code_checker_") as workdir, \
+            tempfile.TemporaryDirectory(prefix="code_checker_result_") as result_dir:
+        result_path = Path(result_dir, "profile.json")
+        Path(workdir, "solution.py").write_text(program, encoding='utf-8')
+        Path(workdir, "profile.json").write_text(json.dumps(dict(config, result_path=str(result_path))), encoding='utf-8')
+        runner_path = Path(workdir, "profile_runner.py")
+        runner_path.write_text(PROFILE_RUNNER, encoding='utf-8')
+        status, stdout, stderr, _ = run_program_sandboxed(
+            runner_path, "", workdir, timeout=PROFILE_TIMEOUT_SECONDS, cpu_seconds=PROFILE_CPU_SECONDS
+        )
+        payload = result_path.read_text(encoding='utf-8') if result_path.exists() else ""
     
-    # Parse Aim score (out of 10)
-    aim_match = re.search(r"AIM EVALUATION:.?Score:\s(\d+(?:\.\d+)?)", relevance_text, re.DOTALL)
-    if aim_match:
-        aim_score = float(aim_match.group(1))
-        scores["aim"]["score"] = aim_score
-        
-        # Extract explanation
-        aim_exp_match = re.search(r"AIM EVALUATION:.?Explanation:\s(.*?)(?=Related:|$)", relevance_text, re.DOTALL)
-        if aim_exp_match:
-            scores["aim"]["explanation"] = aim_exp_match.group(1).strip()
-    
-    # Parse Algorithm score (out of 10, scale to 15)
-    algo_match = re.search(r"ALGORITHM EVALUATION:.?Score:\s(\d+(?:\.\d+)?)", relevance_text, re.DOTALL)
-    if algo_match:
-        algo_score = float(algo_match.group(1))
-        scores["algorithm"]["score"] = (algo_score / 10) * 15
-        
-        # Extract explanation
-        algo_exp_match = re.search(r"ALGORITHM EVALUATION:.?Explanation:\s(.*?)(?=Related:|$)", relevance_text, re.DOTALL)
-        if algo_exp_match:
-            scores["algorithm"]["explanation"] = algo_exp_match.group(1).strip()
-    
-    # Parse Result score (out of 10)
-    result_match = re.search(r"RESULT EVALUATION:.?Score:\s(\d+(?:\.\d+)?)", relevance_text, re.DOTALL)
-    if result_match:
-        result_score = float(result_match.group(1))
-        scores["result"]["score"] = result_score
-        
-        # Extract explanation
-        result_exp_match = re.search(r"RESULT EVALUATION:.?Explanation:\s(.*?)(?=Related:|$)", relevance_text, re.DOTALL)
-        if result_exp_match:
-            scores["result"]["explanation"] = result_exp_match.group(1).strip()
+    report = {"status": status, "student": None, "reference": None,
+              "student_class": None, "reference_class": None, "time_ratio": None,
+              "rating": None, "error": ""}
+    if status == "timeout":
+        report["error"] = (f"Profiling exceeded its limit of {PROFILE_CPU_SECONDS}s CPU "
+                           f"or {PROFILE_TIMEOUT_SECONDS}s wall-clock time")
+        report["rating"] = 2.0
+        return report
     
-    # Parse Program score (combine correctness, efficiency, code quality - scale to 50)
-    correctness_match = re.search(r"CORRECTNESS.*?(\d+(?:\.\d+)?)/10", program_text, re.DOTALL)
-    efficiency_match = re.search(r"EFFICIENCY.*?(\d+(?:\.\d+)?)/10", program_text, re.DOTALL)
-    quality_match = re.search(r"CODE QUALITY.*?(\d+(?:\.\d+)?)/10", program_text, re.DOTALL)
+    try:
+        data = json.loads(payload)
+    except ValueError:
+        data = None
+    if not isinstance(data, dict) or not isinstance(data.get("student"), dict):
+        report["status"] = "error"
+        report["error"] = stderr.strip().splitlines()[-1] if stderr.strip() else "Profiler produced no result"
+        return report
     
-    correctness = float(correctness_match.group(1)) if correctness_match else 5
-    efficiency = float(efficiency_match.group(1)) if efficiency_match else 5
-    quality = float(quality_match.group(1)) if quality_match else 5
+    student = data["student"]
+    reference = data.get("reference")
+    if "error" in student:
+        report["status"] = "error"
+        report["error"] = student["error"]
+        return report
     
-    # Program score is weighted average of correctness (50%), efficiency (30%), quality (20%)
-    program_score = (correctness * 0.5 + efficiency * 0.3 + quality * 0.2) * 5  # Scale to 50
-    scores["program"]["score"] = program_score
+    report["student"] = student["rows"]
+    report["student_class"] = fit_complexity(student["rows"])
+    time_ratio = None
+    if reference and "rows" in reference:
+        report["reference"] = reference["rows"]
+        report["reference_class"] = fit_complexity(reference["rows"])
+        reference_time = reference["rows"][-1]["seconds"]
+        if reference_time > 0:
+            time_ratio = student["rows"][-1]["seconds"] / reference_time
+    report["time_ratio"] = time_ratio
+    report["rating"] = efficiency_rating(report["student_class"], report["reference_class"], time_ratio)
+    return report
+
+def apply_profile_results(scores, profile_report):
+    """Replace the model's EFFICIENCY rating with the measured one."""
+    if not profile_report or profile_report["rating"] is None:
+        return scores
+    return rescore_submission(scores, {"efficiency": profile_report["rating"]})
+
+def format_profile_report(profile_report):
+    if profile_report["rating"] is None:
+        return f"Profiling failed: {profile_report['error']}"
+    if not profile_report["student"]:
+        return f"{profile_report['error']}\n\nEfficiency rating: {profile_report['rating']:.1f}/10"
     
-    # Extract program explanation
-    strengths_match = re.search(r"strengths.?:(.?)(?=weaknesses|$)", program_text, re.DOTALL | re.IGNORECASE)
-    if strengths_match:
-        scores["program"]["explanation"] = strengths_match.group(1).strip()
+    lines = [
+        f"- *Measured growth*: {profile_report['student_class'] or 'unknown'}"
+        + (f" (reference: {profile_report['reference_class'] or 'unknown'})" if profile_report["reference"] else ""),
+        f"- *Efficiency rating*: {profile_report['rating']:.1f}/10",
+        "",
+        "| n | Time (ms) | Peak memory (KB) | Reference time (ms) | Reference memory (KB) |",
+        "|---|-----------|------------------|---------------------|-----------------------|",
+    ]
+    reference_rows = profile_report["reference"] or []
+    for i, row in enumerate(profile_report["student"]):
+        reference = reference_rows[i] if i < len(reference_rows) else None
+        lines.append(
+            f"| {row['n']} | {row['seconds'] * 1000:.3f} | {row['peak_bytes'] / 1024:.1f} | "
+            + (f"{reference['seconds'] * 1000:.3f} | {reference['peak_bytes'] / 1024:.1f} |" if reference else "- | - |")
+        )
+    return "\n".join(lines)
+
+# =========================
+# SIMILARITY DETECTION
+# =========================
+# Programs are compared on normalized token k-grams, so renaming variables or
+# reformatting does not hide copying. Winnowing picks a small, position-independent
+# fingerprint set per program; MinHash + LSH banding then proposes candidate pairs
+# in roughly linear time, and only those pairs get an exact Jaccard check.
+SIMILARITY_THRESHOLD = 0.6
+SIMILARITY_KGRAM = 5
+SIMILARITY_WINDOW = 4
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16
+MIN_FINGERPRINTS = 3
+# Fingerprints found in more than this share of a batch are treated as boilerplate
+COMMON_FINGERPRINT_SHARE = 0.5
+COMMON_FINGERPRINT_MIN_BATCH = 10
+# Members of an oversized LSH bucket are compared with their nearest neighbours only
+LSH_MAX_BUCKET = 32
+LSH_BUCKET_NEIGHBOURS = 8
+MERSENNE_PRIME = (1 << 61) - 1
+KEPT_NAMES = set(keyword.kwlist) | set(dir(builtins))
+
+def normalize_program_tokens(program):
+    """
+    Tokenize a program with identifiers, numbers and strings replaced by
+    placeholders; keywords, builtins, operators and layout are kept.
+    """
+    tokens = []
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(program).readline):
+            if token.type == tokenize.NAME:
+                tokens.append(token.string if token.string in KEPT_NAMES else "V")
+            elif token.type == tokenize.NUMBER:
+                tokens.append("N")
+            elif token.type == tokenize.STRING:
+                tokens.append("S")
+            elif token.type in (tokenize.OP, tokenize.INDENT, tokenize.DEDENT):
+                tokens.append(token.string if token.type == tokenize.OP else tokenize.tok_name[token.type])
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        # OCR'd code often does not tokenize; fall back to a plain word/symbol split
+        tokens = []
+        for word in re.findall(r"[A-Za-z_]\w*|\d+|\S", program):
+            if word[0].isdigit():
+                tokens.append("N")
+            elif word[0].isalpha() or word[0] == "_":
+                tokens.append(word if word in KEPT_NAMES else "V")
+            else:
+                tokens.append(word)
+    return tokens
+
+def stable_hash(text):
+    """64-bit hash that is identical across processes and runs, unlike hash()."""
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'big')
+
+def winnow_fingerprints(tokens, k=SIMILARITY_KGRAM, window=SIMILARITY_WINDOW):
+    """Select the minimum k-gram hash from every window of consecutive k-grams."""
+    hashes = [stable_hash(" ".join(tokens[i:i + k])) for i in range(len(tokens) - k + 1)]
+    if len(hashes) <= window:
+        return set(hashes)
+    return {min(hashes[i:i + window]) for i in range(len(hashes) - window + 1)}
+
+def minhash_permutations(count=MINHASH_PERMUTATIONS, seed=1):
+    rng = random.Random(seed)
+    return [(rng.randrange(1, MERSENNE_PRIME), rng.randrange(0, MERSENNE_PRIME)) for _ in range(count)]
+
+MINHASH_PARAMS = minhash_permutations()
+
+def minhash_signature(fingerprints):
+    return tuple(min((a * f + b) % MERSENNE_PRIME for f in fingerprints) for a, b in MINHASH_PARAMS)
+
+def lsh_candidate_pairs(signatures, bands=LSH_BANDS):
+    """Pairs of keys whose signatures agree on at least one whole band."""
+    rows = len(MINHASH_PARAMS) // bands
+    candidates = set()
+    for band in range(bands):
+        buckets = {}
+        for key, signature in signatures.items():
+            buckets.setdefault(signature[band * rows:(band + 1) * rows], []).append(key)
+        for members in buckets.values():
+            if len(members) > LSH_MAX_BUCKET:
+                # Keep a huge bucket (e.g. one shared template) from going quadratic
+                members.sort(key=signatures.get)
+                reach = LSH_BUCKET_NEIGHBOURS
+            else:
+                reach = len(members)
+            for i in range(len(members)):
+                for j in range(i + 1, min(len(members), i + 1 + reach)):
+                    candidates.add((members[i], members[j]))
+    return candidates
+
+def jaccard(first, second):
+    return len(first & second) / len(first | second) if first or second else 0.0
+
+def find_similar_programs(programs, threshold=None):
+    """
+    Group programs ({student_id: source}) whose fingerprint similarity reaches the threshold.
+    Returns clusters as dicts of sorted members and their highest pairwise similarity.
+    """
+    threshold = SIMILARITY_THRESHOLD if threshold is None else threshold
+    fingerprints = {}
+    for student_id, program in programs.items():
+        prints = winnow_fingerprints(normalize_program_tokens(program or ""))
+        if prints:
+            fingerprints[student_id] = prints
     
-    # Parse Output score (combine output correctness and presentation - scale to 15)
-    output_corr_match = re.search(r"OUTPUT CORRECTNESS.*?(\d+(?:\.\d+)?)/10", program_text, re.DOTALL)
-    output_pres_match = re.search(r"OUTPUT PRESENTATION.*?(\d+(?:\.\d+)?)/10", program_text, re.DOTALL)
+    if len(fingerprints) >= COMMON_FINGERPRINT_MIN_BATCH:
+        counts = {}
+        for prints in fingerprints.values():
+            for fingerprint in prints:
+                counts[fingerprint] = counts.get(fingerprint, 0) + 1
+        limit = COMMON_FINGERPRINT_SHARE * len(fingerprints)
+        common = {fingerprint for fingerprint, count in counts.items() if count > limit}
+        if common:
+            fingerprints = {student_id: prints - common for student_id, prints in fingerprints.items()}
+    fingerprints = {
+        student_id: prints for student_id, prints in fingerprints.items()
+        if len(prints) >= MIN_FINGERPRINTS
+    }
+    signatures = {student_id: minhash_signature(prints) for student_id, prints in fingerprints.items()}
     
-    output_corr = float(output_corr_match.group(1)) if output_corr_match else 5
-    output_pres = float(output_pres_match.group(1)) if output_pres_match else 5
+    parent = {student_id: student_id for student_id in fingerprints}
+    def find(student_id):
+        while parent[student_id] != student_id:
+            parent[student_id] = parent[parent[student_id]]
+            student_id = parent[student_id]
+        return student_id
     
-    # Output score is weighted average of correctness (70%) and presentation (30%)
-    output_score = (output_corr * 0.7 + output_pres * 0.3) * 1.5  # Scale to 15
-    scores["output"]["score"] = output_score
+    pairs = {}
+    for first, second in lsh_candidate_pairs(signatures):
+        similarity = jaccard(fingerprints[first], fingerprints[second])
+        if similarity >= threshold:
+            pairs[(first, second)] = similarity
+            parent[find(first)] = find(second)
     
-    # Calculate total score
-    total_score = (
-        scores["aim"]["score"] +
-        scores["algorithm"]["score"] +
-        scores["program"]["score"] +
-        scores["output"]["score"] +
-        scores["result"]["score"]
+    clusters = {}
+    for (first, second), similarity in pairs.items():
+        cluster = clusters.setdefault(find(first), {"members": set(), "similarity": 0.0})
+        cluster["members"].update((first, second))
+        cluster["similarity"] = max(cluster["similarity"], similarity)
+    clusters = [
+        {"members": sorted(cluster["members"]), "similarity": round(cluster["similarity"], 3)}
+        for cluster in clusters.values()
+    ]
+    clusters.sort(key=lambda cluster: (-cluster["similarity"], cluster["members"]))
+    return clusters
+
+def find_similar_submissions(results, threshold=None):
+    """
+    Run similarity detection over the Program sections of a graded batch.
+    Identical submissions are reported as such already, so each group of them
+    takes part once, through its first member; copies would otherwise form
+    clusters of their own and make their fingerprints look common to the batch.
+    A cluster lists every member of the groups it contains.
+    """
+    programs = {}
+    copies = {}
+    for result in results:
+        if not result["sections"] or any(other in programs for other in result["duplicates"]):
+            continue
+        programs[result["student"]] = result["sections"].get("program", "")
+        copies[result["student"]] = result["duplicates"]
+    clusters = find_similar_programs(programs, threshold)
+    for cluster in clusters:
+        cluster["members"] = sorted(
+            member for student_id in cluster["members"] for member in [student_id] + copies[student_id]
+        )
+    return clusters
+
+# =========================
+# BATCH JOURNAL
+# =========================
+# Each submission's stage results are written to a SQLite journal in the output
+# folder as they complete: extracted text, sections, model evaluation and the
+# final result. A restarted batch reuses whatever is there, so a crash halfway
+# through never pays for the same OCR or model call twice. Entries are keyed by
+# submission content plus the settings each stage depends on, so edited files
+# or changed options are simply graded again.
+JOURNAL_ENABLED = True
+JOURNAL_FILENAME = "journal.sqlite3"
+JOURNAL_PATH = None
+_journal_lock = threading.Lock()
+JOURNAL_STATS = {"text": 0, "sections": 0, "evaluation": 0, "result": 0}
+
+def open_batch_journal(output_dir, resume=True):
+    """Use the journal in output_dir for this batch; without resume, earlier entries are discarded."""
+    global JOURNAL_PATH
+    if not JOURNAL_ENABLED:
+        JOURNAL_PATH = None
+        return
+    JOURNAL_PATH = Path(output_dir) / JOURNAL_FILENAME
+    if not resume and JOURNAL_PATH.exists():
+        JOURNAL_PATH.unlink()
+
+def journal_connect():
+    conn = sqlite3.connect(JOURNAL_PATH, timeout=30)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS stages ("
+        "submission TEXT, stage TEXT, settings TEXT, data TEXT, updated REAL, "
+        "PRIMARY KEY (submission, stage))"
     )
-    
-    # Ensure minimum 60% if submission is completely unrelated
-    if total_score < 60:
-        total_score = 60
-    
-    scores["total"]["score"] = round(total_score, 2)
-    
-    return scores
+    return conn
 
-def offline_evaluate_submission(sections, problem_text):
+def journal_settings_key(*parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+def text_settings_key():
+    """OCR settings behind a submission's extracted text: the usable backends and how they are tuned."""
+    backends = sorted({
+        (backend["name"], backend["settings"]()) for kind in ("image", "pdf") for backend in ocr_backends_for(kind)
+    })
+    return journal_settings_key(backends, OCR_CONFIDENCE_THRESHOLD, PDF_DPI, GEMINI_MODEL)
+
+def sections_settings_key():
+    """Section parsing depends on the text plus the recognizer thresholds and whether Gemini may re-split."""
+    return journal_settings_key(
+        text_settings_key(), SECTION_CONFIDENCE_THRESHOLD, FUZZY_HEADER_CUTOFF, GENAI_AVAILABLE, GEMINI_MODEL
+    )
+
+def evaluation_settings_key(problem_text, include_output):
+    return journal_settings_key(
+        sections_settings_key(), problem_text, GEMINI_MODEL, STRUCTURED_EVALUATION_ENABLED, include_output
+    )
+
+def result_settings_key(problem_text):
+    """Everything besides the evaluation that shapes a finished result."""
+    return journal_settings_key(
+        sections_settings_key(), problem_text, GEMINI_MODEL, STRUCTURED_EVALUATION_ENABLED, ENABLED_RULES,
+        RULE_PENALTY_CAP, TEST_CASES, PROFILE_CONFIG, OUTPUT_VERIFICATION_ENABLED, OUTPUT_PROGRAM_INPUT,
+        OUTPUT_EXPECTED
+    )
+
+def journal_submission_id(path):
+    """Journal key for a submission file, or None when there is no journal."""
+    if JOURNAL_PATH is None:
+        return None
+    try:
+        return submission_fingerprint(path)
+    except OSError:
+        return None
+
+def journal_get(submission_id, stage, settings=""):
+    """Return the recorded data for a submission's stage, or None if missing or made with other settings."""
+    if submission_id is None:
+        return None
+    try:
+        with _journal_lock:
+            conn = journal_connect()
+            try:
+                row = conn.execute(
+                    "SELECT settings, data FROM stages WHERE submission = ? AND stage = ?", (submission_id, stage)
+                ).fetchone()
+            finally:
+                conn.close()
+    except sqlite3.Error as e:
+        print(f"Warning: could not read batch journal: {e}")
+        return None
+    if row is None or row[0] != settings:
+        return None
+    JOURNAL_STATS[stage] += 1
+    return json.loads(row[1])
+
+def journal_put(submission_id, stage, data, settings=""):
+    if submission_id is None:
+        return
+    try:
+        with _journal_lock:
+            conn = journal_connect()
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO stages VALUES (?, ?, ?, ?, ?)",
+                    (submission_id, stage, settings, json.dumps(data), time.time())
+                )
+                conn.commit()
+            finally:
+                conn.close()
+    except (sqlite3.Error, TypeError, ValueError) as e:
+        print(f"Warning: could not write batch journal: {e}")
+
+def is_offline_evaluation(evaluation):
+    """Offline default scores stand in for a missing model answer and must not be resumed as real grades."""
+    return "EVALUATION (OFFLINE MODE)" in (evaluation or "")
+
+def journal_finished_result(submission_id, result, problem_text):
+    """Fill result from a finished journal entry; returns False if the submission still needs grading."""
+    finished = journal_get(submission_id, "result", result_settings_key(problem_text))
+    if finished is None:
+        return False
+    result.update({key: value for key, value in finished.items() if key not in ("student", "path")})
+    return True
+
+def journal_record_result(submission_id, result, problem_text):
+    if result["status"] == "ok" and not is_offline_evaluation(result["evaluation"]):
+        journal_put(submission_id, "result", result, result_settings_key(problem_text))
+
+def print_journal_stats():
+    if any(JOURNAL_STATS.values()):
+        reused = ", ".join(f"{count} {stage}" for stage, count in JOURNAL_STATS.items())
+        print(f"Batch journal: reused {reused} from an earlier run")
+
+# =========================
+# BATCH GRADING (HEADLESS)
+# =========================
+TEXT_SUBMISSION_EXTENSIONS = {'.txt', '.py', '.md'}
+FILE_SUBMISSION_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.pdf'}
+SUPPORTED_SUBMISSION_EXTENSIONS = TEXT_SUBMISSION_EXTENSIONS | FILE_SUBMISSION_EXTENSIONS
+DEFAULT_BATCH_WORKERS = 4
+
+def collect_submissions(source):
     """
-    Offline evaluation of submission with default scores.
+    Collect (student_id, path) pairs from a folder of submissions or a CSV manifest.
+    A manifest has a header row with 'student' and 'path' columns; relative paths
+    are resolved against the manifest's folder. A subfolder (or a manifest path
+    to a folder) holds one submission's pages.
     """
-    scores = {
-        "aim": {"max": 10, "score": 7, "explanation": "Basic aim provided but could be more specific."},
-        "algorithm": {"max": 15, "score": 10, "explanation": "Algorithm covers main steps but lacks detail."},
-        "program": {"max": 50, "score": 35, "explanation": "Program implements basic functionality."},
-        "output": {"max": 15, "score": 10, "explanation": "Output shows expected results."},
-        "result": {"max": 10, "score": 7, "explanation": "Result summarizes findings but lacks analysis."},
-        "total": {"max": 100, "score": 69}
-    }
-    
-    evaluation_text = f"""
-    SUBMISSION EVALUATION (OFFLINE MODE)
-    
-    AIM EVALUATION:
-    Score: 7/10
-    Explanation: Basic aim provided but could be more specific.
-    Related: Yes
+    source = Path(source)
+    submissions = []
     
-    ALGORITHM EVALUATION:
-    Score: 6.7/10
-    Explanation: Algorithm covers main steps but lacks detail.
-    Related: Yes
+    if source.is_dir():
+        for path in sorted(source.iterdir()):
+            if path.is_file() and path.suffix.lower() in SUPPORTED_SUBMISSION_EXTENSIONS:
+                submissions.append((path.stem, path))
+            elif path.is_dir() and submission_pages(path):
+                # A folder of photos or scans is one multi-page submission
+                submissions.append((path.name, path))
+        return disambiguate_student_ids(submissions)
     
-    PROGRAM EVALUATION:
-    Correctness: 7/10
-    Efficiency: 6/10
-    Code Quality: 7/10
+    with open(source, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            path = Path(row['path'].strip())
+            if not path.is_absolute():
+                path = source.parent / path
+            student_id = (row.get('student') or '').strip() or path.stem
+            submissions.append((student_id, path))
+    return disambiguate_student_ids(submissions)
+
+def disambiguate_student_ids(submissions):
+    """
+    Make student IDs unique so reports and summary rows do not overwrite each other.
+    alice.pdf and alice.jpg become alice_pdf and alice_jpg; IDs still shared after
+    that (a manifest listing a student twice) get a running number. IDs are
+    compared case-insensitively because report files may land on a
+    case-insensitive filesystem.
+    """
+    counts = Counter(student_id.casefold() for student_id, _ in submissions)
+    if all(count == 1 for count in counts.values()):
+        return submissions
     
-    OUTPUT EVALUATION:
-    Correctness: 7/10
-    Presentation: 6/10
+    renamed = []
+    for student_id, path in submissions:
+        if counts[student_id.casefold()] > 1:
+            suffix = path.suffix.lower().lstrip('.') or "pages"
+            student_id = f"{student_id}_{suffix}"
+        renamed.append((student_id, path))
     
-    RESULT EVALUATION:
-    Score: 7/10
-    Explanation: Result summarizes findings but lacks analysis.
-    Related: Yes
+    taken = set()
+    unique = []
+    for student_id, path in renamed:
+        candidate, number = student_id, 1
+        while candidate.casefold() in taken:
+            number += 1
+            candidate = f"{student_id}_{number}"
+        taken.add(candidate.casefold())
+        unique.append((candidate, path))
     
-    Strengths: Basic implementation meets requirements.
-    Weaknesses: Could improve efficiency and add more comments.
+    changed = [(old, new) for (old, _), (new, _) in zip(submissions, unique) if old != new]
+    print(f"Warning: {len(changed)} submissions shared a student ID and were renamed: "
+          + ", ".join(f"{old} -> {new}" for old, new in changed))
+    return unique
+
+def submission_pages(path):
+    """Page files of a multi-page submission folder in natural order (page2 before page10)."""
+    natural_key = lambda page: [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', page.name)]
+    return sorted(
+        (page for page in Path(path).iterdir() if page.is_file() and page.suffix.lower() in FILE_SUBMISSION_EXTENSIONS),
+        key=natural_key
+    )
+
+def submission_image_paths(path):
+    """Images that would be OCR'd for a submission, for batched Gemini OCR."""
+    path = Path(path)
+    pages = submission_pages(path) if path.is_dir() else [path]
+    return [page for page in pages if page.suffix.lower() in IMAGE_SUBMISSION_EXTENSIONS]
+
+def load_submission_text_with_confidence(path):
     """
+    Read a text submission directly, or run OCR for images, PDFs and folders of pages.
+    Returns (text, confidence); typed text has confidence 1.0 and a folder has
+    the confidence of its weakest page.
+    """
+    path = Path(path)
+    if path.is_dir():
+        pages = submission_pages(path)
+        with measure_stage("extract", bytes=sum(page.stat().st_size for page in pages)) as fields:
+            # Pack the folder's photos into as few Gemini requests as possible first
+            prefetch_gemini_ocr(submission_image_paths(path))
+            results = [extract_text_with_confidence(str(page)) for page in pages]
+            text = "\n\n".join(page_text or "" for page_text, _ in results).strip()
+            fields["pages"] = len(pages)
+            fields["chars"] = len(text)
+        return text, min((confidence for _, confidence in results), default=0.0)
     
-    return evaluation_text, scores
+    stage = "load" if path.suffix.lower() in TEXT_SUBMISSION_EXTENSIONS else "extract"
+    with measure_stage(stage, bytes=path.stat().st_size) as fields:
+        if stage == "load":
+            text, confidence = path.read_text(encoding='utf-8', errors='replace'), 1.0
+        else:
+            text, confidence = extract_text_with_confidence(str(path))
+        fields["chars"] = len(text or "")
+    return text, confidence
 
-def parse_mark_breakdown(evaluation_text):
+def load_submission_text(path):
+    """Read a text submission directly, or run OCR for images, PDFs and folders of pages."""
+    return load_submission_text_with_confidence(path)[0]
+
+def submission_fingerprint(path):
     """
-    Extract individual scores from evaluation text.
+    Content hash used to spot identical submissions: text is hashed after
+    normalizing line endings, trailing whitespace and blank lines (indentation
+    and spacing inside lines still count), scans and PDFs by their exact bytes,
+    folders page by page.
     """
-    breakdown = {
-        "problem_solving": 5,
-        "logic_quality": 5,
-        "readability": 5,
-        "effort": 5,
-        "overall": 5
+    path = Path(path)
+    if path.is_dir():
+        page_hashes = "\n".join(file_sha256(page) for page in submission_pages(path))
+        return "pages:" + hashlib.sha256(page_hashes.encode('utf-8')).hexdigest()
+    if path.suffix.lower() in TEXT_SUBMISSION_EXTENSIONS:
+        text = path.read_text(encoding='utf-8', errors='replace')
+        lines = [line.rstrip() for line in text.splitlines() if line.strip()]
+        return "text:" + hashlib.sha256("\n".join(lines).encode('utf-8')).hexdigest()
+    return "file:" + file_sha256(path)
+
+def group_identical_submissions(submissions):
+    """
+    Group (student_id, path) pairs whose content is identical, in submission order.
+    Unreadable files get a group of their own so grading reports the error.
+    """
+    groups = {}
+    for student_id, path in submissions:
+        try:
+            key = submission_fingerprint(path)
+        except OSError:
+            key = ("unreadable", student_id)
+        groups.setdefault(key, []).append((student_id, path))
+    return list(groups.values())
+
+def fan_out_result(result, group):
+    """Copy one graded result to every student in its group of identical submissions."""
+    students = [student_id for student_id, _ in group]
+    results = []
+    for student_id, path in group:
+        copy = dict(result, student=student_id, path=str(path))
+        copy["duplicates"] = [other for other in students if other != student_id]
+        results.append(copy)
+    return results
+
+def submission_order(submissions):
+    """Sort key that puts results back in submission order; keyed on student and path together."""
+    order = {(student_id, str(path)): i for i, (student_id, path) in enumerate(submissions)}
+    return lambda result: order[(result["student"], result["path"])]
+
+def new_grading_result(student_id, path):
+    return {
+        "student": student_id,
+        "path": str(path),
+        "status": "ok",
+        "error": "",
+        "sections": None,
+        "evaluation": "",
+        "scores": None,
+        "code_findings": None,
+        "test_report": None,
+        "profile_report": None,
+        "output_report": None,
+        "duplicates": []
     }
+
+def run_program_tests(sections, scores):
+    """Run the instructor's test cases, if any, and fold the pass rate into the scores."""
+    if not TEST_CASES or not sections.get("program"):
+        return None, scores
+    test_report = run_test_cases(sections["program"], TEST_CASES)
+    return test_report, apply_test_results(scores, test_report)
+
+def run_program_profile(sections, scores):
+    """Profile the program against the instructor's inputs, if configured, and fold in the efficiency rating."""
+    if not PROFILE_CONFIG or not sections.get("program"):
+        return None, scores
+    profile_report = profile_program(sections["program"], PROFILE_CONFIG)
+    return profile_report, apply_profile_results(scores, profile_report)
+
+def run_output_verification(sections):
+    """Run the program and compare outputs, if output verification is enabled."""
+    if not OUTPUT_VERIFICATION_ENABLED or not sections.get("program"):
+        return None
+    return verify_program_output(sections)
+
+def prepare_grading(journal_id, path, problem_text):
+    """
+    Everything before the model evaluation: text extraction (or the pipelined PDF
+    path), section parsing, output verification and the journaled evaluation.
+    Returns a dict; "scores" is None when the submission still needs evaluating.
+    Shared by grade_submission and grade_submission_async, which runs it in a thread.
+    """
+    sections = output_report = evaluation = scores = None
+    text_key = text_settings_key()
+    submission_text = journal_get(journal_id, "text", text_key)
+    # Text read from the journal was confident when it was recorded
+    confidence = 1.0
+    if submission_text is not None:
+        sections = journal_get(journal_id, "sections", sections_settings_key())
+    elif can_stream_pdf(path):
+        try:
+            submission_text, confidence, sections, output_report, evaluation, scores = grade_pdf_streaming(path, problem_text)
+        except Exception as e:
+            print(f"Pipelined PDF evaluation failed: {e}. Falling back to the standard pipeline...")
+            submission_text, confidence = load_submission_text_with_confidence(path)
+    else:
+        submission_text, confidence = load_submission_text_with_confidence(path)
     
-    # Try to extract scores using regex
-    patterns = [
-        (r"PROBLEM SOLVING.*?(\d+(?:\.\d+)?)/10", "problem_solving"),
-        (r"LOGIC QUALITY.*?(\d+(?:\.\d+)?)/10", "logic_quality"),
-        (r"READABILITY.*?(\d+(?:\.\d+)?)/10", "readability"),
-        (r"EFFORT.*?(\d+(?:\.\d+)?)/10", "effort"),
-        (r"Overall.?score.?(\d+(?:\.\d+)?)/10", "overall"),
-        (r"weighted score.*?(\d+(?:\.\d+)?)/10", "overall")
-    ]
-    
-    for pattern, key in patterns:
-        match = re.search(pattern, evaluation_text, re.IGNORECASE | re.DOTALL)
-        if match:
-            breakdown[key] = float(match.group(1))
-    
-    # If overall not found, calculate average
-    if breakdown["overall"] == 5:
-        breakdown["overall"] = (breakdown["problem_solving"] + breakdown["logic_quality"] + 
-                                breakdown["readability"] + breakdown["effort"]) / 4
+    if not submission_text or not submission_text.strip():
+        raise ValueError("No text could be extracted from the submission")
     
-    return breakdown
+    # Weak OCR is graded but not journaled, so a resumed batch reads the file again
+    journal_text = confidence >= OCR_CONFIDENCE_THRESHOLD
+    if journal_text:
+        journal_put(journal_id, "text", submission_text, text_key)
+    if sections is None:
+        sections = parse_submission_sections(submission_text)
+        if journal_text:
+            journal_put(journal_id, "sections", sections, sections_settings_key())
+    if output_report is None:
+        output_report = run_output_verification(sections)
+    include_output = output_needs_model(output_report)
+    evaluation_key = evaluation_settings_key(problem_text, include_output)
+    if scores is None:
+        recorded = journal_get(journal_id, "evaluation", evaluation_key)
+        if recorded is not None:
+            evaluation, scores = recorded["evaluation"], recorded["scores"]
+    return {
+        "sections": sections,
+        "output_report": output_report,
+        "include_output": include_output,
+        "evaluation_key": evaluation_key,
+        "evaluation": evaluation,
+        "scores": scores,
+    }
 
-def offline_evaluate_code_with_breakdown(code, problem_text):
+def finish_grading(journal_id, result, problem_text, grading):
     """
-    Offline evaluation with mark breakdown.
+    Everything after the model evaluation: journal it, run the tests, profile and
+    code checks, and fill in result. Shared by the sync and async engines.
     """
-    breakdown = {
-        "problem_solving": 5,
-        "logic_quality": 5,
-        "readability": 5,
-        "effort": 5,
-        "overall": 5
-    }
+    sections, evaluation, scores = grading["sections"], grading["evaluation"], grading["scores"]
+    if not is_offline_evaluation(evaluation):
+        journal_put(journal_id, "evaluation", {"evaluation": evaluation, "scores": scores}, grading["evaluation_key"])
     
-    try:
-        compile(code, "<string>", "exec")
-        syntax_ok = True
-        breakdown["problem_solving"] = 6
-    except:
-        syntax_ok = False
-        breakdown["problem_solving"] = 2
+    test_report, scores = run_program_tests(sections, scores)
+    profile_report, scores = run_program_profile(sections, scores)
+    scores = apply_output_verification(scores, grading["output_report"])
+    code_findings = check_program_section(sections)
+    scores = apply_rule_penalties(scores, code_findings)
     
-    # Check code features
-    has_function = bool(re.search(r'def\s+\w+\s*\(', code))
-    has_return = 'return' in code
-    has_comments = '#' in code
-    lines = code.split('\n')
-    non_empty_lines = [l for l in lines if l.strip()]
+    result["sections"] = sections
+    result["evaluation"] = evaluation
+    result["scores"] = scores
+    result["code_findings"] = code_findings
+    result["test_report"] = test_report
+    result["profile_report"] = profile_report
+    result["output_report"] = grading["output_report"]
+    journal_record_result(journal_id, result, problem_text)
+
+def grade_submission(student_id, path, problem_text):
+    """
+    Run extraction, section parsing and evaluation for one submission without prompts.
+    Returns a result dict; failures are recorded in it instead of being raised.
+    """
+    result = new_grading_result(student_id, path)
     
-    # Logic quality
-    if syntax_ok and has_function:
-        breakdown["logic_quality"] = 6
-    elif syntax_ok:
-        breakdown["logic_quality"] = 4
-    else:
-        breakdown["logic_quality"] = 2
+    with submission_metrics(student_id):
+        journal_id = journal_submission_id(path)
+        if journal_finished_result(journal_id, result, problem_text):
+            return result
+        try:
+            grading = prepare_grading(journal_id, path, problem_text)
+            if grading["scores"] is None:
+                grading["evaluation"], grading["scores"] = evaluate_submission_with_marking_scheme(
+                    grading["sections"], problem_text, grading["include_output"]
+                )
+            finish_grading(journal_id, result, problem_text, grading)
+        except Exception as e:
+            result["status"] = "failed"
+            result["error"] = str(e)
     
-    # Readability
-    if has_comments and len(non_empty_lines) > 5:
-        breakdown["readability"] = 7
-    elif len(non_empty_lines) > 3:
-        breakdown["readability"] = 5
-    else:
-        breakdown["readability"] = 3
+    return result
+
+def report_filename(student_id):
+    """Build a filesystem-safe report file name for a student."""
+    return re.sub(r'[^\w.-]', '_', student_id) + ".md"
+
+def write_submission_report(result, problem_text, output_dir):
+    """Write the markdown report for one graded submission."""
+    report_path = Path(output_dir) / report_filename(result["student"])
+    markdown_output = generate_markdown_output(
+        result["scores"], result["evaluation"], problem_text,
+        result["code_findings"], result["test_report"], result["profile_report"],
+        result["output_report"], result["duplicates"]
+    )
+    with open(report_path, 'w', encoding='utf-8') as f:
+        f.write(markdown_output)
+    return report_path
+
+def write_batch_summary(results, output_dir, similarity_clusters=None):
+    """Write summary.csv and summary.md covering every submission in the batch."""
+    output_dir = Path(output_dir)
+    section_keys = ["aim", "algorithm", "program", "output", "result"]
     
-    # Effort
-    if len(non_empty_lines) > 10:
-        breakdown["effort"] = 8
-    elif len(non_empty_lines) > 5:
-        breakdown["effort"] = 6
-    else:
-        breakdown["effort"] = 4
+    with open(output_dir / "summary.csv", 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(["student", "path", "status"] + section_keys + ["total", "error"])
+        for result in results:
+            scores = result["scores"]
+            if scores:
+                marks = [f"{scores[key]['score']:.2f}" for key in section_keys]
+                total = f"{scores['total']['score']:.2f}"
+            else:
+                marks = [""] * len(section_keys)
+                total = ""
+            writer.writerow([result["student"], result["path"], result["status"]] + marks + [total, result["error"]])
     
-    # Overall
-    breakdown["overall"] = sum([breakdown["problem_solving"], breakdown["logic_quality"],
-                                breakdown["readability"], breakdown["effort"]]) / 4
+    graded = [r for r in results if r["scores"]]
+    average = sum(r["scores"]["total"]["score"] for r in graded) / len(graded) if graded else 0
     
-    evaluation = f"""
-    Code Evaluation:
+    lines = [
+        "# Batch Evaluation Summary",
+        "",
+        f"- *Submissions*: {len(results)}",
+        f"- *Graded*: {len(graded)}",
+        f"- *Failed*: {len(results) - len(graded)}",
+        f"- *Average Score*: {average:.2f}/100",
+        "",
+        "| Student | Status | Total | Report |",
+        "|---------|--------|-------|--------|",
+    ]
+    for result in results:
+        if result["scores"]:
+            lines.append(f"| {result['student']} | {result['status']} | {result['scores']['total']['score']:.2f} | {report_filename(result['student'])} |")
+        else:
+            lines.append(f"| {result['student']} | {result['status']} | - | {result['error']} |")
     
-    1. PROBLEM SOLVING: {breakdown['problem_solving']}/10
-    2. LOGIC QUALITY: {breakdown['logic_quality']}/10
-    3. READABILITY & STRUCTURE: {breakdown['readability']}/10
-    4. EFFORT & RELEVANCE: {breakdown['effort']}/10
+    identical_groups = []
+    seen = set()
+    for result in results:
+        if result["duplicates"] and result["student"] not in seen:
+            group = [result["student"]] + result["duplicates"]
+            seen.update(group)
+            identical_groups.append(group)
+    if identical_groups:
+        lines.extend([
+            "",
+            "## Identical Submissions",
+            "",
+            "Each group was graded once; every member received the same result.",
+            "",
+        ])
+        for group in identical_groups:
+            lines.append(f"- {', '.join(group)}")
     
-    Overall Score: {breakdown['overall']}/10
-    """
+    if similarity_clusters:
+        lines.extend([
+            "",
+            "## Similar Programs",
+            "",
+            f"Programs whose normalized token fingerprints overlap by at least {SIMILARITY_THRESHOLD * 100:.0f}%.",
+            "",
+            "| Cluster | Students | Highest Similarity |",
+            "|---------|----------|--------------------|",
+        ])
+        for number, cluster in enumerate(similarity_clusters, 1):
+            lines.append(f"| {number} | {', '.join(cluster['members'])} | {cluster['similarity'] * 100:.0f}% |")
     
-    return evaluation, [], breakdown
+    with open(output_dir / "summary.md", 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines) + "\n")
 
-def extract_mistakes_from_evaluation(evaluation_text):
+def report_batch_result(result, problem_text, output_dir, done, total):
+    """Write one student's report and print a progress line."""
+    if result["scores"]:
+        write_submission_report(result, problem_text, output_dir)
+        print(f"[{done}/{total}] {result['student']}: {result['scores']['total']['score']:.2f}/100")
+    else:
+        print(f"[{done}/{total}] {result['student']}: FAILED ({result['error']})")
+
+def run_batch(problem_text, source, output_dir, workers=DEFAULT_BATCH_WORKERS, resume=True):
     """
-    Extract mistake points from the evaluation text.
+    Grade every submission in a folder or manifest on a bounded worker pool.
+    Writes one markdown report per student plus a batch summary into output_dir.
     """
-    mistakes = []
-    lines = evaluation_text.split('\n')
+    submissions = collect_submissions(source)
+    if not submissions:
+        print(f"No supported submissions found in {source}")
+        return []
     
-    # Look for lines that indicate mistakes
-    mistake_keywords = ['mistake', 'error', 'incorrect', 'wrong', 'missing', 'fails', 'doesn\'t handle']
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    open_batch_journal(output_dir, resume)
+    prepare_pdf_ocr_pool(submissions)
     
-    for line in lines:
-        line_lower = line.lower()
-        if any(keyword in line_lower for keyword in mistake_keywords):
-            # Clean and format the mistake
-            cleaned = line.strip()
-            if cleaned and not cleaned.startswith('#'):
-                if not cleaned.startswith('•'):
-                    cleaned = '• ' + cleaned
-                mistakes.append(cleaned)
+    groups = group_identical_submissions(submissions)
+    if len(groups) < len(submissions):
+        print(f"{len(submissions) - len(groups)} submission(s) are identical to another and will share its result")
     
-    # Also look for numbered mistakes
-    for i, line in enumerate(lines):
-        if re.match(r'^\d+\..*mistake|error|incorrect', line, re.IGNORECASE):
-            mistakes.append('• ' + line.strip())
+    results = []
+    done = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        images = [image for group in groups for image in submission_image_paths(group[0][1])]
+        prefetch_gemini_ocr(images, workers, executor)
+        
+        print(f"Grading {len(groups)} unique submissions with {workers} workers...")
+        futures = {
+            executor.submit(grade_submission, group[0][0], group[0][1], problem_text): group
+            for group in groups
+        }
+        for future in as_completed(futures):
+            for result in fan_out_result(future.result(), futures[future]):
+                done += 1
+                report_batch_result(result, problem_text, output_dir, done, len(submissions))
+                results.append(result)
     
-    return mistakes[:10]  # Limit to 10 mistakes
+    # Keep the summary in submission order regardless of completion order
+    results.sort(key=submission_order(submissions))
+    similarity_clusters = find_similar_submissions(results)
+    if similarity_clusters:
+        print(f"Found {len(similarity_clusters)} cluster(s) of similar programs")
+    write_batch_summary(results, output_dir, similarity_clusters)
+    print(f"Reports and summary written to {output_dir}")
+    print_genai_client_stats()
+    print_scheduler_stats()
+    print_journal_stats()
+    print_ocr_cache_stats()
+    print_llm_cache_stats()
+    print_rule_stats()
+    print_stage_metrics()
+    return results
 
 # =========================
-# STEP 5: GRADING WITH BREAKDOWN
+# ASYNC EVALUATION ENGINE
 # =========================
-def calculate_grade_with_breakdown(breakdown, max_marks, all_mistakes):
+async def generate_text_async(prompt, priority=PRIORITY_EVALUATION):
+    """Async version of generate_text, sharing the same response cache."""
+    cached = llm_cache_get(GEMINI_MODEL, prompt)
+    if cached is not None:
+        return cached
+    
+    client = get_genai_client()
+    response = await call_gemini_async(
+        lambda: client.aio.models.generate_content(model=GEMINI_MODEL, contents=prompt), prompt, priority
+    )
+    text = response.text if hasattr(response, 'text') else ""
+    llm_cache_put(GEMINI_MODEL, prompt, text)
+    return text
+
+async def evaluate_submission_async(sections, problem_text, include_output=True):
     """
-    Calculate grade based on detailed breakdown.
+    Async version of evaluate_submission_with_marking_scheme; the relevance
+    and program prompts are independent, so they are sent concurrently.
     """
-    # Weight for each component
-    weights = {
-        "problem_solving": 0.40,  # 40%
-        "logic_quality": 0.30,    # 30%
-        "readability": 0.15,       # 15%
-        "effort": 0.15            # 15%
-    }
-    
-    # Calculate weighted score
-    weighted_score = 0
-    for key, weight in weights.items():
-        weighted_score += (breakdown[key] / 10) * weight
-    
-    # Convert to marks
-    score = weighted_score * max_marks
-    
-    # Apply penalty for mistakes (less harsh)
-    total_mistakes = len(all_mistakes)
-    if total_mistakes > 0:
-        # Each mistake reduces score by 3%, max reduction 20%
-        penalty = min(0.2, total_mistakes * 0.03)
-        score *= (1 - penalty)
+    if not GENAI_AVAILABLE:
+        print("Google Generative AI package not installed. Using offline mode.")
+        return offline_evaluate_submission(sections, problem_text)
     
-    # Calculate individual component marks
-    component_marks = {}
-    for key, weight in weights.items():
-        component_marks[key] = round((breakdown[key] / 10) * weight * max_marks, 2)
+    try:
+        if STRUCTURED_EVALUATION_ENABLED:
+            return await evaluate_submission_structured_async(sections, problem_text, include_output)
+        relevance_text, program_text = await asyncio.gather(
+            generate_text_async(build_relevance_prompt(sections, problem_text)),
+            generate_text_async(build_program_prompt(sections, problem_text, include_output)),
+        )
+        scores = parse_submission_scores(relevance_text, program_text)
+        return combine_evaluation_text(relevance_text, program_text), scores
+    except Exception as e:
+        if not OFFLINE_FALLBACK_ENABLED:
+            raise
+        print(f"API Error: {str(e)}")
+        print("Falling back to offline mode...")
+        return offline_evaluate_submission(sections, problem_text)
+
+async def generate_json_async(prompt, schema):
+    """Async version of generate_json, sharing the same response cache."""
+    cache_prompt = structured_cache_prompt(prompt, schema)
+    cached = llm_cache_get(GEMINI_MODEL, cache_prompt)
+    if cached is not None:
+        return json.loads(cached)
     
-    return max(0, round(score, 2)), component_marks
+    client = get_genai_client()
+    response = await call_gemini_async(
+        lambda: client.aio.models.generate_content(
+            model=GEMINI_MODEL, contents=prompt, config=structured_output_config(schema)
+        ),
+        prompt
+    )
+    text = response.text if hasattr(response, 'text') else ""
+    data = json.loads(text)
+    llm_cache_put(GEMINI_MODEL, cache_prompt, text)
+    return data
 
-# =========================
-# MAIN INTERACTIVE FUNCTION
-# =========================
-def run_pipeline():
-    print("\n" + "="*60)
-    print(" STUDENT SUBMISSION EVALUATOR ")
-    print(" Using Gemini API ")
-    print("="*60)
+async def evaluate_submission_structured_async(sections, problem_text, include_output=True):
+    """Async version of evaluate_submission_structured."""
+    try:
+        data = await generate_json_async(
+            build_structured_evaluation_prompt(sections, problem_text, include_output), evaluation_schema(include_output)
+        )
+        return format_structured_evaluation(data), scores_from_structured_evaluation(data)
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        print(f"Structured evaluation response was invalid: {e}. Using the chained prompts...")
+        relevance_text, program_text = await asyncio.gather(
+            generate_text_async(build_relevance_prompt(sections, problem_text)),
+            generate_text_async(build_program_prompt(sections, problem_text, include_output)),
+        )
+        return combine_evaluation_text(relevance_text, program_text), parse_submission_scores(relevance_text, program_text)
+
+async def grade_submission_async(student_id, path, problem_text, semaphore):
+    """
+    Async version of grade_submission. The steps before and after the model
+    evaluation block, so they run in a worker thread; only the model calls are
+    awaited on the event loop. The semaphore bounds submissions in flight.
+    """
+    result = new_grading_result(student_id, path)
     
-    # Get problem statement
-    print("\nSTEP 1: PROBLEM STATEMENT")
-    print("-" * 40)
-    problem_text = input("Enter the problem/question text: ").strip()
-    if not problem_text:
-        print("Error: Problem statement cannot be empty!")
-        return
+    async with semaphore:
+        with submission_metrics(student_id):
+            journal_id = await asyncio.to_thread(journal_submission_id, path)
+            if await asyncio.to_thread(journal_finished_result, journal_id, result, problem_text):
+                return result
+            try:
+                grading = await asyncio.to_thread(prepare_grading, journal_id, path, problem_text)
+                if grading["scores"] is None:
+                    grading["evaluation"], grading["scores"] = await evaluate_submission_async(
+                        grading["sections"], problem_text, grading["include_output"]
+                    )
+                await asyncio.to_thread(finish_grading, journal_id, result, problem_text, grading)
+            except Exception as e:
+                result["status"] = "failed"
+                result["error"] = str(e)
     
-    # Get student submission (text or image/PDF upload)
-    print("\nSTEP 2: STUDENT SUBMISSION INPUT")
-    print("-" * 40)
-    print("\n" + "="*50)
-    print("SUBMISSION INPUT OPTIONS:")
-    print("1. Type/paste submission directly")
-    print("2. Upload image file (JPG/PNG) or PDF - File dialog will open")
-    print("="*50)
+    return result
+
+async def run_batch_async(problem_text, source, output_dir, concurrency=DEFAULT_BATCH_WORKERS, resume=True):
+    """
+    Async version of run_batch: up to `concurrency` submissions are in flight
+    at once, each with its independent model calls sent concurrently.
+    """
+    submissions = collect_submissions(source)
+    if not submissions:
+        print(f"No supported submissions found in {source}")
+        return []
     
-    choice = input("Enter your choice (1 or 2): ").strip()
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    open_batch_journal(output_dir, resume)
+    prepare_pdf_ocr_pool(submissions)
     
-    submission_text = ""
-    if choice == "2":
-        # Image/PDF input with file dialog
-        if not PIL_AVAILABLE:
-            print("Error: Image input requires PIL package.")
-            print("Falling back to text input...")
-            choice = "1"
-        else:
-            print("\nOpening file dialog...")
-            print("(If dialog doesn't appear, check behind other windows)")
-            file_path = select_image_file()
-            
-            if file_path:
-                print(f"Selected file: {os.path.basename(file_path)}")
-                print("Extracting text from file...")
-                submission_text = extract_text_from_image(file_path)
-                if submission_text:
-                    print("\n=== Extracted Text Preview ===")
-                    preview = submission_text[:500] + "..." if len(submission_text) > 500 else submission_text
-                    print(preview)
-                    print("="*50)
-                    confirm = input("\nUse this extracted text? (y/n): ").strip().lower()
-                    if confirm != 'y':
-                        print("Falling back to text input...")
-                        choice = "1"
-                else:
-                    print("Failed to extract text from file. Falling back to text input...")
-                    choice = "1"
-            else:
-                print("No file selected. Falling back to text input...")
-                choice = "1"
+    groups = await asyncio.to_thread(group_identical_submissions, submissions)
+    if len(groups) < len(submissions):
+        print(f"{len(submissions) - len(groups)} submission(s) are identical to another and will share its result")
     
-    # Text input (default)
-    if choice == "1" or choice != "2":
-        print("\nEnter/paste your submission below. Type 'END' in a new line when finished:")
-        lines = []
-        while True:
-            line = input()
-            if line.strip().upper() == "END":
-                break
-            lines.append(line)
-        submission_text = "\n".join(lines)
+    images = [image for group in groups for image in submission_image_paths(group[0][1])]
+    await asyncio.to_thread(prefetch_gemini_ocr, images, concurrency)
     
-    if not submission_text or not submission_text.strip():
-        print("Error: No submission provided!")
-        return
+    print(f"Grading {len(groups)} unique submissions with up to {concurrency} in flight...")
+    semaphore = asyncio.Semaphore(max(1, concurrency))
     
-    # Parse submission into sections
-    print("\nSTEP 3: PARSING SUBMISSION INTO SECTIONS")
-    print("-" * 40)
-    sections = parse_submission_sections(submission_text)
+    async def grade_group(group):
+        result = await grade_submission_async(group[0][0], group[0][1], problem_text, semaphore)
+        return fan_out_result(result, group)
     
-    # Show parsed sections
-    print("\nParsed Sections:")
-    for section, content in sections.items():
-        preview = content[:100] + "..." if len(content) > 100 else content
-        print(f"\n{section.upper()}:")
-        print(preview)
+    tasks = [asyncio.create_task(grade_group(group)) for group in groups]
+    done = 0
+    for task in asyncio.as_completed(tasks):
+        for result in await task:
+            done += 1
+            report_batch_result(result, problem_text, output_dir, done, len(submissions))
     
-    # Evaluate submission with marking scheme
-    print("\nSTEP 4: EVALUATING SUBMISSION")
-    print("-" * 40)
-    evaluation, scores = evaluate_submission_with_marking_scheme(sections, problem_text)
+    # Keep the summary in submission order regardless of how groups were formed
+    results = sorted((result for task in tasks for result in task.result()), key=submission_order(submissions))
+    similarity_clusters = find_similar_submissions(results)
+    if similarity_clusters:
+        print(f"Found {len(similarity_clusters)} cluster(s) of similar programs")
+    write_batch_summary(results, output_dir, similarity_clusters)
+    print(f"Reports and summary written to {output_dir}")
+    print_genai_client_stats()
+    print_scheduler_stats()
+    print_journal_stats()
+    print_ocr_cache_stats()
+    print_llm_cache_stats()
+    print_rule_stats()
+    print_stage_metrics()
+    return results
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(
+        description="Evaluate student submissions. Runs interactively when no batch source is given."
+    )
+    parser.add_argument("--batch", metavar="SOURCE",
+                        help="Folder of submissions or CSV manifest with 'student' and 'path' columns")
+    parser.add_argument("--problem", help="Problem/question text")
+    parser.add_argument("--problem-file", help="File containing the problem/question text")
+    parser.add_argument("--output", default="evaluation_reports",
+                        help="Folder for per-student reports and the summary (default: evaluation_reports)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_BATCH_WORKERS,
+                        help=f"Number of submissions graded in parallel (default: {DEFAULT_BATCH_WORKERS})")
+    parser.add_argument("--model", default=None,
+                        help=f"Gemini model name (default: {GEMINI_MODEL})")
+    parser.add_argument("--no-ocr-cache", action="store_true",
+                        help="Always run OCR instead of reusing cached results")
+    parser.add_argument("--no-llm-cache", action="store_true",
+                        help="Always call the model instead of reusing cached responses")
+    parser.add_argument("--pdf-dpi", type=int, default=PDF_DPI,
+                        help=f"Resolution used to render PDF pages for OCR (default: {PDF_DPI})")
+    parser.add_argument("--pdf-max-pages", type=int, default=PDF_MAX_PAGES_IN_MEMORY,
+                        help=f"Maximum rendered PDF pages held in memory at once (default: {PDF_MAX_PAGES_IN_MEMORY})")
+    parser.add_argument("--stream-pdf", action="store_true",
+                        help="Start evaluating Aim/Algorithm while later PDF pages are still being OCR'd")
+    parser.add_argument("--structured", action="store_true",
+                        help="Evaluate each submission with one JSON-schema model call instead of chained prompts")
+    parser.add_argument("--rules", default=None,
+                        help="Comma-separated code rule ids to run for this assignment "
+                             "(default: all of " + ", ".join(CODE_RULES) + ")")
+    parser.add_argument("--tests", default=None,
+                        help="JSON file of test cases ({\"input\": ..., \"expected\": ...}) to run each program against")
+    parser.add_argument("--profile", default=None,
+                        help="JSON profiling spec (function, args expression in n, sizes, reference) "
+                             "used to measure efficiency")
+    parser.add_argument("--verify-output", action="store_true",
+                        help="Run each program and check its Output section against the real output")
+    parser.add_argument("--program-input", default=None,
+                        help="File fed to stdin when verifying output (default: empty input)")
+    parser.add_argument("--expected-output", default=None,
+                        help="File with the instructor's expected output, used with --verify-output")
+    parser.add_argument("--similarity-threshold", type=float, default=None,
+                        help=f"Fingerprint overlap that flags two programs as similar (default: {SIMILARITY_THRESHOLD})")
+    parser.add_argument("--rpm", type=int, default=None,
+                        help=f"Gemini requests per minute allowed by your quota (default: {GEMINI_REQUESTS_PER_MINUTE})")
+    parser.add_argument("--tpm", type=int, default=None,
+                        help=f"Gemini tokens per minute allowed by your quota (default: {GEMINI_TOKENS_PER_MINUTE})")
+    parser.add_argument("--offline-fallback", action="store_true",
+                        help="In batch mode, grade with offline heuristics when the Gemini API is unavailable "
+                             "instead of marking the submission as failed")
+    parser.add_argument("--metrics-file", default=None,
+                        help="Append per-stage timing and counts to this JSON lines file")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Serve Prometheus-format metrics on this local port while the batch runs")
+    parser.add_argument("--restart", action="store_true",
+                        help="Ignore the batch journal in the output folder and grade everything again")
+    parser.add_argument("--ocr-batch-size", type=int, default=None,
+                        help=f"Images per batched Gemini OCR request; 1 sends one image per request (default: {GEMINI_OCR_BATCH_SIZE})")
+    parser.add_argument("--ocr-backends", default=None,
+                        help=f"Comma-separated OCR backends the router may use (default: all available: "
+                             f"{', '.join(OCR_BACKENDS)})")
+    parser.add_argument("--ocr-confidence", type=float, default=None,
+                        help=f"Confidence (0-1) at which the OCR router stops trying costlier backends "
+                             f"(default: {OCR_CONFIDENCE_THRESHOLD})")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="Use the asyncio engine; --workers then limits submissions in flight")
+    return parser
+
+def main(argv=None):
+    global GEMINI_MODEL, OCR_CACHE_ENABLED, LLM_CACHE_ENABLED, PDF_DPI, PDF_MAX_PAGES_IN_MEMORY
+    global PDF_STREAMING_ENABLED, STRUCTURED_EVALUATION_ENABLED, ENABLED_RULES, TEST_CASES
+    global PROFILE_CONFIG, OUTPUT_VERIFICATION_ENABLED, OUTPUT_PROGRAM_INPUT, OUTPUT_EXPECTED
+    global SIMILARITY_THRESHOLD, GEMINI_REQUESTS_PER_MINUTE, GEMINI_TOKENS_PER_MINUTE, OFFLINE_FALLBACK_ENABLED
+    global METRICS_FILE, GEMINI_OCR_BATCH_SIZE, ENABLED_OCR_BACKENDS, OCR_CONFIDENCE_THRESHOLD
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    if args.model:
+        GEMINI_MODEL = args.model
+    if args.no_ocr_cache:
+        OCR_CACHE_ENABLED = False
+    if args.no_llm_cache:
+        LLM_CACHE_ENABLED = False
+    PDF_DPI = args.pdf_dpi
+    PDF_MAX_PAGES_IN_MEMORY = max(1, args.pdf_max_pages)
+    PDF_STREAMING_ENABLED = args.stream_pdf
+    if args.ocr_batch_size is not None:
+        GEMINI_OCR_BATCH_SIZE = max(1, args.ocr_batch_size)
+    if args.ocr_backends:
+        ENABLED_OCR_BACKENDS = [name.strip() for name in args.ocr_backends.split(",") if name.strip()]
+        unknown = [name for name in ENABLED_OCR_BACKENDS if name not in OCR_BACKENDS]
+        if unknown:
+            parser.error(f"unknown OCR backend(s): {', '.join(unknown)}")
+    if args.ocr_confidence is not None:
+        OCR_CONFIDENCE_THRESHOLD = args.ocr_confidence
+    STRUCTURED_EVALUATION_ENABLED = args.structured
+    if args.rules:
+        ENABLED_RULES = [rule_id.strip() for rule_id in args.rules.split(",") if rule_id.strip()]
+        unknown = [rule_id for rule_id in ENABLED_RULES if rule_id not in CODE_RULES]
+        if unknown:
+            parser.error(f"unknown rule id(s): {', '.join(unknown)}")
+    if args.tests:
+        TEST_CASES = load_test_cases(args.tests)
+    if args.profile:
+        PROFILE_CONFIG = load_profile_config(args.profile)
+    OUTPUT_VERIFICATION_ENABLED = args.verify_output
+    if args.similarity_threshold is not None:
+        SIMILARITY_THRESHOLD = args.similarity_threshold
+    if args.program_input:
+        OUTPUT_PROGRAM_INPUT = Path(args.program_input).read_text(encoding='utf-8')
+    if args.expected_output:
+        OUTPUT_EXPECTED = Path(args.expected_output).read_text(encoding='utf-8')
     
-    # Display results
-    print("\n" + "="*60)
-    print(" EVALUATION RESULTS ")
-    print("="*60)
+    if args.rpm:
+        GEMINI_REQUESTS_PER_MINUTE = SCHEDULER_STATE["requests"] = args.rpm
+    if args.tpm:
+        GEMINI_TOKENS_PER_MINUTE = SCHEDULER_STATE["tokens"] = args.tpm
     
-    print("\n📋 DETAILED EVALUATION:")
-    print("-" * 40)
-    print(evaluation)
+    if not args.batch:
+        try:
+            run_pipeline()
+        finally:
+            close_genai_client()
+        return
     
-    print("\n📈 MARK BREAKDOWN:")
-    print("-" * 40)
-    print(f"1. Aim ({scores['aim']['max']}%):                {scores['aim']['score']:.2f}/{scores['aim']['max']}")
-    print(f"   - {scores['aim']['explanation']}")
-    print(f"2. Algorithm ({scores['algorithm']['max']}%):     {scores['algorithm']['score']:.2f}/{scores['algorithm']['max']}")
-    print(f"   - {scores['algorithm']['explanation']}")
-    print(f"3. Program ({scores['program']['max']}%):        {scores['program']['score']:.2f}/{scores['program']['max']}")
-    print(f"   - {scores['program']['explanation']}")
-    print(f"4. Output ({scores['output']['max']}%):         {scores['output']['score']:.2f}/{scores['output']['max']}")
-    print(f"5. Result ({scores['result']['max']}%):         {scores['result']['score']:.2f}/{scores['result']['max']}")
-    print(f"   - {scores['result']['explanation']}")
+    # A batch should report what it could not grade rather than invent scores
+    OFFLINE_FALLBACK_ENABLED = args.offline_fallback
     
-    print("\n✅ FINAL GRADE:")
-    print("-" * 40)
-    print(f"Total Score: {scores['total']['score']}/{scores['total']['max']}")
-    # percentage = (scores['total']['score']/scores['total']['max']) * 100
-    # print(f"Percentage: {percentage:.1f}%")
+    if args.problem_file:
+        problem_text = Path(args.problem_file).read_text(encoding='utf-8').strip()
+    else:
+        problem_text = (args.problem or "").strip()
+    if not problem_text:
+        parser.error("--problem or --problem-file is required in batch mode")
     
-    # Generate markdown output
-    markdown_output = generate_markdown_output(scores, evaluation, problem_text)
-    print("\n📝 MARKDOWN OUTPUT GENERATED")
-    print("-" * 40)
-    print("A detailed markdown evaluation has been generated.")
+    METRICS_FILE = args.metrics_file
+    if args.metrics_port is not None:
+        start_metrics_server(args.metrics_port)
     
-    # Ask if user wants to save the markdown output
-    save_option = input("\nDo you want to save the evaluation as a markdown file? (y/n): ").strip().lower()
-    if save_option == 'y':
-        save_path = input("Enter file path to save (or press Enter for default): ").strip()
-        if not save_path:
-            save_path = "evaluation_result.md"
-        
-        try:
-            with open(save_path, 'w', encoding='utf-8') as f:
-                f.write(markdown_output)
-            print(f"Evaluation saved to {save_path}")
-        except Exception as e:
-            print(f"Error saving file: {e}")
-
-def generate_markdown_output(scores, evaluation_text, problem_text):
-    """Generate a formatted markdown output with the evaluation results."""
-    markdown = f"""
-# Student Submission Evaluation
-
-## Problem Statement
-{problem_text}
-
-## Evaluation Summary
-
-| Section | Maximum Marks | Marks Obtained | Percentage |
-|---------|---------------|---------------|------------|
-| Aim | {scores['aim']['max']} | {scores['aim']['score']:.2f} | {(scores['aim']['score']/scores['aim']['max'])*100:.1f}% |
-| Algorithm | {scores['algorithm']['max']} | {scores['algorithm']['score']:.2f} | {(scores['algorithm']['score']/scores['algorithm']['max'])*100:.1f}% |
-| Program | {scores['program']['max']} | {scores['program']['score']:.2f} | {(scores['program']['score']/scores['program']['max'])*100:.1f}% |
-| Output | {scores['output']['max']} | {scores['output']['score']:.2f} | {(scores['output']['score']/scores['output']['max'])*100:.1f}% |
-| Result | {scores['result']['max']} | {scores['result']['score']:.2f} | {(scores['result']['score']/scores['result']['max'])*100:.1f}% |
-| *Total* | *{scores['total']['max']}* | *{scores['total']['score']:.2f}* | *{(scores['total']['score']/scores['total']['max'])*100:.1f}%* |
-
-## Detailed Evaluation
-
-### Aim Evaluation
-- *Score*: {scores['aim']['score']:.2f}/{scores['aim']['max']}
-- *Feedback*: {scores['aim']['explanation']}
-
-### Algorithm Evaluation
-- *Score*: {scores['algorithm']['score']:.2f}/{scores['algorithm']['max']}
-- *Feedback*: {scores['algorithm']['explanation']}
-
-### Program Evaluation
-- *Score*: {scores['program']['score']:.2f}/{scores['program']['max']}
-- *Feedback*: {scores['program']['explanation']}
-
-### Output Evaluation
-- *Score*: {scores['output']['score']:.2f}/{scores['output']['max']}
-
-### Result Evaluation
-- *Score*: {scores['result']['score']:.2f}/{scores['result']['max']}
-- *Feedback*: {scores['result']['explanation']}
-
-## Full Evaluation Report
-
-{evaluation_text}
-
-
-Evaluation performed using automated assessment system.
-"""
-    return markdown
+    try:
+        if args.use_async:
+            asyncio.run(run_batch_async(problem_text, args.batch, args.output,
+                                        concurrency=args.workers, resume=not args.restart))
+        else:
+            run_batch(problem_text, args.batch, args.output, workers=args.workers, resume=not args.restart)
+    finally:
+        close_metrics_file()
+        close_genai_client()
 
 # =========================
 # RUN PIPELINE
 # =========================
-if _name_ == "_main_":
+if __name__ == "__main__":
     try:
-        run_pipeline()
+        main()
     except KeyboardInterrupt:
         print("\n\nProgram interrupted by user.")
     except Exception as e:
@@ -0,0 +1,33 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import code_checker
+
+def test_response_is_split_per_page():
+    text = "=== PAGE 1 ===\nAim: add\n\n=== PAGE 2 ===\nprint(1 + 2)\n"
+    assert code_checker.split_batched_ocr_response(text, 2) == {1: "Aim: add", 2: "print(1 + 2)"}
+
+def test_skipped_pages_are_absent():
+    text = "=== PAGE 1 ===\nfirst\n=== PAGE 3 ===\nthird\n"
+    assert code_checker.split_batched_ocr_response(text, 3) == {1: "first", 3: "third"}
+
+def test_out_of_range_and_repeated_markers_are_ignored():
+    text = "=== PAGE 1 ===\nfirst\n=== PAGE 1 ===\nagain\n=== PAGE 9 ===\nstray\n"
+    # A repeated or unknown marker still ends the previous page
+    assert code_checker.split_batched_ocr_response(text, 2) == {1: "first"}
+
+def test_markers_must_stand_on_their_own_line():
+    text = "=== PAGE 1 ===\nprint('=== PAGE 2 ===')\n"
+    assert code_checker.split_batched_ocr_response(text, 2) == {1: "print('=== PAGE 2 ===')"}
+
+def test_empty_response_gives_no_pages():
+    assert code_checker.split_batched_ocr_response("", 2) == {}
+    assert code_checker.split_batched_ocr_response(None, 2) == {}
+
+def test_requests_are_packed_by_count_and_size(monkeypatch):
+    monkeypatch.setattr(code_checker, "GEMINI_OCR_BATCH_SIZE", 2)
+    monkeypatch.setattr(code_checker, "GEMINI_OCR_MAX_REQUEST_BYTES", 10)
+    encoded = [("a", b"1234"), ("b", b"1234"), ("c", b"12345678"), ("d", b"12"), ("e", b"1")]
+    batches = code_checker.pack_ocr_requests(encoded)
+    assert [[key for key, _ in batch] for batch in batches] == [["a", "b"], ["c", "d"], ["e"]]
@@ -0,0 +1,81 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import code_checker
+
+def sample_scores():
+    marks = {"aim": (8, 10), "algorithm": (12, 15), "program": (40, 50), "output": (12, 15), "result": (8, 10)}
+    scores = {key: {"score": score, "max": maximum, "explanation": ""} for key, (score, maximum) in marks.items()}
+    scores["total"] = {"score": 80, "max": 100}
+    return scores
+
+def test_syntax_error_finding_carries_its_line():
+    _, findings = code_checker.check_code("x = 1\ndef f(:\n    pass\n")
+    assert findings[0]["rule"] == "syntax"
+    assert findings[0]["line"] == 2
+
+def test_rule_penalty_is_capped():
+    findings = [{"penalty": 0.15}, {"penalty": 0.15}]
+    assert code_checker.rule_penalty(findings) == code_checker.RULE_PENALTY_CAP
+
+def test_plain_mistakes_cost_the_default_penalty():
+    assert code_checker.rule_penalty(["a", "b"]) == 2 * code_checker.DEFAULT_MISTAKE_PENALTY
+
+def test_calculate_grade_with_breakdown_applies_the_penalty():
+    breakdown = {"problem_solving": 10, "logic_quality": 10, "readability": 10, "effort": 10}
+    score, marks = code_checker.calculate_grade_with_breakdown(breakdown, 10, [{"penalty": 0.1}])
+    assert score == 9.0
+    assert marks["problem_solving"] == 4.0
+
+def test_apply_rule_penalties_reduces_program_and_total():
+    scores = code_checker.apply_rule_penalties(sample_scores(), [{"penalty": 0.1}])
+    assert scores["program"]["score"] == 36.0
+    assert scores["total"]["score"] == 76.0
+    assert scores["rule_penalty"] == 0.1
+
+def test_no_findings_leave_scores_alone():
+    scores = sample_scores()
+    assert code_checker.apply_rule_penalties(scores, []) is scores
+
+RULE_CASES = [
+    ("no-function", "print(1 + 2)\n", "def add(a, b):\n    return a + b\n"),
+    ("no-output", "def add(a, b):\n    total = a + b\n", "def add(a, b):\n    return a + b\n"),
+    ("empty-except",
+     "try:\n    x = int(input())\nexcept ValueError:\n    pass\n",
+     "try:\n    x = int(input())\nexcept ValueError:\n    print('not a number')\n"),
+    ("hardcoded-values", "a = 3\nb = 4\nprint(a + b)\n", "a = int(input())\nb = int(input())\nprint(a + b)\n"),
+    ("infinite-loop",
+     "while True:\n    print('again')\n",
+     "while True:\n    line = input()\n    if not line:\n        break\n"),
+    ("unused-import", "import math\nprint(2 ** 0.5)\n", "import math\nprint(math.sqrt(2))\n"),
+    ("missing-return",
+     "def sign(x):\n    if x > 0:\n        return 1\n    elif x < 0:\n        return -1\n",
+     "def sign(x):\n    if x > 0:\n        return 1\n    return -1 if x < 0 else 0\n"),
+]
+
+def test_every_rule_has_cases():
+    assert {rule_id for rule_id, _, _ in RULE_CASES} == set(code_checker.CODE_RULES)
+
+@pytest.mark.parametrize("rule_id, flagged, clean", RULE_CASES)
+def test_rule_flags_only_the_bad_program(rule_id, flagged, clean):
+    _, findings = code_checker.check_code(flagged, [rule_id])
+    assert [finding["rule"] for finding in findings] == [rule_id]
+    assert code_checker.check_code(clean, [rule_id])[1] == []
+
+def test_break_in_a_nested_loop_does_not_exit_the_outer_loop():
+    code = "while True:\n    for i in range(3):\n        break\n"
+    assert code_checker.check_code(code, ["infinite-loop"])[1][0]["line"] == 1
+
+def test_exhaustive_match_counts_as_returning():
+    code = (
+        "def describe(x):\n"
+        "    match x:\n"
+        "        case 0:\n"
+        "            return 'zero'\n"
+        "        case _:\n"
+        "            return 'other'\n"
+    )
+    assert code_checker.check_code(code, ["missing-return"])[1] == []
@@ -0,0 +1,29 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import code_checker
+
+def test_same_stem_with_different_extensions_gets_distinct_ids(tmp_path):
+    (tmp_path / "alice.txt").write_text("print(1)\n")
+    (tmp_path / "alice.py").write_text("print(2)\n")
+    (tmp_path / "bob.txt").write_text("print(3)\n")
+    submissions = code_checker.collect_submissions(tmp_path)
+    assert [student_id for student_id, _ in submissions] == ["alice_py", "alice_txt", "bob"]
+
+def test_manifest_listing_a_student_twice_gets_numbered_ids(tmp_path):
+    for name in ("a.txt", "b.txt"):
+        (tmp_path / name).write_text("print(1)\n")
+    manifest = tmp_path / "manifest.csv"
+    manifest.write_text("student,path\ncarol,a.txt\ncarol,b.txt\n")
+    submissions = code_checker.collect_submissions(manifest)
+    assert [student_id for student_id, _ in submissions] == ["carol_txt", "carol_txt_2"]
+
+def test_ids_differing_only_in_case_are_treated_as_duplicates():
+    submissions = [("Dan", Path("Dan.pdf")), ("dan", Path("dan.jpg"))]
+    renamed = code_checker.disambiguate_student_ids(submissions)
+    assert [student_id for student_id, _ in renamed] == ["Dan_pdf", "dan_jpg"]
+
+def test_unique_ids_are_left_alone():
+    submissions = [("erin", Path("erin.pdf")), ("frank", Path("frank.pdf"))]
+    assert code_checker.disambiguate_student_ids(submissions) == submissions
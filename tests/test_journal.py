@@ -0,0 +1,58 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import code_checker
+
+SUBMISSION = "Aim: add numbers\nAlgorithm:\n1. add\nProgram:\nprint(1 + 2)\nOutput:\n3\nResult: done\n"
+
+@pytest.fixture
+def journal(tmp_path, monkeypatch):
+    monkeypatch.setattr(code_checker, "JOURNAL_ENABLED", True)
+    code_checker.open_batch_journal(tmp_path, resume=False)
+    yield tmp_path
+    monkeypatch.setattr(code_checker, "JOURNAL_PATH", None)
+
+def test_text_key_follows_ocr_settings(monkeypatch):
+    before = code_checker.text_settings_key()
+    monkeypatch.setattr(code_checker, "OCR_CONFIDENCE_THRESHOLD", 0.5)
+    assert code_checker.text_settings_key() != before
+    monkeypatch.setattr(code_checker, "OCR_CONFIDENCE_THRESHOLD", 0.75)
+    monkeypatch.setattr(code_checker, "PDF_DPI", 300)
+    assert code_checker.text_settings_key() != before
+
+def test_sections_key_follows_text_key(monkeypatch):
+    before = code_checker.sections_settings_key()
+    monkeypatch.setattr(code_checker, "GEMINI_MODEL", "another-model")
+    assert code_checker.sections_settings_key() != before
+
+def test_result_key_follows_penalty_cap(monkeypatch):
+    before = code_checker.result_settings_key("add numbers")
+    monkeypatch.setattr(code_checker, "RULE_PENALTY_CAP", 0.5)
+    assert code_checker.result_settings_key("add numbers") != before
+
+def test_stage_with_other_settings_is_not_reused(journal):
+    code_checker.journal_put("sub", "text", "hello", "old-settings")
+    assert code_checker.journal_get("sub", "text", "old-settings") == "hello"
+    assert code_checker.journal_get("sub", "text", "new-settings") is None
+
+@pytest.mark.parametrize("confidence, journaled", [(0.3, False), (0.9, True)])
+def test_only_confident_text_is_journaled(journal, tmp_path, monkeypatch, confidence, journaled):
+    path = tmp_path / "scan.png"
+    path.write_bytes(b"not really an image")
+    monkeypatch.setattr(code_checker, "load_submission_text_with_confidence", lambda path: (SUBMISSION, confidence))
+    monkeypatch.setattr(code_checker, "can_stream_pdf", lambda path: False)
+    monkeypatch.setattr(code_checker, "GENAI_AVAILABLE", False)
+    journal_id = code_checker.journal_submission_id(path)
+    grading = code_checker.prepare_grading(journal_id, path, "add numbers")
+    assert grading["sections"]["program"] == "print(1 + 2)"
+    stored = code_checker.journal_get(journal_id, "text", code_checker.text_settings_key())
+    assert (stored == SUBMISSION) is journaled
+
+def test_evaluation_key_follows_problem_and_output_verification():
+    key = code_checker.evaluation_settings_key("add numbers", True)
+    assert code_checker.evaluation_settings_key("add numbers", False) != key
+    assert code_checker.evaluation_settings_key("multiply numbers", True) != key
+    assert code_checker.evaluation_settings_key("add numbers", True) == key
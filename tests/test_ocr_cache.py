@@ -0,0 +1,43 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import code_checker
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(code_checker, "CACHE_DIR", tmp_path)
+    monkeypatch.setattr(code_checker, "OCR_CACHE_ENABLED", True)
+    monkeypatch.setattr(code_checker, "_ocr_cache_bytes", None)
+    scans = []
+    evict = code_checker.evict_ocr_cache
+    monkeypatch.setattr(code_checker, "evict_ocr_cache", lambda max_bytes=None: scans.append(max_bytes) or evict(max_bytes))
+    return scans
+
+def cache_size():
+    return sum(path.stat().st_size for path in code_checker.ocr_cache_dir().glob("*.txt"))
+
+def test_folder_is_scanned_once_while_under_the_limit(cache, monkeypatch):
+    monkeypatch.setattr(code_checker, "OCR_CACHE_MAX_BYTES", 10_000)
+    for i in range(20):
+        code_checker.ocr_cache_put(f"key{i}", "x" * 100)
+    assert len(cache) == 1
+    assert code_checker._ocr_cache_bytes == cache_size() == 2000
+
+def test_overwriting_an_entry_does_not_grow_the_total(cache, monkeypatch):
+    monkeypatch.setattr(code_checker, "OCR_CACHE_MAX_BYTES", 10_000)
+    for _ in range(5):
+        code_checker.ocr_cache_put("same", "x" * 100)
+    assert code_checker._ocr_cache_bytes == 100
+
+def test_eviction_trims_to_the_low_water_mark(cache, monkeypatch):
+    monkeypatch.setattr(code_checker, "OCR_CACHE_MAX_BYTES", 1000)
+    for i in range(15):
+        code_checker.ocr_cache_put(f"key{i}", "x" * 100)
+    assert cache_size() <= 1000
+    assert code_checker._ocr_cache_bytes == cache_size()
+    # One scan to measure, then one per overflow past the low water mark
+    assert len(cache) < 15
+    assert code_checker.ocr_cache_get("key14") is not None
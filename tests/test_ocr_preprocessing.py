@@ -0,0 +1,51 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import code_checker
+
+Image = pytest.importorskip("PIL.Image")
+ImageDraw = pytest.importorskip("PIL.ImageDraw")
+
+def skewed_page(size=(2500, 1900), angle=3):
+    page = Image.new("L", size, 255)
+    draw = ImageDraw.Draw(page)
+    for y in range(100, size[1] - 100, 40):
+        draw.rectangle([100, y, size[0] - 200, y + 12], fill=0)
+    return page.rotate(angle, fillcolor=255)
+
+def test_small_image_is_returned_as_is():
+    page = Image.new("L", (100, 50), 255)
+    assert code_checker.maybe_resize_image(page, 1600) is page
+
+def test_deskewed_page_stays_within_the_size_limit():
+    page = skewed_page()
+    assert code_checker.estimate_skew_angle(code_checker.binarize_image(page)) != 0
+    assert max(code_checker.preprocess_for_tesseract(page).size) <= code_checker.OCR_BACKEND_MAX_SIDE["tesseract"]
+
+@pytest.fixture
+def fake_tesseract(monkeypatch):
+    calls = {"osd": 0}
+    def detect(pil_img):
+        calls["osd"] += 1
+        return 90
+    monkeypatch.setattr(code_checker, "OCR_AVAILABLE", True)
+    monkeypatch.setattr(code_checker, "OCR_DETECT_ORIENTATION", True)
+    monkeypatch.setattr(code_checker, "detect_orientation", detect)
+    return calls
+
+def test_orientation_is_not_checked_for_confident_pages(fake_tesseract, monkeypatch):
+    monkeypatch.setattr(code_checker, "tesseract_read", lambda pil_img: ("text", 0.95))
+    page = Image.new("L", (200, 100), 255)
+    assert code_checker.tesseract_read_page(page, lambda pil_img: pil_img) == ("text", 0.95)
+    assert fake_tesseract["osd"] == 0
+
+def test_turned_page_is_kept_when_it_reads_better(fake_tesseract, monkeypatch):
+    # Portrait reads well, landscape (the page as scanned) does not
+    monkeypatch.setattr(code_checker, "tesseract_read",
+                        lambda pil_img: ("upright", 0.9) if pil_img.size[1] > pil_img.size[0] else ("garbled", 0.2))
+    page = Image.new("L", (200, 100), 255)
+    assert code_checker.tesseract_read_page(page, lambda pil_img: pil_img) == ("upright", 0.9)
+    assert fake_tesseract["osd"] == 1
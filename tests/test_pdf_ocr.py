@@ -0,0 +1,39 @@
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import code_checker
+
+def test_page_windows_split_on_gaps_and_size():
+    assert code_checker.pdf_page_windows([1, 2, 3, 5, 6, 9], 2) == [(1, 2), (3, 3), (5, 6), (9, 9)]
+
+def test_pdfs_in_flight_share_the_page_budget(monkeypatch):
+    monkeypatch.setattr(code_checker, "PDF_OCR_WORKERS", 1)
+    monkeypatch.setattr(code_checker, "PDF_MAX_PAGES_IN_MEMORY", 4)
+    in_memory = []
+    peak = []
+    lock = threading.Lock()
+    
+    def fake_range(pdf_path, first, last, dpi):
+        with lock:
+            in_memory.append(last - first + 1)
+            peak.append(sum(in_memory))
+        time.sleep(0.02)
+        with lock:
+            in_memory.remove(last - first + 1)
+        return [(f"page {page}", 0.9, 0.0) for page in range(first, last + 1)]
+    
+    monkeypatch.setattr(code_checker, "ocr_pdf_page_range", fake_range)
+    texts = {}
+    def read(name):
+        texts[name] = list(code_checker.iter_pdf_page_texts(name, dpi=100, pages=range(1, 9)))
+    threads = [threading.Thread(target=read, args=(f"doc{i}.pdf",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert max(peak) <= 4
+    assert all(pages == [f"page {page}" for page in range(1, 9)] for pages in texts.values())
@@ -0,0 +1,71 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import code_checker
+
+PROMPTING_SUM = 'a = int(input("Enter a: "))\nb = int(input("Enter b: "))\nprint("Sum:", a + b)\n'
+
+def test_input_prompts_do_not_fail_test_cases():
+    case = code_checker.run_test_case(PROMPTING_SUM, {"input": "2\n3", "expected": "Sum: 5"}, 1)
+    assert case["status"] == "pass"
+    assert "Enter a: " in case["stderr"]
+
+def test_input_prompts_can_be_kept_on_stdout(tmp_path):
+    program_path = tmp_path / "solution.py"
+    program_path.write_text(PROMPTING_SUM, encoding="utf-8")
+    status, stdout, _, _ = code_checker.run_program_sandboxed(program_path, "2\n3", tmp_path, prompts_to_stdout=True)
+    assert status == "ok"
+    assert stdout.strip() == "Enter a: Enter b: Sum: 5"
+
+def test_input_at_end_of_stdin_raises_eof():
+    case = code_checker.run_test_case("input()\n", {"input": "", "expected": ""}, 1)
+    assert case["status"] == "error"
+    assert "EOFError" in case["stderr"]
+
+def test_output_verification_is_inconclusive_without_input():
+    report = code_checker.verify_program_output({"program": "a = int(input())\nprint(a * 2)\n", "output": "10"})
+    assert report["status"] == "error"
+    assert report["rating"] is None
+
+def test_output_verification_is_inconclusive_for_syntax_errors():
+    report = code_checker.verify_program_output({"program": "print(1\n", "output": "1"})
+    assert report["rating"] is None
+
+def test_output_verification_scores_runtime_failures_zero():
+    report = code_checker.verify_program_output({"program": "x = 1 / 0\n", "output": "1"})
+    assert report["rating"] == 0.0
+
+def run(tmp_path, program, **kwargs):
+    program_path = tmp_path / "solution.py"
+    program_path.write_text(program, encoding="utf-8")
+    return code_checker.run_program_sandboxed(program_path, "", tmp_path, **kwargs)
+
+def test_clean_exit_is_ok(tmp_path):
+    status, stdout, _, _ = run(tmp_path, "print('hi')\n")
+    assert (status, stdout.strip()) == ("ok", "hi")
+
+def test_exception_is_an_error(tmp_path):
+    status, _, stderr, _ = run(tmp_path, "raise ValueError('boom')\n")
+    assert status == "error"
+    assert "ValueError: boom" in stderr
+
+def test_nonzero_exit_is_an_error(tmp_path):
+    assert run(tmp_path, "import sys\nsys.exit(3)\n")[0] == "error"
+
+def test_wall_clock_timeout(tmp_path):
+    status, _, _, seconds = run(tmp_path, "import time\ntime.sleep(30)\n", timeout=1)
+    assert status == "timeout"
+    assert seconds < 10
+
+@pytest.mark.skipif(os.name != "posix", reason="needs POSIX resource limits")
+def test_cpu_limit_counts_as_timeout(tmp_path):
+    status, _, _, _ = run(tmp_path, "while True:\n    pass\n", timeout=20, cpu_seconds=1)
+    assert status == "timeout"
+
+def test_run_test_case_maps_wrong_output_to_fail():
+    case = code_checker.run_test_case("print(4)\n", {"input": "", "expected": "5"}, 1)
+    assert case["status"] == "fail"
@@ -0,0 +1,106 @@
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import code_checker
+
+class ApiError(Exception):
+    def __init__(self, code, message="api error"):
+        super().__init__(message)
+        self.code = code
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    """A fresh scheduler with 2 requests and 10000 tokens per minute."""
+    monkeypatch.setattr(code_checker, "GEMINI_REQUESTS_PER_MINUTE", 2)
+    monkeypatch.setattr(code_checker, "GEMINI_TOKENS_PER_MINUTE", 10000)
+    state = {
+        "requests": 2.0, "tokens": 10000.0, "updated": time.monotonic(),
+        "queue": [], "sequence": 0, "failures": 0, "open_until": 0.0,
+    }
+    monkeypatch.setattr(code_checker, "SCHEDULER_STATE", state)
+    monkeypatch.setattr(code_checker, "SCHEDULER_STATS", dict.fromkeys(code_checker.SCHEDULER_STATS, 0))
+    monkeypatch.setattr(code_checker, "retry_delay", lambda error, attempt: 0)
+    return state
+
+def test_request_bucket_limits_calls_per_minute(scheduler):
+    for _ in range(2):
+        ticket = code_checker.enqueue_gemini_call(code_checker.PRIORITY_EVALUATION)
+        assert code_checker.try_acquire_gemini_slot(ticket, 100) == 0
+    ticket = code_checker.enqueue_gemini_call(code_checker.PRIORITY_EVALUATION)
+    # One request refills every 30 seconds at 2 per minute
+    assert code_checker.try_acquire_gemini_slot(ticket, 100) == pytest.approx(30, abs=0.5)
+
+def test_token_bucket_limits_large_prompts(scheduler):
+    ticket = code_checker.enqueue_gemini_call(code_checker.PRIORITY_EVALUATION)
+    assert code_checker.try_acquire_gemini_slot(ticket, 8000) == 0
+    ticket = code_checker.enqueue_gemini_call(code_checker.PRIORITY_EVALUATION)
+    # 6000 more tokens are needed at 10000 per minute
+    assert code_checker.try_acquire_gemini_slot(ticket, 8000) == pytest.approx(36, abs=0.5)
+
+def test_waiting_calls_are_served_by_priority(scheduler):
+    ocr = code_checker.enqueue_gemini_call(code_checker.PRIORITY_OCR)
+    evaluation = code_checker.enqueue_gemini_call(code_checker.PRIORITY_EVALUATION)
+    assert code_checker.try_acquire_gemini_slot(ocr, 100) > 0
+    assert code_checker.try_acquire_gemini_slot(evaluation, 100) == 0
+    assert code_checker.try_acquire_gemini_slot(ocr, 100) == 0
+
+def test_breaker_opens_after_repeated_failures(scheduler, monkeypatch):
+    monkeypatch.setattr(code_checker, "CIRCUIT_FAILURE_THRESHOLD", 3)
+    for _ in range(3):
+        code_checker.record_gemini_failure(ApiError(503))
+    ticket = code_checker.enqueue_gemini_call(code_checker.PRIORITY_EVALUATION)
+    with pytest.raises(code_checker.GeminiUnavailableError):
+        code_checker.try_acquire_gemini_slot(ticket, 100)
+    assert scheduler["queue"] == []
+
+def test_rate_limit_slows_down_without_tripping_the_breaker(scheduler, monkeypatch):
+    monkeypatch.setattr(code_checker, "CIRCUIT_FAILURE_THRESHOLD", 1)
+    code_checker.record_gemini_failure(ApiError(429))
+    assert scheduler["failures"] == 0
+    assert scheduler["open_until"] == 0.0
+    assert scheduler["requests"] <= 0
+
+def test_success_closes_the_breaker(scheduler):
+    scheduler["failures"] = 10
+    scheduler["open_until"] = time.monotonic() + 60
+    code_checker.record_gemini_success()
+    assert scheduler["failures"] == 0
+    assert scheduler["open_until"] == 0.0
+
+def test_retryable_errors_are_retried(scheduler, monkeypatch):
+    monkeypatch.setattr(code_checker, "GEMINI_REQUESTS_PER_MINUTE", 60)
+    scheduler["requests"] = 60.0
+    attempts = []
+    def request():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ApiError(503)
+        return "response"
+    assert code_checker.call_gemini(request, "prompt") == "response"
+    assert len(attempts) == 3
+    assert code_checker.SCHEDULER_STATS["retries"] == 2
+
+def test_other_errors_are_raised_at_once(scheduler):
+    attempts = []
+    def request():
+        attempts.append(1)
+        raise ApiError(400, "bad request")
+    with pytest.raises(ApiError):
+        code_checker.call_gemini(request, "prompt")
+    assert len(attempts) == 1
+
+def test_exhausted_retries_raise_unavailable(scheduler, monkeypatch):
+    monkeypatch.setattr(code_checker, "GEMINI_MAX_RETRIES", 1)
+    monkeypatch.setattr(code_checker, "CIRCUIT_FAILURE_THRESHOLD", 100)
+    def request():
+        raise ApiError(500)
+    with pytest.raises(code_checker.GeminiUnavailableError):
+        code_checker.call_gemini(request, "prompt")
+
+def test_server_suggested_delay_is_honoured():
+    delay = code_checker.retry_delay(ApiError(429, "Quota exceeded. {'retryDelay': '7s'}"), 0)
+    assert 7 <= delay <= 8
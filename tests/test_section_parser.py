@@ -0,0 +1,85 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "benchmarks"))
+import code_checker
+import bench_section_parser
+
+@pytest.mark.parametrize("line, section", [
+    ("Alm: To compute factorial", "aim"),
+    ("Algorlthm:", "algorithm"),
+    ("Pr0gram:", "program"),
+    ("Resu1t: ok", "result"),
+])
+def test_ocr_typos_in_headers_are_recognized(line, section):
+    assert code_checker.match_fuzzy_header(line)[0] == section
+
+@pytest.mark.parametrize("line", ["Mode: fast", "Node: 3", "Him: hello", "Mode:"])
+def test_ordinary_words_are_not_taken_for_short_headers(line):
+    assert code_checker.match_fuzzy_header(line) is None
+
+WELL_FORMED = [
+    bench_section_parser.make_submission(5),
+    "AIM:\nFind the largest of three numbers.\n\nALGORITHM:\n1. Read a, b, c\n2. Compare\n\n"
+    "PROGRAM:\na, b, c = 3, 9, 4\nprint(max(a, b, c))\n\nOUTPUT:\n9\n\nRESULT:\nThe largest number was printed.\n",
+    "aim: reverse a string\nalgorithm: slice it backwards\nprogram:\nprint('abc'[::-1])\n"
+    "output:\ncba\nresult: done\n",
+    "Aim.\nCount vowels\nAlgorithm.\nLoop over letters\nProgram.\nprint(sum(ch in 'aeiou' for ch in 'banana'))\n"
+    "Output.\n3\nResult.\nVowels counted\n",
+]
+
+@pytest.mark.parametrize("text", WELL_FORMED)
+def test_single_pass_parser_matches_the_legacy_regexes(text):
+    legacy = bench_section_parser.legacy_parse(text, bench_section_parser.INTENDED_PATTERNS)
+    assert bench_section_parser.single_pass_parse(text) == legacy
+
+def test_alias_headers_end_the_previous_section():
+    # The legacy lookaheads only knew some aliases, so 'Source Code:' did not end the algorithm there
+    text = "Objective: reverse a string\nProcedure: slice it\nSource Code:\nprint('abc'[::-1])\nExecution:\ncba\nConclusion: done\n"
+    assert bench_section_parser.single_pass_parse(text) == {
+        "aim": "reverse a string", "algorithm": "slice it", "program": "print('abc'[::-1])",
+        "output": "cba", "result": "done",
+    }
+
+def test_completed_sections_need_a_later_header():
+    partial = "Aim: add\nAlgorithm:\n1. add\nProgram:\nprint(1"
+    assert code_checker.find_completed_sections(partial) == {"aim": "add", "algorithm": "1. add"}
+
+def test_offline_recognizer_finds_sections_without_headers():
+    text = (
+        "To write a program that adds two numbers.\n\n"
+        "1. Start\n2. Read the numbers\n3. Print the sum\n4. Stop\n\n"
+        "a = int(input())\nb = int(input())\nprint(a + b)\n\n"
+        "The program was executed successfully.\n"
+    )
+    sections, evidence = code_checker.recognize_sections_offline(text)
+    assert sections["program"] == "a = int(input())\nb = int(input())\nprint(a + b)"
+    assert "adds two numbers" in sections["aim"]
+    assert "Read the numbers" in sections["algorithm"]
+    assert evidence["program"] > 0
+
+def test_offline_recognizer_reads_garbled_headers():
+    text = (
+        "Alm: To compute a factorial\n"
+        "Algorlthm:\n1. Multiply 1..n\n"
+        "Pr0gram:\nn = 5\nresult = 1\nfor i in range(2, n + 1):\n    result = result * i\nprint(result)\n"
+        "0utput:\n120\n"
+        "Resu1t: Factorial computed\n"
+    )
+    sections, _ = code_checker.recognize_sections_offline(text)
+    assert sections["aim"] == "To compute a factorial"
+    assert sections["algorithm"] == "1. Multiply 1..n"
+    assert sections["program"].startswith("n = 5")
+    assert sections["output"] == "120"
+    assert sections["result"] == "Factorial computed"
+
+def test_parser_falls_back_to_the_recognizer_when_headers_are_missing(monkeypatch):
+    monkeypatch.setattr(code_checker, "GENAI_AVAILABLE", False)
+    text = "Alm: add two numbers\nAlgorlthm:\n1. add\nPr0gram:\nprint(1 + 2)\nOutput:\n3\n"
+    sections, confidence = code_checker.parse_submission_sections_with_confidence(text)
+    assert sections["aim"] == "add two numbers"
+    assert sections["program"] == "print(1 + 2)"
+    assert 0 < confidence <= 1
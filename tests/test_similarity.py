@@ -0,0 +1,53 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import code_checker
+
+ORIGINAL = """
+def factorial(n):
+    result = 1
+    for i in range(2, n + 1):
+        result = result * i
+    return result
+
+number = int(input("Enter a number: "))
+if number < 0:
+    print("Factorial is not defined for negative numbers")
+else:
+    print("Factorial of", number, "is", factorial(number))
+"""
+RENAMED = ORIGINAL.replace("result", "answer").replace("number", "value")
+UNRELATED = """
+def is_palindrome(text):
+    cleaned = "".join(ch.lower() for ch in text if ch.isalnum())
+    return cleaned == cleaned[::-1]
+
+words = input("Words: ").split()
+for word in words:
+    print(word, "is" if is_palindrome(word) else "is not", "a palindrome")
+"""
+
+def graded(student_id, program, duplicates=()):
+    return {"student": student_id, "sections": {"program": program}, "duplicates": list(duplicates)}
+
+def test_renamed_copy_is_clustered():
+    clusters = code_checker.find_similar_submissions([graded("a", ORIGINAL), graded("b", RENAMED), graded("c", UNRELATED)])
+    assert [cluster["members"] for cluster in clusters] == [["a", "b"]]
+
+def test_identical_group_alone_forms_no_cluster():
+    results = [graded("a", ORIGINAL, ["a2"]), graded("a2", ORIGINAL, ["a"]), graded("c", UNRELATED)]
+    assert code_checker.find_similar_submissions(results) == []
+
+def test_cluster_lists_every_member_of_an_identical_group():
+    results = [graded("a", ORIGINAL, ["a2"]), graded("a2", ORIGINAL, ["a"]), graded("b", RENAMED), graded("c", UNRELATED)]
+    clusters = code_checker.find_similar_submissions(results)
+    assert [cluster["members"] for cluster in clusters] == [["a", "a2", "b"]]
+
+def test_copies_do_not_make_their_own_fingerprints_common():
+    copies = [f"a{i}" for i in range(6)]
+    results = [graded(student_id, ORIGINAL, [other for other in copies if other != student_id]) for student_id in copies]
+    results.append(graded("b", RENAMED))
+    results.extend(graded(f"c{i}", UNRELATED + f"\nprint('variant {i}')\n") for i in range(4))
+    clusters = code_checker.find_similar_submissions(results)
+    assert any("b" in cluster["members"] and "a0" in cluster["members"] for cluster in clusters)
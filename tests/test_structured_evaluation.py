@@ -0,0 +1,57 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import code_checker
+
+SECTIONS = {
+    "aim": "Add two numbers",
+    "algorithm": "1. Read a and b\n2. Print a + b",
+    "program": "print(2 + 3)",
+    "output": "CLAIMED-OUTPUT-5",
+    "result": "The sum was printed",
+}
+
+def rated(score):
+    return {"score": score, "explanation": "fine", "related": True}
+
+def response(include_output):
+    data = {
+        "aim": rated(8), "algorithm": rated(8), "result": rated(8),
+        "program": {"correctness": 9, "efficiency": 8, "code_quality": 7, "strengths": "short", "weaknesses": "none"},
+        "mistakes": [],
+    }
+    if include_output:
+        data["output"] = {"correctness": 2, "presentation": 2, "explanation": "wrong"}
+    return data
+
+def test_prompt_and_schema_leave_out_a_verified_output():
+    prompt = code_checker.build_structured_evaluation_prompt(SECTIONS, "add", include_output=False)
+    assert "CLAIMED-OUTPUT-5" not in prompt
+    assert "output.correctness" not in prompt
+    assert "output" not in code_checker.evaluation_schema(False)["required"]
+    assert "CLAIMED-OUTPUT-5" in code_checker.build_structured_evaluation_prompt(SECTIONS, "add")
+
+def test_structured_evaluation_threads_include_output(monkeypatch):
+    requests = []
+    def fake_generate_json(prompt, schema):
+        requests.append((prompt, schema))
+        return response("output" in schema["required"])
+    monkeypatch.setattr(code_checker, "generate_json", fake_generate_json)
+    evaluation, scores = code_checker.evaluate_submission_structured(SECTIONS, "add", include_output=False)
+    prompt, schema = requests[0]
+    assert "CLAIMED-OUTPUT-5" not in prompt
+    assert schema is code_checker.EVALUATION_SCHEMA_WITHOUT_OUTPUT
+    assert "OUTPUT CORRECTNESS" not in evaluation
+    # Output marks stay at the neutral default until the verified output overrides them
+    assert scores["output"]["score"] == 7.5
+
+def test_invalid_structured_response_falls_back_with_include_output(monkeypatch):
+    def broken_generate_json(prompt, schema):
+        raise ValueError("not json")
+    chained = []
+    monkeypatch.setattr(code_checker, "generate_json", broken_generate_json)
+    monkeypatch.setattr(code_checker, "evaluate_submission_chained",
+                        lambda sections, problem_text, include_output=True: chained.append(include_output) or ("", {}))
+    code_checker.evaluate_submission_structured(SECTIONS, "add", include_output=False)
+    assert chained == [False]
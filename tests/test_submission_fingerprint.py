@@ -0,0 +1,30 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import code_checker
+
+INDENTED_LOOP = "total = 0\nfor i in range(1, 4):\n    total = total + i\n    print(total)\n"
+DEDENTED_PRINT = "total = 0\nfor i in range(1, 4):\n    total = total + i\nprint(total)\n"
+
+def write(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_bytes(text.encode("utf-8"))
+    return path
+
+def test_indentation_only_variants_are_not_grouped(tmp_path):
+    first = write(tmp_path, "a.txt", INDENTED_LOOP)
+    second = write(tmp_path, "b.txt", DEDENTED_PRINT)
+    groups = code_checker.group_identical_submissions([("a", first), ("b", second)])
+    assert len(groups) == 2
+
+def test_spaces_inside_strings_are_significant(tmp_path):
+    first = write(tmp_path, "a.txt", 'print("a b")\n')
+    second = write(tmp_path, "b.txt", 'print("ab")\n')
+    assert code_checker.submission_fingerprint(first) != code_checker.submission_fingerprint(second)
+
+def test_line_endings_trailing_spaces_and_blank_lines_are_ignored(tmp_path):
+    first = write(tmp_path, "a.txt", INDENTED_LOOP)
+    second = write(tmp_path, "b.txt", INDENTED_LOOP.replace("\n", "  \r\n\r\n"))
+    groups = code_checker.group_identical_submissions([("a", first), ("b", second)])
+    assert groups == [[("a", first), ("b", second)]]